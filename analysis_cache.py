@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from typing import Any, Callable, Dict, List, Union
+
+# Cambiar este valor invalida todas las entradas existentes (p. ej. si cambia el formato)
+CACHE_VERSION = "2"
+# Tamaño máximo por defecto del directorio de caché (bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Índice de firmas (tamaño, mtime) -> hash de contenido, para no rehashear archivos intactos
+DIGEST_INDEX_FILE = "digests.json"
+ENTRY_SUFFIX = ".pkl"
+# Bytes finales ya hasheados que se comparan para saber si un archivo solo creció
+APPEND_PROBE_BYTES = 64 * 1024
+# Directorio de los módulos del proyecto (su conjunto identifica la versión del código)
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_PROJECT_SIGNATURE = None
+# Resultado de _read_entry cuando la entrada no existe o está dañada (None es un resultado válido)
+MISS = object()
+
+class AnalysisCache:
+    """
+    Caché en disco de los resultados del pipeline (carga, preprocesamiento y análisis).
+
+    Cada resultado se guarda bajo una clave derivada de la huella de los archivos
+    de datos (tamaño, mtime y hash del contenido), del nombre de la etapa y de la
+    versión del código: tamaño y mtime de todos los módulos del proyecto, porque
+    una etapa depende también de lo que importa (p. ej. preprocessor o
+    trade_record desde analyzer). Si un archivo de datos solo creció, se hashea
+    únicamente la parte agregada. El directorio se acota a max_bytes expulsando
+    las entradas usadas menos recientemente.
+    """
+    def __init__(self, cache_dir: str, data_files: Union[List[str], Callable[[], List[str]]],
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        # Una función si el conjunto de archivos cambia con el tiempo (p. ej. particiones nuevas)
+        self.data_files = data_files if callable(data_files) else list(data_files)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        # id(resultado) -> (huella de datos con la que se produjo, resultado, etiqueta de origen)
+        self._derived: Dict[int, Any] = {}
+        self._last_fingerprint = None
+        # La app consulta la caché desde el hilo de Tk y desde el hilo de análisis
+        self._lock = threading.RLock()
+        self._digest_index = self._load_digest_index()
+
+    # --- Huella de los Datos ---
+
+    def _load_digest_index(self) -> Dict[str, Any]:
+        path = os.path.join(self.cache_dir, DIGEST_INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    def _save_digest_index(self):
+        self._write_atomic(os.path.join(self.cache_dir, DIGEST_INDEX_FILE),
+                           json.dumps(self._digest_index).encode('utf-8'))
+
+    @staticmethod
+    def _probe(f, size: int) -> str:
+        """Hash de los últimos APPEND_PROBE_BYTES antes del byte `size`."""
+        f.seek(max(size - APPEND_PROBE_BYTES, 0))
+        return hashlib.blake2b(f.read(size - f.tell()), digest_size=16).hexdigest()
+
+    def _file_digest(self, filepath: str) -> str:
+        """
+        Hash del contenido de un archivo; solo se recalcula si cambió su tamaño o
+        mtime. Si el archivo solo creció (p. ej. un trade agregado al journal), el
+        hash nuevo encadena el anterior con los bytes agregados, sin releer el resto.
+        """
+        if not os.path.exists(filepath):
+            return "ausente"
+        stat = os.stat(filepath)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = self._digest_index.get(filepath)
+        if known is not None and known['firma'] == signature:
+            return known['hash']
+
+        with open(filepath, 'rb') as f:
+            previous_size = known['firma'][0] if known is not None else None
+            if (previous_size is not None and 0 < previous_size < stat.st_size
+                    and known.get('sonda') == self._probe(f, previous_size)):
+                digest = hashlib.blake2b(known['hash'].encode('utf-8'), digest_size=16)
+                f.seek(previous_size)
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                f.seek(0)
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+            probe = self._probe(f, stat.st_size)
+        self._digest_index[filepath] = {'firma': signature, 'hash': digest.hexdigest(), 'sonda': probe}
+        self._save_digest_index()
+        return digest.hexdigest()
+
+    def data_fingerprint(self) -> str:
+        """Huella combinada de todos los archivos de datos."""
+        fingerprint = hashlib.blake2b(CACHE_VERSION.encode('utf-8'), digest_size=16)
+        data_files = self.data_files() if callable(self.data_files) else self.data_files
+        for filepath in data_files:
+            fingerprint.update(filepath.encode('utf-8'))
+            fingerprint.update(self._file_digest(filepath).encode('utf-8'))
+        return fingerprint.hexdigest()
+
+    @staticmethod
+    def _project_signature() -> str:
+        """Tamaño y mtime de todos los módulos del proyecto (se calcula una vez por proceso)."""
+        global _PROJECT_SIGNATURE
+        if _PROJECT_SIGNATURE is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for name in sorted(os.listdir(PROJECT_DIR)):
+                if name.endswith(".py"):
+                    stat = os.stat(os.path.join(PROJECT_DIR, name))
+                    digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+            _PROJECT_SIGNATURE = digest.hexdigest()
+        return _PROJECT_SIGNATURE
+
+    @classmethod
+    def _code_signature(cls, func: Callable) -> str:
+        """Identifica la etapa y la versión del código del proyecto."""
+        func = inspect.unwrap(func)
+        name = f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', type(func).__name__)}"
+        return f"{name}:{cls._project_signature()}"
+
+    # --- Entradas ---
+
+    def _entry_path(self, stage: str, fingerprint: str, code: str) -> str:
+        key = hashlib.blake2b(f"{stage}|{fingerprint}|{code}".encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f"{stage}-{key}{ENTRY_SUFFIX}")
+
+    def _write_atomic(self, path: str, payload: bytes):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _read_entry(self, path: str) -> Any:
+        """Lee una entrada; retorna MISS si no existe o está dañada."""
+        if not os.path.exists(path):
+            return MISS
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            os.remove(path)
+            return MISS
+        # Marca de uso reciente para la política de expulsión (LRU por mtime)
+        os.utime(path)
+        return value
+
+    def _evict(self):
+        """Expulsa las entradas menos usadas hasta quedar por debajo de max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_SUFFIX):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+            self.evictions += 1
+
+    def _argument_labels(self, args: tuple, kwargs: Dict[str, Any], fingerprint: str) -> List[str]:
+        """
+        Etiquetas de origen de los argumentos, o None si alguno no proviene de la
+        caché para los datos actuales (p. ej. un DataFrame extendido en memoria).
+        """
+        labels = []
+        for arg in list(args) + list(kwargs.values()):
+            derived = self._derived.get(id(arg))
+            if derived is None or derived[1] is not arg or derived[0] != fingerprint:
+                return None
+            labels.append(derived[2])
+        return labels
+
+    def _current_fingerprint(self) -> str:
+        """Huella actual; si cambió, olvida los resultados derivados de los datos anteriores."""
+        fingerprint = self.data_fingerprint()
+        if fingerprint != self._last_fingerprint:
+            # Los resultados derivados de datos anteriores ya no sirven como clave
+            self._derived.clear()
+            self._last_fingerprint = fingerprint
+        return fingerprint
+
+    def get_or_compute(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """Retorna el resultado de la etapa para los datos actuales, calculándolo si no está en caché."""
+        with self._lock:
+            fingerprint = self._current_fingerprint()
+            labels = self._argument_labels(args, kwargs, fingerprint)
+            if labels is None:
+                self.bypasses += 1
+                path = None
+            else:
+                code = self._code_signature(func) + "|" + ",".join(labels)
+                path = self._entry_path(stage, fingerprint, code)
+                value = self._read_entry(path)
+                if value is not MISS:
+                    self.hits += 1
+                    self._register(value, fingerprint, stage)
+                    return value
+                self.misses += 1
+
+        # El cálculo se hace fuera del candado para no bloquear a otros hilos
+        value = func(*args, **kwargs)
+        if path is None:
+            return value
+        with self._lock:
+            self._write_atomic(path, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            self._evict()
+            if fingerprint == self._last_fingerprint:
+                self._register(value, fingerprint, stage)
+        return value
+
+    def _register(self, value: Any, fingerprint: str, label: str):
+        """Recuerda un resultado (y los valores de un dict, p. ej. raw_data['trades']) como derivado de los datos."""
+        self._derived[id(value)] = (fingerprint, value, label)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                self._derived[id(item)] = (fingerprint, item, f"{label}[{key}]")
+
+    def cached(self, stage: str, func: Callable) -> Callable:
+        """Envuelve una función del pipeline para que use la caché."""
+        def wrapper(*args, **kwargs):
+            return self.get_or_compute(stage, func, *args, **kwargs)
+        wrapper.__name__ = getattr(func, '__name__', stage)
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def tracked(self, stage: str, func: Callable) -> Callable:
+        """
+        Envuelve una función cuyo resultado no se guarda en la caché (p. ej. un
+        DataFrame respaldado por memmap) pero sí sirve como argumento de etapas
+        cacheadas, porque proviene de los datos actuales.
+        """
+        def wrapper(*args, **kwargs):
+            value = func(*args, **kwargs)
+            with self._lock:
+                # La huella se toma después: la función pudo haber compactado el journal
+                self._register(value, self._current_fingerprint(), stage)
+            return value
+        wrapper.__name__ = getattr(func, '__name__', stage)
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def clear(self):
+        """Elimina todas las entradas de la caché."""
+        if not os.path.exists(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_SUFFIX):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos, fallos, llamadas sin caché y expulsiones."""
+        size = 0
+        if os.path.exists(self.cache_dir):
+            size = sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                       for name in os.listdir(self.cache_dir) if name.endswith(ENTRY_SUFFIX))
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypasses': self.bypasses,
+            'evictions': self.evictions,
+            'bytes': size,
+        }
@@ -1,6 +1,29 @@
 # -*- coding: utf-8 -*-
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Iterable, List, Any
+
+import preprocessor as pp
+
+# Filas por bloque en los productos matriciales de analyze_confirmations
+CONFIRMATION_BLOCK_ROWS = 65536
+# Nivel de confianza por defecto de los intervalos bootstrap
+SIGNIFICANCE_CONFIDENCE = 0.95
+# Semilla por defecto: los intervalos son reproducibles (y se pueden cachear)
+SIGNIFICANCE_SEED = 0
+# Con menos trades el bootstrap no estima la dispersión (p. ej. un solo trade da
+# un intervalo de ancho cero): la confirmación queda sin intervalo
+BOOTSTRAP_MIN_TRADES = 10
+# Hasta este número de trades el bootstrap remuestrea los trades directamente
+BOOTSTRAP_EXACT_ROWS = 1000
+# Por encima, los trades de cada signo se resumen en este número de átomos (cuantiles)
+BOOTSTRAP_ATOMS = 64
+# Elementos máximos por operación de remuestreo (remuestreos x trades o átomos)
+BOOTSTRAP_BLOCK_ELEMENTS = 2**22
 
 def calculate_key_metrics(df_trades: pd.DataFrame) -> Dict[str, Any]:
     """
@@ -35,70 +58,517 @@ def calculate_key_metrics(df_trades: pd.DataFrame) -> Dict[str, Any]:
     metrics['mejora_mas_repetitiva'] = df_trades['mejorar'].mode().iloc[0] if not df_trades['mejorar'].empty else "N/A"
     
     # 4. Rendimiento por Tipo de Entrada
-    metrics['rendimiento_por_tipo_entrada'] = df_trades.groupby('tipo entrada')['ganancia/perdida'].agg(['mean', 'count']).reset_index().to_dict('records')
+    metrics['rendimiento_por_tipo_entrada'] = df_trades.groupby('tipo entrada', observed=True)['ganancia/perdida'].agg(['mean', 'count']).reset_index().to_dict('records')
 
     # Lógica a incluir en data_analyzer.py (si no existe aún)
-    df_grouped_asset = df_trades.groupby('activo')['ganancia/perdida'].agg(['mean', 'count']).reset_index()
+    df_grouped_asset = df_trades.groupby('activo', observed=True)['ganancia/perdida'].agg(['mean', 'count']).reset_index()
     metrics['rendimiento_por_activo'] = df_grouped_asset.to_dict('records')
 
     
     return metrics
 
-def analyze_confirmations(df_trades: pd.DataFrame) -> Dict[str, Any]:
+class MetricsAccumulator:
+    """
+    Acumulador incremental de las métricas de calculate_key_metrics.
+
+    Mantiene sumas, conteos y contadores de frecuencia (global, por activo y por
+    tipo de entrada). Se inicializa una vez con el historial y luego cada trade
+    nuevo se incorpora en O(1), sin volver a recorrer el DataFrame completo.
+    """
+    def __init__(self, df_trades: pd.DataFrame = None):
+        self.total_trades = 0
+        self.pnl_sum = 0.0
+        self.winners_count = 0
+        self.winners_sum = 0.0
+        self.losers_count = 0
+        self.losers_sum = 0.0
+        self.activo_counts = Counter()
+        self.mejorar_counts = Counter()
+        # Por grupo: [suma de ganancia/perdida, conteo]
+        self.by_entry_type = {}
+        self.by_asset = {}
+        if df_trades is not None and not df_trades.empty:
+            self._seed(df_trades)
+
+    def _seed(self, df_trades: pd.DataFrame):
+        """Carga el historial existente con operaciones vectorizadas."""
+        pnl = df_trades['ganancia/perdida']
+        winners = pnl[pnl > 0]
+        losers = pnl[pnl < 0]
+        self.total_trades = len(df_trades)
+        self.pnl_sum = float(pnl.sum())
+        self.winners_count, self.winners_sum = len(winners), float(winners.sum())
+        self.losers_count, self.losers_sum = len(losers), float(losers.sum())
+        for column, counts in (('activo', self.activo_counts), ('mejorar', self.mejorar_counts)):
+            value_counts = df_trades[column].value_counts()
+            # En columnas 'category' (forma compacta) value_counts incluye las categorías sin trades
+            counts.update(value_counts[value_counts > 0].to_dict())
+        for column, groups in (('tipo entrada', self.by_entry_type), ('activo', self.by_asset)):
+            grouped = df_trades.groupby(column, observed=True)['ganancia/perdida'].agg(['sum', 'count'])
+            for key, (group_sum, group_count) in zip(grouped.index, grouped.to_numpy()):
+                groups[key] = [float(group_sum), int(group_count)]
+
+    def update(self, df_new: pd.DataFrame):
+        """Incorpora trades nuevos ya preprocesados (p. ej. la cola de df_trades)."""
+        columns = ['activo', 'mejorar', 'tipo entrada', 'ganancia/perdida']
+        for activo, mejorar, tipo_entrada, pnl in df_new.reindex(columns=columns).itertuples(index=False):
+            self.add_trade(activo, mejorar, tipo_entrada, pnl)
+
+    def add_trade(self, activo: Any, mejorar: Any, tipo_entrada: Any, pnl: float):
+        """Incorpora un trade en O(1)."""
+        pnl = float(pnl)
+        self.total_trades += 1
+        self.pnl_sum += pnl
+        if pnl > 0:
+            self.winners_count += 1
+            self.winners_sum += pnl
+        elif pnl < 0:
+            self.losers_count += 1
+            self.losers_sum += pnl
+        # Igual que value_counts/groupby, los valores nulos no se cuentan
+        if not pd.isna(activo):
+            self.activo_counts[activo] += 1
+            self.by_asset.setdefault(activo, [0.0, 0])
+            self.by_asset[activo][0] += pnl
+            self.by_asset[activo][1] += 1
+        if not pd.isna(mejorar):
+            self.mejorar_counts[mejorar] += 1
+        if not pd.isna(tipo_entrada):
+            self.by_entry_type.setdefault(tipo_entrada, [0.0, 0])
+            self.by_entry_type[tipo_entrada][0] += pnl
+            self.by_entry_type[tipo_entrada][1] += 1
+
+    def merge(self, other: 'MetricsAccumulator'):
+        """Suma en este acumulador el de otro historial (p. ej. otra cuenta)."""
+        self.total_trades += other.total_trades
+        self.pnl_sum += other.pnl_sum
+        self.winners_count += other.winners_count
+        self.winners_sum += other.winners_sum
+        self.losers_count += other.losers_count
+        self.losers_sum += other.losers_sum
+        self.activo_counts.update(other.activo_counts)
+        self.mejorar_counts.update(other.mejorar_counts)
+        for groups, other_groups in ((self.by_entry_type, other.by_entry_type), (self.by_asset, other.by_asset)):
+            for key, (group_sum, group_count) in other_groups.items():
+                groups.setdefault(key, [0.0, 0])
+                groups[key][0] += group_sum
+                groups[key][1] += group_count
+
+    @staticmethod
+    def _sorted(values: Iterable[Any]) -> List[Any]:
+        """
+        Valores ordenados como en pandas. Si mezclan tipos que no se comparan
+        (p. ej. texto y números en un campo libre del journal), por su texto.
+        """
+        values = list(values)
+        try:
+            return sorted(values)
+        except TypeError:
+            return sorted(values, key=str)
+
+    @staticmethod
+    def _mode(counts: Counter) -> Any:
+        """Valor más frecuente; ante empates, el menor (como Series.mode().iloc[0])."""
+        if not counts:
+            return "N/A"
+        top = max(counts.values())
+        return MetricsAccumulator._sorted(value for value, count in counts.items() if count == top)[0]
+
+    @staticmethod
+    def _group_records(groups: Dict[Any, List[float]], column: str) -> List[Dict[str, Any]]:
+        """Registros {column, mean, count} ordenados por clave, como groupby().agg()."""
+        return [
+            {column: key, 'mean': groups[key][0] / groups[key][1], 'count': groups[key][1]}
+            for key in MetricsAccumulator._sorted(groups)
+        ]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Retorna el mismo diccionario que calculate_key_metrics."""
+        if self.total_trades == 0:
+            return {"Error": "El DataFrame está vacío. No se pueden calcular métricas."}
+
+        return {
+            'ganancia_promedio_total': self.winners_sum / self.winners_count if self.winners_count else 0,
+            'perdida_promedio_total': self.losers_sum / self.losers_count if self.losers_count else 0,
+            'rentabilidad_neta_total': self.pnl_sum,
+            'tasa_de_exito': self.winners_count / self.total_trades,
+            'activo_mas_operado': self._mode(self.activo_counts),
+            'mejora_mas_repetitiva': self._mode(self.mejorar_counts),
+            'rendimiento_por_tipo_entrada': self._group_records(self.by_entry_type, 'tipo entrada'),
+            'rendimiento_por_activo': self._group_records(self.by_asset, 'activo'),
+        }
+
+def _confirmation_matrix(df_trades: pd.DataFrame, conf_cols: List[str]) -> np.ndarray:
+    """
+    Retorna las columnas de confirmación como una matriz booleana (trades x confirmaciones).
+
+    Solo cuenta como activa una confirmación igual a True, igual que el filtro
+    `df[col] == True`; los nulos de columnas no booleanas quedan en False.
+    """
+    if all(pd.api.types.is_bool_dtype(df_trades[col].dtype) for col in conf_cols):
+        return df_trades[conf_cols].to_numpy(dtype=bool)
+    return (df_trades[conf_cols] == True).to_numpy(dtype=bool)
+
+def confirmation_totals(df_trades: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Totales por confirmación: [trades, ganadores, perdedores, suma de ganancia/pérdida].
+
+    Todas las confirmaciones se evalúan a la vez: la matriz booleana de
+    confirmaciones se multiplica por los vectores de ganadores, perdedores y
+    ganancia/pérdida, por bloques de filas para acotar la memoria. En la forma
+    compacta (ver preprocessor.compact_trades) cada bloque se desempaqueta de
+    las palabras uint64 al vuelo. Los totales de varios historiales se pueden
+    sumar (ver merge_confirmation_totals).
+    """
+    packed = pp.packed_confirmations(df_trades)
+    if packed is not None:
+        conf_names, words = packed
+        block_matrix = lambda start, stop: pp.unpack_confirmations(words[start:stop], len(conf_names))
+    else:
+        # Obtener solo las columnas que representan confirmaciones
+        conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
+        conf_names = [col.replace('conf_', '') for col in conf_cols]
+        conf_matrix = _confirmation_matrix(df_trades, conf_cols) if conf_cols else None
+        block_matrix = lambda start, stop: conf_matrix[start:stop]
+    if not conf_names:
+        return {}
+
+    pnl = df_trades['ganancia/perdida'].to_numpy(dtype=float)
+    totals = np.zeros((len(conf_names), 4))
+    for start in range(0, len(pnl), CONFIRMATION_BLOCK_ROWS):
+        stop = start + CONFIRMATION_BLOCK_ROWS
+        block_pnl = pnl[start:stop]
+        vectors = np.column_stack([np.ones_like(block_pnl), block_pnl > 0, block_pnl < 0, block_pnl])
+        totals += block_matrix(start, stop).T.astype(float) @ vectors
+    return dict(zip(conf_names, totals))
+
+def merge_confirmation_totals(totals_list: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Suma los totales por confirmación de varios historiales (en orden de primera aparición)."""
+    merged = {}
+    for totals in totals_list:
+        for conf_name, row in totals.items():
+            merged[conf_name] = merged[conf_name] + row if conf_name in merged else row.copy()
+    return merged
+
+def confirmation_stats(totals: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    """Asertividad, ineficiencia y rentabilidad promedio a partir de los totales por confirmación."""
+    conf_results = {}
+    for conf_name, (total, wins, losses, pnl_sum) in totals.items():
+        total_conf_trades = int(total)
+
+        if total_conf_trades == 0:
+            conf_results[conf_name] = {'total': 0, 'asertividad': 0, 'ineficiencia': 0, 'rentabilidad_promedio': 0}
+            continue
+
+        conf_results[conf_name] = {
+            'total': total_conf_trades,
+            'asertividad': round(float(wins) / total_conf_trades * 100, 2), # En porcentaje
+            'ineficiencia': round(float(losses) / total_conf_trades * 100, 2), # En porcentaje
+            'rentabilidad_promedio': pnl_sum / total_conf_trades
+        }
+    return conf_results
+
+def analyze_confirmations(df_trades: pd.DataFrame, resamples: int = 0, permutations: int = 0,
+                          confidence: float = SIGNIFICANCE_CONFIDENCE, processes: int = None) -> Dict[str, Any]:
     """
     Calcula la asertividad y la ineficiencia de cada confirmación.
     
     Args:
         df_trades: DataFrame de trades preprocesado.
+        resamples: Si es > 0 (modo de significancia), agrega intervalos de confianza
+            bootstrap con ese número de remuestreos (ver confirmation_significance)
+            y el ranking usa sus extremos en lugar del promedio.
+        permutations: Si es > 0, agrega el p-valor de una prueba de permutaciones.
+        confidence: Nivel de confianza de los intervalos.
+        processes: Procesos del pool para el remuestreo (None: todos los núcleos).
         
     Returns:
         Dict[str, Any]: Resultados del análisis por confirmación.
     """
-    conf_results = {}
-    
-    # Obtener solo las columnas que representan confirmaciones
-    conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
-    
-    for col in conf_cols:
-        conf_name = col.replace('conf_', '')
-        
-        # Trades donde esta confirmación fue TRUE
-        trades_con_conf = df_trades[df_trades[col] == True]
-        
-        if trades_con_conf.empty:
-            conf_results[conf_name] = {'total': 0, 'asertividad': 0, 'ineficiencia': 0, 'rentabilidad_promedio': 0}
-            continue
+    conf_results = confirmation_stats(confirmation_totals(df_trades))
+    if resamples > 0 or permutations > 0:
+        significance = confirmation_significance(df_trades, resamples, permutations, confidence, processes=processes)
+        keys = (['asertividad_ic', 'rentabilidad_ic'] if resamples > 0 else []) + (['p_valor'] if permutations > 0 else [])
+        for conf_name, stats in conf_results.items():
+            computed = significance.get(conf_name, {})
+            stats.update({key: computed.get(key) for key in keys})
+    return rank_confirmations(conf_results)
 
-        total_conf_trades = len(trades_con_conf)
-        winners_conf = trades_con_conf[trades_con_conf['ganancia/perdida'] > 0]
-        losers_conf = trades_con_conf[trades_con_conf['ganancia/perdida'] < 0]
+def rank_confirmations(conf_results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Arma el resultado de analyze_confirmations a partir de las estadísticas por
+    confirmación: el análisis completo y las 3 mejores y 3 peores por rentabilidad.
 
-        # Asertividad (Tasa de éxito)
-        asertividad = len(winners_conf) / total_conf_trades
-        
-        # Ineficiencia (Tasa de pérdida)
-        ineficiencia = len(losers_conf) / total_conf_trades
-        
-        conf_results[conf_name] = {
-            'total': total_conf_trades,
-            'asertividad': round(asertividad * 100, 2), # En porcentaje
-            'ineficiencia': round(ineficiencia * 100, 2), # En porcentaje
-            'rentabilidad_promedio': trades_con_conf['ganancia/perdida'].mean()
-        }
+    Con intervalos de confianza ('rentabilidad_ic') el ranking es conservador:
+    las mejores por el extremo inferior y las peores por el superior, así una
+    confirmación con pocos trades no encabeza la lista por suerte. Las que no
+    tienen intervalo (muy pocos trades) no entran en ninguna de las dos listas.
+    """
+    def bound(stats: Dict[str, Any], side: int) -> float:
+        interval = stats.get('rentabilidad_ic')
+        return interval[side] if interval is not None else stats['rentabilidad_promedio']
 
-    # Ordenar por rentabilidad promedio para ver las mejores/peores
+    ranked = [item for item in conf_results.items()
+              if 'rentabilidad_ic' not in item[1] or item[1]['rentabilidad_ic'] is not None]
+    # Ordenar por rentabilidad promedio (o por el extremo del intervalo) para ver las mejores/peores
     sorted_results = sorted(
-        conf_results.items(), 
-        key=lambda item: item[1]['rentabilidad_promedio'], 
+        ranked, 
+        key=lambda item: bound(item[1], 0),
         reverse=True
     )
+    sorted_worst = sorted(ranked, key=lambda item: bound(item[1], 1), reverse=True)
     
     # Extraer las 3 mejores y 3 peores
     top_3_assertive = sorted_results[:3]
-    bottom_3_inefficient = sorted_results[-3:]
+    bottom_3_inefficient = sorted_worst[-3:]
     
     return {
         'analisis_completo': conf_results,
         'top_3_confirmaciones_rentables': top_3_assertive,
         'bottom_3_confirmaciones_ineficientes': bottom_3_inefficient
-    }
\ No newline at end of file
+    }
+# --- Combinaciones de Confirmaciones ---
+
+# Tamaño máximo por defecto de las combinaciones (pares y tríos)
+COMBINATION_MAX_SIZE = 3
+# Soporte mínimo por defecto: fracción de los trades en que aparece la combinación
+COMBINATION_MIN_SUPPORT = 0.01
+
+def _confirmation_names_and_matrix(df_trades: pd.DataFrame):
+    """Nombres de las confirmaciones y matriz booleana completa (trades x confirmaciones), en cualquiera de las dos formas."""
+    packed = pp.packed_confirmations(df_trades)
+    if packed is not None:
+        conf_names, words = packed
+        return list(conf_names), pp.unpack_confirmations(words, len(conf_names))
+    conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
+    matrix = _confirmation_matrix(df_trades, conf_cols) if conf_cols else np.zeros((len(df_trades), 0), dtype=bool)
+    return [col.replace('conf_', '') for col in conf_cols], matrix
+
+def _combination_record(names: tuple, total: float, wins: float, losses: float, pnl_sum: float, n_trades: int) -> Dict[str, Any]:
+    total = int(total)
+    return {
+        'confirmaciones': list(names),
+        'total': total,
+        'soporte': total / n_trades,
+        'asertividad': round(float(wins) / total * 100, 2), # En porcentaje
+        'ineficiencia': round(float(losses) / total * 100, 2), # En porcentaje
+        'rentabilidad_promedio': pnl_sum / total,
+    }
+
+def _pair_totals(matrix: np.ndarray, pnl: np.ndarray, prefix: tuple, items: List[int]) -> np.ndarray:
+    """
+    Totales de todas las extensiones prefix + (a, b) con a, b en items, con productos
+    Gram por bloques sobre los trades que tienen todo el prefijo:
+    resultado[:, a, b] = [trades, ganadores, perdedores, suma de ganancia/pérdida].
+
+    Los conteos se calculan en float32 (exactos: cada bloque tiene menos de 2**24
+    filas) y los de ganadores solo sobre las filas ganadoras; los perdedores se
+    obtienen por diferencia. Solo la suma de ganancia/pérdida usa float64.
+    """
+    rows = np.flatnonzero(matrix[:, list(prefix)].all(axis=1)) if prefix else None
+    n_rows = len(matrix) if rows is None else len(rows)
+    totals = np.zeros((4, len(items), len(items)))
+    for start in range(0, n_rows, CONFIRMATION_BLOCK_ROWS):
+        stop = start + CONFIRMATION_BLOCK_ROWS
+        if rows is None:
+            block, block_pnl = matrix[start:stop, items], pnl[start:stop]
+        else:
+            block_rows = rows[start:stop]
+            block, block_pnl = matrix[np.ix_(block_rows, items)], pnl[block_rows]
+        counts = block.astype(np.float32)
+        winners = counts[block_pnl > 0]
+        flat = counts[block_pnl == 0]
+        totals[0] += counts.T @ counts
+        totals[1] += winners.T @ winners
+        totals[2] -= flat.T @ flat
+        with_pnl = block.astype(float)
+        totals[3] += with_pnl.T @ (with_pnl * block_pnl[:, None])
+    # Perdedores = total - ganadores - trades en cero
+    totals[2] += totals[0] - totals[1]
+    return totals
+
+def analyze_confirmation_combinations(df_trades: pd.DataFrame,
+                                      max_size: int = COMBINATION_MAX_SIZE,
+                                      min_support: float = COMBINATION_MIN_SUPPORT) -> Dict[str, Any]:
+    """
+    Combinaciones frecuentes de confirmaciones (estilo Apriori) con su rendimiento.
+
+    Se recorre por niveles y solo se extienden las combinaciones frecuentes (al
+    menos min_support de los trades). Las combinaciones de tamaño k que
+    comparten sus primeros k-2 elementos se cuentan juntas: un producto Gram de
+    las columnas de confirmación, restringido a los trades con ese prefijo, da
+    a la vez el total, los ganadores, los perdedores y la ganancia de todos los
+    pares que lo extienden (ver _pair_totals).
+
+    Returns:
+        Dict con 'combinaciones' (ordenadas por rentabilidad promedio, de mayor
+        a menor), 'soporte_minimo' (en trades) y 'tamano_maximo'.
+    """
+    conf_names, matrix = _confirmation_names_and_matrix(df_trades)
+    n_trades = len(df_trades)
+    min_count = max(1, int(np.ceil(min_support * n_trades)))
+    result = {'combinaciones': [], 'soporte_minimo': min_count, 'tamano_maximo': max_size}
+    if not conf_names or n_trades == 0 or max_size < 1:
+        return result
+
+    pnl = df_trades['ganancia/perdida'].to_numpy(dtype=float)
+
+    # Nivel 1: todas las confirmaciones con un solo producto (por bloques)
+    totals = np.zeros((len(conf_names), 4))
+    for start in range(0, n_trades, CONFIRMATION_BLOCK_ROWS):
+        stop = start + CONFIRMATION_BLOCK_ROWS
+        block_pnl = pnl[start:stop]
+        vectors = np.column_stack([np.ones_like(block_pnl), block_pnl > 0, block_pnl < 0, block_pnl])
+        totals += matrix[start:stop].T.astype(float) @ vectors
+
+    records = []
+    frontier = []
+    for i, row in enumerate(totals):
+        if row[0] >= min_count:
+            records.append(_combination_record((conf_names[i],), *row, n_trades))
+            frontier.append((i,))
+
+    for size in range(2, max_size + 1):
+        # Agrupar las combinaciones frecuentes del nivel anterior por prefijo
+        groups = {}
+        for itemset in frontier:
+            groups.setdefault(itemset[:-1], []).append(itemset[-1])
+
+        frontier = []
+        for prefix, items in groups.items():
+            if len(items) < 2:
+                continue
+            pair_totals = _pair_totals(matrix, pnl, prefix, items)
+            for a, b in zip(*np.triu_indices(len(items), k=1)):
+                row = pair_totals[:, a, b]
+                # El soporte es antimonótono: si la combinación es frecuente, todos sus subconjuntos también
+                if row[0] >= min_count:
+                    itemset = prefix + (items[a], items[b])
+                    records.append(_combination_record(tuple(conf_names[k] for k in itemset), *row, n_trades))
+                    frontier.append(itemset)
+        if not frontier:
+            break
+
+    result['combinaciones'] = sorted(records, key=lambda record: record['rentabilidad_promedio'], reverse=True)
+    return result
+
+# --- Significancia Estadística de las Confirmaciones ---
+
+def _bootstrap_atoms(pnl: np.ndarray):
+    """
+    Resume los trades en átomos (valor medio, cantidad de trades): cada signo
+    (ganadores, en cero, perdedores) se parte en hasta BOOTSTRAP_ATOMS grupos
+    de igual tamaño por cuantiles, así ningún átomo mezcla ganadores y perdedores.
+    """
+    values, counts = [], []
+    for part in (pnl[pnl > 0], pnl[pnl == 0], pnl[pnl < 0]):
+        if len(part) == 0:
+            continue
+        part = np.sort(part)
+        starts = np.unique(np.arange(BOOTSTRAP_ATOMS) * len(part) // BOOTSTRAP_ATOMS)
+        part_counts = np.diff(np.append(starts, len(part)))
+        values.append(np.add.reduceat(part, starts) / part_counts)
+        counts.append(part_counts)
+    return np.concatenate(values), np.concatenate(counts)
+
+def _bootstrap_confirmation(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Intervalos y p-valor de una confirmación (se ejecuta en un proceso del pool).
+
+    Con pocos trades se remuestrean los trades (bootstrap clásico, muchos
+    remuestreos por operación). Con muchos se usa el bootstrap de Poisson sobre
+    los átomos (cada átomo aparece Poisson(trades del átomo) veces) y la
+    dispersión de la rentabilidad se reescala para conservar la varianza que
+    los átomos pierden dentro de cada cuantil. La prueba de permutaciones
+    compara la tasa de éxito con la de todos los trades: al permutar las
+    etiquetas, los ganadores de un grupo de n trades siguen una hipergeométrica.
+    """
+    rng = np.random.default_rng(task['seed'])
+    n, resamples = task['total'], task['resamples']
+    result = {'asertividad_ic': None, 'rentabilidad_ic': None, 'p_valor': None}
+
+    if resamples > 0 and n >= BOOTSTRAP_MIN_TRADES:
+        rates, means = [], []
+        if 'pnl' in task:
+            pnl = task['pnl']
+            rows = max(1, BOOTSTRAP_BLOCK_ELEMENTS // n)
+            for start in range(0, resamples, rows):
+                sample = pnl[rng.integers(0, n, size=(min(rows, resamples - start), n))]
+                rates.append((sample > 0).mean(axis=1))
+                means.append(sample.mean(axis=1))
+        else:
+            values, counts = task['atoms']
+            winners = values > 0
+            center = float(counts @ values) / n
+            atom_var = float(counts @ (values - center) ** 2) / n
+            scale = np.sqrt(task['variance'] / atom_var) if atom_var > 0 else 1.0
+            rows = max(1, BOOTSTRAP_BLOCK_ELEMENTS // len(values))
+            for start in range(0, resamples, rows):
+                weights = rng.poisson(counts, size=(min(rows, resamples - start), len(values))).astype(float)
+                total = np.maximum(weights.sum(axis=1), 1.0)
+                rates.append(weights[:, winners].sum(axis=1) / total)
+                means.append(center + (weights @ values / total - center) * scale)
+        tail = (1 - task['confidence']) / 2
+        rate_lo, rate_hi = np.quantile(np.concatenate(rates), [tail, 1 - tail])
+        mean_lo, mean_hi = np.quantile(np.concatenate(means), [tail, 1 - tail])
+        result['asertividad_ic'] = (round(float(rate_lo) * 100, 2), round(float(rate_hi) * 100, 2))
+        result['rentabilidad_ic'] = (float(mean_lo), float(mean_hi))
+
+    if task['permutations'] > 0:
+        all_trades, all_wins = task['baseline']
+        baseline = all_wins / all_trades
+        observed = abs(task['wins'] / n - baseline)
+        permuted = rng.hypergeometric(all_wins, all_trades - all_wins, n, size=task['permutations'])
+        # Tolerancia para que los empates exactos cuenten como igual de extremos
+        extreme = np.count_nonzero(np.abs(permuted / n - baseline) >= observed - 1e-12)
+        result['p_valor'] = float(extreme + 1) / (task['permutations'] + 1)
+    return result
+
+def confirmation_significance(df_trades: pd.DataFrame, resamples: int = 10000, permutations: int = 0,
+                              confidence: float = SIGNIFICANCE_CONFIDENCE, seed: int = SIGNIFICANCE_SEED,
+                              processes: int = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Intervalos de confianza bootstrap de la asertividad (en porcentaje) y de la
+    rentabilidad promedio de cada confirmación y, si permutations > 0, el
+    p-valor (dos colas) de una prueba de permutaciones contra la tasa de éxito
+    de todos los trades.
+
+    Las confirmaciones se reparten en un pool de procesos (processes=None usa
+    todos los núcleos; con 1 se calcula en este proceso). Cada confirmación
+    usa su propia semilla derivada de `seed`, así que el resultado no depende
+    del número de procesos.
+
+    Returns:
+        Dict confirmación -> {'asertividad_ic': (min, max), 'rentabilidad_ic':
+        (min, max), 'p_valor': float} (None en lo que no se calculó; sin
+        intervalos para las de menos de BOOTSTRAP_MIN_TRADES trades).
+    """
+    conf_names, matrix = _confirmation_names_and_matrix(df_trades)
+    if not conf_names or len(df_trades) == 0:
+        return {}
+    pnl = df_trades['ganancia/perdida'].to_numpy(dtype=float)
+    baseline = (len(pnl), int(np.count_nonzero(pnl > 0)))
+
+    tasks, names = [], []
+    seeds = np.random.SeedSequence(seed).spawn(len(conf_names))
+    for j, name in enumerate(conf_names):
+        conf_pnl = pnl[matrix[:, j]]
+        if len(conf_pnl) == 0:
+            continue
+        task = {'total': len(conf_pnl), 'wins': int(np.count_nonzero(conf_pnl > 0)), 'resamples': resamples,
+                'permutations': permutations, 'confidence': confidence, 'baseline': baseline, 'seed': seeds[j]}
+        if len(conf_pnl) <= BOOTSTRAP_EXACT_ROWS:
+            task['pnl'] = conf_pnl
+        else:
+            task['atoms'] = _bootstrap_atoms(conf_pnl)
+            task['variance'] = float(conf_pnl.var())
+        tasks.append(task)
+        names.append(name)
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(tasks) < 2:
+        results = [_bootstrap_confirmation(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as executor:
+            results = list(executor.map(_bootstrap_confirmation, tasks))
+    return dict(zip(names, results))
@@ -0,0 +1,977 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de rendimiento del pipeline de análisis.
+
+Uso:
+    python benchmark.py expansion --tamanos 100000 1000000
+    python benchmark.py confirmaciones --tamanos 100000 1000000
+    python benchmark.py metricas --tamanos 100000 1000000
+    python benchmark.py tabla --tamanos 100000 1000000
+    python benchmark.py inicio --repeticiones 5
+    python benchmark.py snapshot --tamanos 100000 1000000
+    python benchmark.py importacion --tamanos 1000000
+    python benchmark.py memoria --tamanos 1000000 --confirmaciones 12 100
+    python benchmark.py combinaciones --tamanos 100000 1000000 --confirmaciones 24
+    python benchmark.py curva --tamanos 100000 1000000
+    python benchmark.py filtros --tamanos 100000 1000000
+    python benchmark.py concurrencia --procesos 1 4 8 --hilos 8 --trades 200
+    python benchmark.py particiones --tamanos 100000 1000000 --cuentas 4 --procesos 4
+    python benchmark.py concurrencia --procesos 4 --sin-grupo
+    python benchmark.py decodificacion --tamanos 100000 1000000
+    python benchmark.py suite --tamanos 10000 100000 1000000 --umbrales benchmark_umbrales.json
+    python benchmark.py suite --base benchmark_resultados.json --tolerancia 0.25 --salida nuevos.json
+
+La suite genera un journal sintético por tamaño, mide tiempo y memoria pico de
+cada etapa, escribe los resultados en JSON y termina con código 1 si alguna etapa
+supera los umbrales (límites absolutos o regresión respecto de una corrida base).
+10M trades requieren varios GB de RAM solo para la lista de trades en memoria.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any
+
+import numpy as np
+import pandas as pd
+
+import analyzer as an
+import data_loader as dl
+import importer as im
+import partitions as pt
+import preprocessor as pp
+import query as qy
+import snapshot as sn
+import timeseries as ts
+import trade_table as tt
+from trade_record import Trade, TradeDecoder
+
+# --- Generador de Datos Sintéticos ---
+
+ACTIVOS = ["ORO", "DJ30", "NAS100", "SP500", "BTCUSD", "AUDUSD", "EURUSD", "GBPUSD", "USDJPY", "USDCAD"]
+ORDENES = ["BUY", "SELL", "SELL LIMIT", "BUY LIMIT", "SELL STOP", "BUY STOP"]
+TIPOS_ENTRADA = ["Rebrote", "Ruptura", "Rango", "Tendencia"]
+MEJORAS = ["Toma Parcial", "Manejo Riego", "Ninguna"]
+
+def generate_trades(n: int, n_confirmations: int = 12, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Genera n trades sintéticos con el mismo esquema que movimientos.jsonl.
+
+    Los activos siguen una distribución sesgada (unos pocos concentran la mayoría
+    de las operaciones) y cada confirmación tiene su propia frecuencia.
+    """
+    rng = np.random.default_rng(seed)
+    conf_names = [f"conf{j}" for j in range(n_confirmations)]
+
+    activo_p = 1.0 / np.arange(1, len(ACTIVOS) + 1)
+    activos = rng.choice(ACTIVOS, size=n, p=activo_p / activo_p.sum())
+    ordenes = rng.choice(ORDENES, size=n)
+    tipos = rng.choice(TIPOS_ENTRADA, size=n)
+    mejoras = rng.choice(MEJORAS, size=n)
+    pnl = np.round(rng.normal(5.0, 50.0, size=n), 2)
+    conf_matrix = rng.random((n, n_confirmations)) < np.linspace(0.05, 0.5, n_confirmations)
+
+    trades = []
+    for i in range(n):
+        trades.append({
+            "activo": activos[i],
+            "accion": ordenes[i],
+            "ganancia/perdida": float(pnl[i]),
+            "tipo entrada": tipos[i],
+            "mejorar": mejoras[i],
+            "confirmaciones": {conf_names[j]: True for j in np.flatnonzero(conf_matrix[i])},
+        })
+    return trades
+
+def generate_realistic_trades(n: int, n_assets: int = 60, n_confirmations: int = 40, seed: int = 0,
+                              first: int = 0) -> List[Dict[str, Any]]:
+    """
+    Genera n trades sintéticos con distribuciones sesgadas, más cercanas a un journal real:
+
+    - Activos con frecuencia tipo Zipf (los primeros concentran la mayoría).
+    - Frecuencia de confirmaciones decreciente: unas pocas aparecen en casi todos
+      los trades y la mayoría son raras.
+    - Ganancias y pérdidas con colas pesadas (lognormal) y tasa de éxito < 50%.
+    - Ticket y fechas de apertura/cierre crecientes; `first` continúa la numeración
+      de un bloque anterior para generar journals grandes por bloques.
+    """
+    rng = np.random.default_rng(seed)
+    assets = (ACTIVOS + [f"SYM{k:03d}" for k in range(max(0, n_assets - len(ACTIVOS)))])[:n_assets]
+    asset_p = 1.0 / np.arange(1, n_assets + 1) ** 1.1
+    conf_names = [f"conf{j}" for j in range(n_confirmations)]
+    conf_p = 0.6 * 0.85 ** np.arange(n_confirmations)
+
+    activos = rng.choice(assets, size=n, p=asset_p / asset_p.sum())
+    ordenes = rng.choice(ORDENES, size=n, p=[0.4, 0.4, 0.05, 0.05, 0.05, 0.05])
+    tipos = rng.choice(TIPOS_ENTRADA, size=n, p=[0.4, 0.3, 0.2, 0.1])
+    mejoras = rng.choice(MEJORAS, size=n, p=[0.3, 0.2, 0.5])
+    magnitude = rng.lognormal(3.0, 1.0, size=n)
+    pnl = np.round(np.where(rng.random(n) < 0.46, 1.3 * magnitude, -magnitude), 2)
+    conf_matrix = rng.random((n, n_confirmations)) < conf_p
+    # Un cierre por hora en promedio, con apertura entre 1 minuto y 1 día antes
+    close = np.datetime64('2020-01-01T00:00:00') + ((first + np.arange(n)) * 3600 + rng.integers(0, 3600, n))
+    opened = close - rng.integers(60, 86_400, n)
+    close, opened = np.datetime_as_string(close, unit='s'), np.datetime_as_string(opened, unit='s')
+
+    trades = []
+    for i in range(n):
+        trades.append({
+            "activo": activos[i],
+            "accion": ordenes[i],
+            "ganancia/perdida": float(pnl[i]),
+            "tipo entrada": tipos[i],
+            "mejorar": mejoras[i],
+            "confirmaciones": {conf_names[j]: True for j in np.flatnonzero(conf_matrix[i])},
+            "apertura": opened[i],
+            "cierre": close[i],
+            dl.TRADE_ID_FIELD: str(first + i + 1),
+        })
+    return trades
+
+def write_synthetic_journal(data_dir: str, n: int, chunk_rows: int = 100_000, seed: int = 0, **kwargs):
+    """
+    Escribe por bloques (memoria acotada) un journal sintético en data_dir:
+    movimientos.jsonl y el mismo contenido en el formato anterior (movimientos.json).
+    """
+    journal = os.path.join(data_dir, os.path.basename(dl.TRADES_FILE))
+    legacy = os.path.join(data_dir, os.path.basename(dl.LEGACY_TRADES_FILE))
+    with open(journal, 'w', encoding='utf-8') as f_journal, open(legacy, 'w', encoding='utf-8') as f_legacy:
+        f_legacy.write("[")
+        for first in range(0, n, chunk_rows):
+            trades = generate_realistic_trades(min(chunk_rows, n - first), seed=seed + first, first=first, **kwargs)
+            lines = [json.dumps(trade, ensure_ascii=False) for trade in trades]
+            f_journal.write("\n".join(lines) + "\n")
+            f_legacy.write(("," if first else "") + ",".join(lines))
+        f_legacy.write("]")
+    for name in (dl.CONFIRMATIONS_FILE, dl.IMPROVEMENTS_FILE):
+        with open(os.path.join(data_dir, os.path.basename(name)), 'w', encoding='utf-8') as f:
+            f.write("[]")
+    return journal, legacy
+
+# --- Benchmarks ---
+
+def _expand_confirmations_legacy(df: pd.DataFrame) -> pd.DataFrame:
+    """Expansión original con .apply(pd.Series), usada como línea base."""
+    confirmaciones = df['confirmaciones'].apply(lambda x: x if isinstance(x, dict) else {})
+    conf_df = confirmaciones.apply(pd.Series).fillna(False).astype(bool)
+    conf_df.columns = ['conf_' + col for col in conf_df.columns]
+    return pd.concat([df.drop('confirmaciones', axis=1), conf_df], axis=1)
+
+def _analyze_confirmations_legacy(df_trades: pd.DataFrame) -> Dict[str, Any]:
+    """analyze_confirmations original (tres filtros por confirmación), usada como línea base."""
+    conf_results = {}
+    for col in [c for c in df_trades.columns if c.startswith('conf_')]:
+        trades_con_conf = df_trades[df_trades[col] == True]
+        if trades_con_conf.empty:
+            conf_results[col.replace('conf_', '')] = {'total': 0, 'asertividad': 0, 'ineficiencia': 0, 'rentabilidad_promedio': 0}
+            continue
+        total = len(trades_con_conf)
+        winners = trades_con_conf[trades_con_conf['ganancia/perdida'] > 0]
+        losers = trades_con_conf[trades_con_conf['ganancia/perdida'] < 0]
+        conf_results[col.replace('conf_', '')] = {
+            'total': total,
+            'asertividad': round(len(winners) / total * 100, 2),
+            'ineficiencia': round(len(losers) / total * 100, 2),
+            'rentabilidad_promedio': trades_con_conf['ganancia/perdida'].mean()
+        }
+    return conf_results
+
+def _assert_confirmation_results_equal(new: Dict[str, Any], legacy: Dict[str, Any]):
+    assert list(new) == list(legacy), "Las confirmaciones no coinciden"
+    for name, expected in legacy.items():
+        got = new[name]
+        assert got['total'] == expected['total'], name
+        assert got['asertividad'] == expected['asertividad'], name
+        assert got['ineficiencia'] == expected['ineficiencia'], name
+        assert np.isclose(got['rentabilidad_promedio'], expected['rentabilidad_promedio']), name
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def bench_confirmation_expansion(sizes: List[int], skip_legacy_above: int = None):
+    """Compara la expansión de confirmaciones vectorizada contra la original."""
+    print(f"{'trades':>10} {'original (s)':>14} {'vectorizada (s)':>16} {'speedup':>9}")
+    for n in sizes:
+        df = pd.DataFrame(generate_trades(n))
+        new_df, new_time = _timed(pp._expand_confirmations, df)
+
+        if skip_legacy_above is not None and n > skip_legacy_above:
+            print(f"{n:>10} {'-':>14} {new_time:>16.3f} {'-':>9}")
+            continue
+
+        legacy_df, legacy_time = _timed(_expand_confirmations_legacy, df)
+        pd.testing.assert_frame_equal(new_df, legacy_df)
+        print(f"{n:>10} {legacy_time:>14.3f} {new_time:>16.3f} {legacy_time / new_time:>8.1f}x")
+
+def bench_confirmation_analysis(sizes: List[int], n_confirmations: int, skip_legacy_above: int = None):
+    """Compara analyze_confirmations matricial contra la versión original por columna."""
+    print(f"{'trades':>10} {'original (s)':>14} {'matricial (s)':>14} {'speedup':>9}")
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n, n_confirmations))
+        new_result, new_time = _timed(an.analyze_confirmations, df)
+
+        if skip_legacy_above is not None and n > skip_legacy_above:
+            print(f"{n:>10} {'-':>14} {new_time:>14.3f} {'-':>9}")
+            continue
+
+        legacy_result, legacy_time = _timed(_analyze_confirmations_legacy, df)
+        _assert_confirmation_results_equal(new_result['analisis_completo'], legacy_result)
+        print(f"{n:>10} {legacy_time:>14.3f} {new_time:>14.3f} {legacy_time / new_time:>8.1f}x")
+
+def bench_key_metrics(sizes: List[int]):
+    """Compara el costo de refrescar las métricas tras un trade nuevo: recálculo completo vs acumulador."""
+    print(f"{'trades':>10} {'completo (s)':>14} {'acumulador (s)':>15} {'speedup':>9}")
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n))
+        accumulator = an.MetricsAccumulator(df.iloc[:-1])
+        _, full_time = _timed(an.calculate_key_metrics, df)
+
+        start = time.perf_counter()
+        accumulator.update(df.iloc[-1:])
+        accumulator.metrics()
+        incremental_time = time.perf_counter() - start
+        print(f"{n:>10} {full_time:>14.4f} {incremental_time:>15.4f} {full_time / incremental_time:>8.1f}x")
+
+def _table_rows_legacy(df_trades: pd.DataFrame) -> List[List[Any]]:
+    """Filas de la tabla como las armaba populate_trades_tree original (iterrows), usada como línea base."""
+    conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
+    non_conf_cols = [col for col in df_trades.columns if col not in conf_cols and col != 'resultado']
+    rows = []
+    for _, row in df_trades.iterrows():
+        active_confs = [col.split('_', 1)[1].upper() for col in conf_cols if row[col]]
+        rows.append([row[col] for col in non_conf_cols] + [", ".join(active_confs) if active_confs else "Ninguna"])
+    return rows
+
+def bench_trade_table(sizes: List[int], windows: int = 200, skip_legacy_above: int = None):
+    """Compara armar todas las filas (original) contra el modelo virtual: construcción + ventanas visibles."""
+    print(f"{'trades':>10} {'original (s)':>14} {'modelo (s)':>12} {'ventana (ms)':>13}")
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n, 24))
+        model, build_time = _timed(tt.TradeTableModel, df)
+
+        start = time.perf_counter()
+        for first in rng.integers(0, n, size=windows):
+            model.rows(first, first + 40)
+        window_ms = (time.perf_counter() - start) / windows * 1000
+
+        if skip_legacy_above is not None and n > skip_legacy_above:
+            legacy = "-"
+        else:
+            legacy = f"{_timed(_table_rows_legacy, df)[1]:.3f}"
+        print(f"{n:>10} {legacy:>14} {build_time:>12.3f} {window_ms:>13.2f}")
+
+def bench_startup(runs: int):
+    """
+    Arranca la aplicación varias veces con `main.py --medir-inicio` y resume el
+    tiempo hasta la primera ventana y hasta estar interactiva (requiere pantalla).
+    """
+    samples = {'primera_ventana': [], 'interactiva': []}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "main.py", "--medir-inicio"],
+                                capture_output=True, text=True, check=True).stdout
+        times = json.loads(output.strip().splitlines()[-1])
+        for key in samples:
+            samples[key].append(times[key])
+
+    print(f"{'etapa':>16} {'mediana (s)':>12} {'mín (s)':>9} {'máx (s)':>9}")
+    for key, values in samples.items():
+        print(f"{key:>16} {statistics.median(values):>12.3f} {min(values):>9.3f} {max(values):>9.3f}")
+
+def bench_snapshot(sizes: List[int]):
+    """
+    Compara cargar el DataFrame preprocesado desde el journal (parseo JSON +
+    preprocess_data) contra abrir el snapshot columnar, en un directorio temporal.
+    """
+    print(f"{'trades':>10} {'journal (s)':>12} {'crear (s)':>10} {'abrir (s)':>10} {'agregar 1 (s)':>14} {'speedup':>9}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal_path = os.path.join(tmp, "movimientos.jsonl")
+            snapshot_dir = os.path.join(tmp, ".snapshot")
+            trades = generate_trades(n)
+            dl._write_trades_journal(trades, journal_path)
+
+            start = time.perf_counter()
+            legacy_df = pp.preprocess_data(dl._load_trades_journal(journal_path))
+            legacy_time = time.perf_counter() - start
+
+            _, build_time = _timed(sn.load_trades_frame, journal_path, snapshot_dir)
+            snapshot_df, open_time = _timed(sn.load_trades_frame, journal_path, snapshot_dir)
+            pd.testing.assert_frame_equal(snapshot_df, legacy_df)
+
+            with open(journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(generate_trades(1, seed=n)[0], ensure_ascii=False) + "\n")
+            _, append_time = _timed(sn.load_trades_frame, journal_path, snapshot_dir)
+        print(f"{n:>10} {legacy_time:>12.3f} {build_time:>10.3f} {open_time:>10.3f} "
+              f"{append_time:>14.3f} {legacy_time / open_time:>8.1f}x")
+
+def bench_partitions(sizes: List[int], n_accounts: int, processes: int = None):
+    """
+    Journal único contra journal particionado por cuenta y mes: carga completa
+    (en un proceso y en paralelo), carga de una cuenta y un mes, y métricas
+    entre particiones desde los agregados (fríos, guardados y con un mes modificado).
+    """
+    print(f"{'trades':>10} {'particiones':>12} {'único (s)':>10} {'1 proc (s)':>11} {'paralelo (s)':>13} "
+          f"{'1 mes (s)':>10} {'agreg. frío':>12} {'agreg. guardado':>16} {'1 mes nuevo':>12}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal_path = os.path.join(tmp, "movimientos.jsonl")
+            partitions_dir = os.path.join(tmp, "particiones")
+            with contextlib.redirect_stdout(io.StringIO()):
+                for first in range(0, n, 100_000):
+                    trades = generate_realistic_trades(min(100_000, n - first), seed=first, first=first)
+                    for i, trade in enumerate(trades):
+                        trade[pt.ACCOUNT_FIELD] = f"cuenta{(first + i) % n_accounts}"
+                    with open(journal_path, 'a', encoding='utf-8') as f:
+                        f.write("".join(json.dumps(trade, ensure_ascii=False) + "\n" for trade in trades))
+                    pt.add_trades(trades, partitions_dir)
+            partitions = pt.select_partitions(partitions_dir)
+            account, month = partitions[len(partitions) // 2]
+
+            single_time = _timed(_silent, lambda: pp.preprocess_data(dl._load_trades_journal(journal_path)))[1]
+            serial_time = _timed(_silent, lambda: pt.load_frame(partitions_dir=partitions_dir, processes=1))[1]
+            parallel_time = _timed(_silent, lambda: pt.load_frame(partitions_dir=partitions_dir, processes=processes))[1]
+            month_time = _timed(_silent, lambda: pt.load_frame([account], month, month, partitions_dir))[1]
+            aggregate = lambda: pt.merge_aggregates(list(pt.partition_aggregates(partitions, partitions_dir, processes).values()))
+            cold_time = _timed(_silent, aggregate)[1]
+            warm_time = _timed(_silent, aggregate)[1]
+            with contextlib.redirect_stdout(io.StringIO()):
+                pt.add_trade({**generate_realistic_trades(1, seed=n)[0], pt.ACCOUNT_FIELD: account,
+                              'apertura': f"{month}-15T00:00:00"}, partitions_dir)
+            touched_time = _timed(_silent, aggregate)[1]
+        print(f"{n:>10} {len(partitions):>12} {single_time:>10.2f} {serial_time:>11.2f} {parallel_time:>13.2f} "
+              f"{month_time:>10.3f} {cold_time:>12.2f} {warm_time:>16.3f} {touched_time:>12.3f}")
+
+def write_broker_csv(filepath: str, n: int, duplicate_fraction: float = 0.01, seed: int = 0,
+                     chunk_rows: int = 100_000):
+    """
+    Escribe un CSV sintético con el formato de un historial de MetaTrader
+    (Ticket;Symbol;Type;Commission;Swap;Profit;Comment). Una fracción de las
+    filas repite el ticket de una fila anterior, para ejercitar la deduplicación.
+    """
+    rng = np.random.default_rng(seed)
+    types = np.array(["buy", "sell", "buy limit", "sell limit", "balance"])
+    header = True
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        tickets = np.arange(start, start + size) + 1_000_000
+        repeat = rng.random(size) < duplicate_fraction
+        tickets[repeat] = rng.integers(1_000_000, 1_000_000 + start + 1, size=int(repeat.sum()))
+        pd.DataFrame({
+            "Ticket": tickets,
+            "Symbol": np.array(ACTIVOS)[rng.integers(0, len(ACTIVOS), size)],
+            "Type": types[rng.choice(len(types), size, p=[0.45, 0.45, 0.04, 0.04, 0.02])],
+            "Commission": rng.normal(-2, 0.5, size).round(2),
+            "Swap": rng.normal(0, 1, size).round(2),
+            "Profit": rng.normal(5, 100, size).round(2),
+            "Comment": np.array(["hch;fuerza", "noticia", "", "volatilidad|hch"])[rng.integers(0, 4, size)],
+        }).to_csv(filepath, sep=";", index=False, header=header, mode="w" if header else "a")
+        header = False
+
+def _retained_bytes(func):
+    """Resultado de func y los bytes que siguen asignados mientras se conserva."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = func()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return result, retained
+
+def bench_decoding(sizes: List[int]):
+    """
+    Decodificación del journal: la ruta anterior (json.loads a una lista de
+    diccionarios + preprocess_data) contra TradeDecoder (validación y columnas
+    en una pasada). Verifica que ambos DataFrames coincidan y muestra la memoria
+    por trade de cada representación intermedia.
+    """
+    print(f"{'trades':>10} {'dicts (s)':>10} {'columnas (s)':>13} {'speedup':>8} {'pico dicts (MB)':>16} "
+          f"{'pico columnas (MB)':>19}")
+    memory_rows = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = os.path.join(tmp, "movimientos.jsonl")
+            dl._write_trades_journal(generate_realistic_trades(n), journal)
+
+            legacy_df, legacy_time, legacy_mb = _measure(
+                lambda: _silent(pp.preprocess_data, _silent(dl._load_trades_journal, journal)), 1, True)
+            decoded_df, decode_time, decode_mb = _measure(
+                lambda: _silent(dl.decode_journals, [journal]).to_frame(), 1, True)
+            # El decodificador deja ganancia/perdida y resultado siempre en float64
+            for col in ('ganancia/perdida', 'resultado'):
+                if col in legacy_df.columns:
+                    legacy_df[col] = legacy_df[col].astype(float)
+            pd.testing.assert_frame_equal(decoded_df, legacy_df)
+            print(f"{n:>10} {legacy_time:>10.3f} {decode_time:>13.3f} {legacy_time / decode_time:>7.1f}x "
+                  f"{legacy_mb:>16.1f} {decode_mb:>19.1f}")
+
+            with open(journal, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            _, dict_bytes = _retained_bytes(lambda: [json.loads(line) for line in lines])
+            _, record_bytes = _retained_bytes(lambda: [Trade.from_raw(json.loads(line)) for line in lines])
+            decoder = TradeDecoder()
+            _, column_bytes = _retained_bytes(lambda: decoder.decode_lines(lines))
+            memory_rows.append((n, dict_bytes / n, record_bytes / n, column_bytes / n,
+                                decoded_df.memory_usage(deep=True).sum() / n))
+            del lines, decoder, legacy_df, decoded_df
+
+    print(f"\n{'trades':>10} {'dicts (B/trade)':>16} {'Trade (B/trade)':>16} {'columnas (B/trade)':>19} "
+          f"{'DataFrame (B/trade)':>20}")
+    for n, dict_bytes, record_bytes, column_bytes, frame_bytes in memory_rows:
+        print(f"{n:>10} {dict_bytes:>16.1f} {record_bytes:>16.1f} {column_bytes:>19.1f} {frame_bytes:>20.1f}")
+
+def bench_import(sizes: List[int], chunk_rows: int):
+    """Importación masiva de un CSV de broker a un journal nuevo: tiempo y memoria máxima del proceso."""
+    print(f"{'filas':>10} {'tiempo (s)':>11} {'filas/s':>10} {'importados':>11} {'duplicados':>11} {'RSS máx (MB)':>13}")
+    cwd = os.getcwd()
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "historial.csv")
+            write_broker_csv(csv_path, n)
+            # data_loader usa rutas relativas a 'data/'
+            os.chdir(tmp)
+            try:
+                stats, elapsed = _timed(im.import_trades, csv_path, dl.add_trades, dl.iter_trade_ids,
+                                        {'confirmaciones': 'Comment'}, chunk_rows)
+                # Reimportar el mismo archivo no debe agregar nada
+                again = im.import_trades(csv_path, dl.add_trades, dl.iter_trade_ids, {'confirmaciones': 'Comment'}, chunk_rows)
+                assert again['importados'] == 0
+            finally:
+                os.chdir(cwd)
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{n:>10} {elapsed:>11.2f} {n / elapsed:>10.0f} {stats['importados']:>11} "
+              f"{stats['duplicados']:>11} {peak_mb:>13.0f}")
+
+def _assert_metrics_equal(new: Dict[str, Any], reference: Dict[str, Any]):
+    """Compara dos resultados de calculate_key_metrics (los flotantes con tolerancia)."""
+    assert new.keys() == reference.keys()
+    for key, expected in reference.items():
+        if isinstance(expected, list):
+            assert len(new[key]) == len(expected), key
+            for row, expected_row in zip(new[key], expected):
+                assert list(row.values())[0] == list(expected_row.values())[0], key
+                assert row['count'] == expected_row['count'] and np.isclose(row['mean'], expected_row['mean']), key
+        elif isinstance(expected, float):
+            assert np.isclose(new[key], expected), key
+        else:
+            assert new[key] == expected, key
+
+def bench_compact_memory(sizes: List[int], confirmation_counts: List[int]):
+    """Memoria por trade del DataFrame preprocesado frente a su forma compacta, y costo del análisis en ambas."""
+    print(f"{'trades':>10} {'confs':>6} {'normal (B/trade)':>17} {'compacta (B/trade)':>19} "
+          f"{'reducción':>10} {'conf normal (s)':>16} {'conf compacta (s)':>18}")
+    for n in sizes:
+        for n_confirmations in confirmation_counts:
+            df = pp.preprocess_data(generate_trades(n, n_confirmations))
+            compact = pp.compact_trades(df)
+            wide_bytes = df.memory_usage(deep=True).sum() / n
+            compact_bytes = compact.memory_usage(deep=True).sum() / n
+
+            reference, wide_time = _timed(an.analyze_confirmations, df)
+            result, compact_time = _timed(an.analyze_confirmations, compact)
+            _assert_confirmation_results_equal(result['analisis_completo'], reference['analisis_completo'])
+            _assert_metrics_equal(an.calculate_key_metrics(compact), an.calculate_key_metrics(df))
+            _assert_metrics_equal(an.MetricsAccumulator(compact).metrics(), an.calculate_key_metrics(df))
+            print(f"{n:>10} {n_confirmations:>6} {wide_bytes:>17.1f} {compact_bytes:>19.1f} "
+                  f"{wide_bytes / compact_bytes:>9.1f}x {wide_time:>16.3f} {compact_time:>18.3f}")
+
+def _combinations_naive(df_trades: pd.DataFrame, max_size: int, min_support: float) -> Dict[frozenset, tuple]:
+    """Línea base: recorre todas las combinaciones posibles con una máscara booleana por combinación."""
+    conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
+    min_count = max(1, int(np.ceil(min_support * len(df_trades))))
+    pnl = df_trades['ganancia/perdida']
+    results = {}
+    for size in range(1, max_size + 1):
+        for combination in itertools.combinations(conf_cols, size):
+            mask = df_trades[list(combination)].all(axis=1)
+            total = int(mask.sum())
+            if total >= min_count:
+                results[frozenset(col.replace('conf_', '') for col in combination)] = (total, pnl[mask].mean())
+    return results
+
+def bench_combinations(sizes: List[int], n_confirmations: int, max_size: int, min_support: float,
+                       skip_naive_above: int = None):
+    """Compara la minería de combinaciones por niveles (productos Gram) contra recorrer todas las combinaciones."""
+    print(f"{'trades':>10} {'combinaciones':>14} {'ingenua (s)':>12} {'por niveles (s)':>16} {'speedup':>9}")
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n, n_confirmations))
+        result, new_time = _timed(an.analyze_confirmation_combinations, df, max_size, min_support)
+        found = len(result['combinaciones'])
+
+        if skip_naive_above is not None and n > skip_naive_above:
+            print(f"{n:>10} {found:>14} {'-':>12} {new_time:>16.3f} {'-':>9}")
+            continue
+
+        naive, naive_time = _timed(_combinations_naive, df, max_size, min_support)
+        got = {frozenset(r['confirmaciones']): (r['total'], r['rentabilidad_promedio']) for r in result['combinaciones']}
+        assert got.keys() == naive.keys(), "Las combinaciones frecuentes no coinciden"
+        for itemset, (total, mean) in naive.items():
+            assert got[itemset][0] == total and np.isclose(got[itemset][1], mean), itemset
+        print(f"{n:>10} {found:>14} {naive_time:>12.3f} {new_time:>16.3f} {naive_time / new_time:>8.1f}x")
+
+def _equity_curve_pandas(df_trades: pd.DataFrame, window: int) -> Dict[str, Any]:
+    """Línea base: orden por cierre, cumsum/cummax y rolling de pandas sobre todo el historial."""
+    ordered = df_trades.sort_values('cierre', kind='stable')
+    pnl = ordered['ganancia/perdida'].reset_index(drop=True)
+    equity = pnl.cumsum()
+    drawdown = equity - equity.clip(lower=0).cummax()
+    return {
+        'drawdown_maximo': min(0.0, float(drawdown.min())),
+        'tasa_de_exito': float((pnl > 0).rolling(window).mean().iloc[-1]),
+        'rentabilidad_promedio': float(pnl.rolling(window).mean().iloc[-1]),
+    }
+
+def bench_equity_curve(sizes: List[int], window: int = ts.DEFAULT_WINDOWS[0]):
+    """Compara la curva de capital de pandas contra EquityCurve (completa y extendida con un trade)."""
+    print(f"{'trades':>10} {'pandas (s)':>11} {'completa (s)':>13} {'extender (s)':>13} {'speedup':>9}")
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n))
+        # Cierres cada 10 minutos con algo de desorden respecto del journal
+        jitter = np.random.default_rng(0).integers(-15, 15, size=n)
+        df['cierre'] = (np.datetime64('2020-01-01T00:00:00') + (np.arange(n) * 10 + jitter) * 60).astype(pp.TIMESTAMP_DTYPE)
+
+        reference, pandas_time = _timed(_equity_curve_pandas, df, window)
+        curve, full_time = _timed(ts.EquityCurve, df, (window,))
+        summary = curve.summary()
+        assert np.isclose(summary['drawdown_maximo'], reference['drawdown_maximo'])
+        assert np.isclose(summary['ventanas'][window]['tasa_de_exito'], reference['tasa_de_exito'])
+        assert np.isclose(summary['ventanas'][window]['rentabilidad_promedio'], reference['rentabilidad_promedio'])
+
+        curve = ts.EquityCurve(df.iloc[:-1], (window,))
+        start = time.perf_counter()
+        curve.extend(df.iloc[-1:])
+        curve.summary()
+        extend_time = time.perf_counter() - start
+        print(f"{n:>10} {pandas_time:>11.4f} {full_time:>13.4f} {extend_time:>13.4f} {pandas_time / extend_time:>8.1f}x")
+
+def _filter_pandas(df_trades: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFrame:
+    """Línea base: máscaras booleanas de pandas sobre todo el DataFrame."""
+    mask = df_trades['activo'].isin(filters['activo']) & df_trades['accion'].isin(filters['accion'])
+    for name in filters['con']:
+        mask &= df_trades[f"conf_{name}"]
+    for name in filters['sin']:
+        mask &= ~df_trades[f"conf_{name}"]
+    mask &= df_trades['cierre'].between(pd.Timestamp(filters['desde']), pd.Timestamp(filters['hasta']))
+    return df_trades[mask]
+
+def _benchmark_filters(df_trades: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Filtros del benchmark derivados de los datos generados, para que cada tamaño
+    seleccione un subconjunto no vacío: los dos activos y tipos de orden más
+    frecuentes, la confirmación más frecuente (requerida) y la menos frecuente
+    (excluida), y las fechas de cierre entre los percentiles 20 y 80.
+    """
+    conf_counts = df_trades[[col for col in df_trades.columns if col.startswith('conf_')]].sum().sort_values()
+    closes = df_trades['cierre'].sort_values()
+    return {'activo': df_trades['activo'].value_counts().index[:2].tolist(),
+            'accion': df_trades['accion'].value_counts().index[:2].tolist(),
+            'con': [conf_counts.index[-1].replace('conf_', '', 1)],
+            'sin': [conf_counts.index[0].replace('conf_', '', 1)],
+            'desde': str(closes.iloc[len(closes) // 5]), 'hasta': str(closes.iloc[len(closes) * 4 // 5])}
+
+def bench_filters(sizes: List[int]):
+    """Compara el filtrado con máscaras de pandas contra los índices invertidos de TradeIndex."""
+    print(f"{'trades':>10} {'seleccion':>10} {'indice (s)':>11} {'pandas (s)':>11} {'consulta (s)':>13} {'speedup':>9}")
+    for n in sizes:
+        df = pp.preprocess_data(generate_trades(n))
+        df['cierre'] = (np.datetime64('2020-01-01T00:00:00') + np.arange(n) * 60).astype(pp.TIMESTAMP_DTYPE)
+        filters = _benchmark_filters(df)
+
+        index, build_time = _timed(qy.TradeIndex, df)
+        reference, pandas_time = _timed(_filter_pandas, df, filters)
+        view, query_time = _timed(index.take, df, filters)
+        pd.testing.assert_frame_equal(view, reference)
+        assert len(view) > 0, f"Los filtros no seleccionan ningún trade con {n} trades: {filters}"
+        print(f"{n:>10} {len(view):>10} {build_time:>11.3f} {pandas_time:>11.4f} {query_time:>13.4f} "
+              f"{pandas_time / query_time:>8.1f}x")
+
+# --- Suite con Umbrales de Regresión ---
+
+SUITE_STAGES = ['_load_json_data', '_load_trades_journal', 'preprocess_data', 'decode_journals',
+                'calculate_key_metrics', 'analyze_confirmations', 'add_trade', 'treeview']
+# add_trade se mide como el promedio de varias escrituras (cada una hace fsync)
+SUITE_ADD_TRADES = 20
+# Filas de la ventana visible que se cargan en el Treeview
+SUITE_TREEVIEW_ROWS = 40
+# Diferencias menores a esto respecto de la base se consideran ruido de medición
+MIN_REGRESSION_SECONDS = 0.01
+
+def _concurrent_writer(data_dir: str, worker: int, threads: int, trades_per_thread: int,
+                       group_commit: bool, results):
+    """
+    Proceso de la prueba de concurrencia: `threads` hilos agregan trades uno por
+    uno (cada uno con su fsync, como desde la UI) y además se agregan
+    confirmaciones, algunas con el mismo nombre en todos los procesos.
+    """
+    os.chdir(data_dir)
+    dl.JOURNAL_GROUP_COMMIT = group_commit
+
+    def insert(thread: int):
+        for i in range(trades_per_thread):
+            dl.add_trade({dl.TRADE_ID_FIELD: f"{worker}-{thread}-{i}", "activo": "EURUSD", "accion": "Compra",
+                          "ganancia/perdida": 1.0, "tipo entrada": "Breakout", "mejorar": "N/A",
+                          "confirmaciones": {}})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        workers = [threading.Thread(target=insert, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for i in range(5):
+            dl.add_confirmation({'nombre': f"compartida{i}", 'descripcion': ""})
+            dl.add_confirmation({'nombre': f"proceso{worker}-{i}", 'descripcion': ""})
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+    committer = dl._journal_committers.get(os.path.abspath(dl.TRADES_FILE))
+    results.put({'segundos': elapsed, 'lotes': committer.batches if committer else threads * trades_per_thread})
+
+def _verify_concurrent_data(data_dir: str, processes: int, threads: int, trades_per_thread: int):
+    """Comprueba que no se perdió ni duplicó ningún trade ni confirmación."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        trades = dl._load_trades_journal(os.path.join(data_dir, dl.TRADES_FILE))
+        confirmations = dl._load_json_data(os.path.join(data_dir, dl.CONFIRMATIONS_FILE))
+    expected = {f"{w}-{t}-{i}" for w in range(processes) for t in range(threads) for i in range(trades_per_thread)}
+    tickets = [trade[dl.TRADE_ID_FIELD] for trade in trades]
+    assert len(tickets) == len(expected) and set(tickets) == expected, \
+        f"journal con {len(tickets)} trades ({len(set(tickets))} distintos), se esperaban {len(expected)}"
+    names = [conf['nombre'] for conf in confirmations]
+    expected_names = {f"compartida{i}" for i in range(5)} | {f"proceso{w}-{i}" for w in range(processes) for i in range(5)}
+    assert len(names) == len(expected_names) and set(names) == expected_names, \
+        f"{len(names)} confirmaciones, se esperaban {len(expected_names)}"
+
+def bench_concurrency(process_counts: List[int], threads: int, trades_per_thread: int, group_commit: bool,
+                      compactions: int):
+    """
+    Varios procesos, cada uno con varios hilos, escriben a la vez en el mismo
+    directorio de datos; mientras tanto el proceso principal compacta el journal.
+    Al final se verifica que estén todos los trades y confirmaciones, una sola vez.
+    """
+    print(f"{'procesos':>9} {'hilos':>6} {'trades':>8} {'tiempo (s)':>11} {'trades/s':>9} {'fsync':>7}")
+    context = multiprocessing.get_context("spawn")
+    for processes in process_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = context.Queue()
+            workers = [context.Process(target=_concurrent_writer,
+                                       args=(tmp, w, threads, trades_per_thread, group_commit, results))
+                       for w in range(processes)]
+            for p in workers:
+                p.start()
+            journal = os.path.join(tmp, dl.TRADES_FILE)
+            for _ in range(compactions):
+                time.sleep(0.05)
+                if os.path.exists(journal):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        dl.compact_trades_journal(journal)
+            stats = [results.get() for _ in workers]
+            for p in workers:
+                p.join()
+                assert p.exitcode == 0, f"un proceso escritor terminó con código {p.exitcode}"
+            _verify_concurrent_data(tmp, processes, threads, trades_per_thread)
+
+        total = processes * threads * trades_per_thread
+        elapsed = max(stat['segundos'] for stat in stats)
+        fsyncs = sum(stat['lotes'] for stat in stats)
+        print(f"{processes:>9} {threads:>6} {total:>8} {elapsed:>11.2f} {total / elapsed:>9.0f} {fsyncs:>7}")
+
+def _measure(func, repeats: int, measure_memory: bool):
+    """
+    Ejecuta func: el tiempo es el mínimo de `repeats` corridas y la memoria pico
+    (MB asignados por encima de lo ya ocupado) sale de una corrida extra con tracemalloc.
+    """
+    seconds = []
+    result = None
+    for _ in range(repeats):
+        result = None # Liberar el resultado anterior antes de medir
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if measure_memory:
+        result = None
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peak_mb = (tracemalloc.get_traced_memory()[1] - baseline) / 2**20
+        tracemalloc.stop()
+    return result, min(seconds), peak_mb
+
+def _silent(func, *args):
+    """Ejecuta func sin los mensajes que imprime en consola."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+def _headless_treeview():
+    """Raíz Tk oculta con un Treeview si hay pantalla; None en un entorno sin pantalla."""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception:
+        return None
+    root.withdraw()
+    return ttk.Treeview(root, show='headings')
+
+def _populate_treeview(df_trades: pd.DataFrame, tree) -> tt.TradeTableModel:
+    """Lo que hace la pestaña 'Consultar Trades': arma el modelo virtual y carga la ventana visible."""
+    model = tt.TradeTableModel(df_trades)
+    rows = model.rows(0, SUITE_TREEVIEW_ROWS)
+    if tree is not None:
+        tree.delete(*tree.get_children())
+        tree['columns'] = model.display_columns
+        for values in rows:
+            tree.insert("", "end", values=values)
+    return model
+
+def run_suite(sizes: List[int], n_assets: int, n_confirmations: int, repeats: int,
+              measure_memory: bool = True, seed: int = 0) -> Dict[str, Any]:
+    """Mide cada etapa de SUITE_STAGES para cada tamaño sobre un journal sintético en un directorio temporal."""
+    results = []
+    tree = _headless_treeview()
+    cwd = os.getcwd()
+
+    def record(n: int, stage: str, func):
+        try:
+            value, seconds, peak_mb = _measure(func, repeats, measure_memory)
+        except MemoryError:
+            results.append({'tamano': n, 'etapa': stage, 'error': "MemoryError"})
+            print(f"{n:>10} {stage:>22} {'sin memoria':>12}")
+            return None
+        results.append({'tamano': n, 'etapa': stage, 'segundos': seconds, 'memoria_mb': peak_mb})
+        memory = f"{peak_mb:>14.1f}" if peak_mb is not None else f"{'-':>14}"
+        print(f"{n:>10} {stage:>22} {seconds:>12.4f} {memory}", flush=True)
+        return value
+
+    print(f"{'trades':>10} {'etapa':>22} {'tiempo (s)':>12} {'memoria (MB)':>14}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = os.path.join(tmp, dl.DATA_DIR)
+            os.makedirs(data_dir)
+            journal, legacy = write_synthetic_journal(data_dir, n, seed=seed, n_assets=n_assets,
+                                                      n_confirmations=n_confirmations)
+            record(n, '_load_json_data', lambda: len(dl._load_json_data(legacy)))
+            trades = record(n, '_load_trades_journal', lambda: dl._load_trades_journal(journal))
+            if trades is None:
+                continue
+            df = record(n, 'preprocess_data', lambda: _silent(pp.preprocess_data, trades))
+            del trades
+            record(n, 'decode_journals', lambda: _silent(dl.decode_journals, [journal]).to_frame())
+            if df is None:
+                continue
+            record(n, 'calculate_key_metrics', lambda: an.calculate_key_metrics(df))
+            record(n, 'analyze_confirmations', lambda: an.analyze_confirmations(df))
+
+            new_trades = generate_realistic_trades(SUITE_ADD_TRADES, n_assets, n_confirmations, seed=seed + n, first=n)
+            def add_trades():
+                # data_loader usa rutas relativas a 'data/'
+                os.chdir(tmp)
+                try:
+                    for trade in new_trades:
+                        _silent(dl.add_trade, trade)
+                finally:
+                    os.chdir(cwd)
+            # Se registra el tiempo promedio por trade, no el del lote
+            before = len(results)
+            record(n, 'add_trade', add_trades)
+            if len(results) > before and 'segundos' in results[-1]:
+                results[-1]['segundos'] /= SUITE_ADD_TRADES
+
+            record(n, 'treeview', lambda: _populate_treeview(df, tree))
+            del df
+
+    if tree is not None:
+        tree.winfo_toplevel().destroy()
+    return {
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                    'plataforma': platform.platform(), 'cpus': os.cpu_count(), 'treeview_real': tree is not None},
+        'parametros': {'activos': n_assets, 'confirmaciones': n_confirmations, 'repeticiones': repeats, 'semilla': seed},
+        'resultados': results,
+    }
+
+def check_thresholds(report: Dict[str, Any], thresholds: Dict[str, Any] = None,
+                     base: Dict[str, Any] = None, tolerance: float = None) -> List[str]:
+    """
+    Compara los resultados contra los límites absolutos de `thresholds`
+    ({'limites': {etapa: {tamaño: {'segundos': s, 'memoria_mb': mb}}}}) y, si se
+    pasa una corrida base, contra sus tiempos y memoria con la tolerancia relativa.
+    Retorna la lista de regresiones encontradas.
+    """
+    limits = (thresholds or {}).get('limites', {})
+    base_results = {(r['tamano'], r['etapa']): r for r in (base or {}).get('resultados', []) if 'error' not in r}
+    regressions = []
+    for result in report['resultados']:
+        n, stage = result['tamano'], result['etapa']
+        if 'error' in result:
+            regressions.append(f"{stage} con {n} trades: {result['error']}")
+            continue
+        for metric, unit in (('segundos', 's'), ('memoria_mb', 'MB')):
+            value = result.get(metric)
+            if value is None:
+                continue
+            limit = limits.get(stage, {}).get(str(n), {}).get(metric)
+            if limit is not None and value > limit:
+                regressions.append(f"{stage} con {n} trades: {value:.4f} {unit} supera el límite de {limit} {unit}")
+            previous = base_results.get((n, stage), {}).get(metric)
+            if tolerance is not None and previous is not None:
+                allowed = previous * (1 + tolerance)
+                if value > allowed and (metric != 'segundos' or value - previous > MIN_REGRESSION_SECONDS):
+                    regressions.append(f"{stage} con {n} trades: {value:.4f} {unit} vs {previous:.4f} {unit} "
+                                       f"de la base (+{(value / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def bench_suite(args) -> int:
+    """Corre la suite, guarda el JSON de resultados y retorna 1 si hubo regresiones."""
+    thresholds = None
+    if args.umbrales:
+        with open(args.umbrales, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+    base = None
+    if args.base:
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+    tolerance = args.tolerancia if args.tolerancia is not None else (thresholds or {}).get('tolerancia')
+
+    report = run_suite(args.tamanos, args.activos, args.confirmaciones, args.repeticiones,
+                       measure_memory=not args.sin_memoria, seed=args.semilla)
+    report['umbrales'] = {'archivo': args.umbrales, 'base': args.base, 'tolerancia': tolerance}
+    report['regresiones'] = check_thresholds(report, thresholds, base, tolerance)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    for regression in report['regresiones']:
+        print(f"REGRESIÓN: {regression}", file=sys.stderr)
+    print(f"Resultados: {args.salida} ({len(report['regresiones'])} regresiones)")
+    return 1 if report['regresiones'] else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de análisis de trades.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    expansion = subparsers.add_parser("expansion", help="Expansión del campo 'confirmaciones'.")
+    expansion.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    expansion.add_argument("--omitir-original-desde", type=int, default=None,
+                           help="No ejecutar la versión original por encima de este tamaño.")
+
+    confirmaciones = subparsers.add_parser("confirmaciones", help="analyze_confirmations.")
+    confirmaciones.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    confirmaciones.add_argument("--confirmaciones", type=int, default=24)
+    confirmaciones.add_argument("--omitir-original-desde", type=int, default=None,
+                                help="No ejecutar la versión original por encima de este tamaño.")
+
+    metricas = subparsers.add_parser("metricas", help="Refresco de calculate_key_metrics tras un trade.")
+    metricas.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+
+    tabla = subparsers.add_parser("tabla", help="Tabla virtual de 'Consultar Trades'.")
+    tabla.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    tabla.add_argument("--omitir-original-desde", type=int, default=None,
+                       help="No ejecutar la versión original por encima de este tamaño.")
+
+    inicio = subparsers.add_parser("inicio", help="Tiempo de arranque de la aplicación (requiere pantalla).")
+    inicio.add_argument("--repeticiones", type=int, default=5)
+
+    snapshot = subparsers.add_parser("snapshot", help="Carga desde el snapshot columnar vs journal JSON.")
+    snapshot.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+
+    importacion = subparsers.add_parser("importacion", help="Importación masiva de un CSV de broker.")
+    importacion.add_argument("--tamanos", type=int, nargs="+", default=[1_000_000])
+    importacion.add_argument("--bloque", type=int, default=im.DEFAULT_CHUNK_ROWS)
+
+    memoria = subparsers.add_parser("memoria", help="Memoria por trade: DataFrame normal vs forma compacta.")
+    memoria.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    memoria.add_argument("--confirmaciones", type=int, nargs="+", default=[12, 100])
+
+    combinaciones = subparsers.add_parser("combinaciones", help="Combinaciones frecuentes de confirmaciones.")
+    combinaciones.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    combinaciones.add_argument("--confirmaciones", type=int, default=24)
+    combinaciones.add_argument("--tamano-maximo", type=int, default=an.COMBINATION_MAX_SIZE)
+    combinaciones.add_argument("--soporte-minimo", type=float, default=an.COMBINATION_MIN_SUPPORT)
+    combinaciones.add_argument("--omitir-original-desde", type=int, default=None,
+                               help="No ejecutar la versión ingenua por encima de este tamaño.")
+
+    curva = subparsers.add_parser("curva", help="Curva de capital, drawdown y estadísticas móviles.")
+    curva.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+
+    filtros = subparsers.add_parser("filtros", help="Filtrado del journal con índices invertidos.")
+    filtros.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+
+    concurrencia = subparsers.add_parser("concurrencia", help="Escritores concurrentes en varios procesos (sin pérdidas).")
+    concurrencia.add_argument("--procesos", type=int, nargs="+", default=[1, 4, 8])
+    concurrencia.add_argument("--hilos", type=int, default=8, help="Hilos escritores por proceso.")
+    concurrencia.add_argument("--trades", type=int, default=200, help="Trades por hilo.")
+    concurrencia.add_argument("--compactaciones", type=int, default=3,
+                              help="Compactaciones del journal durante la prueba.")
+    concurrencia.add_argument("--sin-grupo", action="store_true", help="Un fsync por trade (sin group commit).")
+
+    particiones = subparsers.add_parser("particiones", help="Journal particionado por cuenta y mes.")
+    particiones.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    particiones.add_argument("--cuentas", type=int, default=4)
+    particiones.add_argument("--procesos", type=int, default=None, help="Procesos para la carga en paralelo.")
+
+    decodificacion = subparsers.add_parser("decodificacion", help="Lista de diccionarios vs decodificación a columnas.")
+    decodificacion.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+
+    suite = subparsers.add_parser("suite", help="Suite completa con resultados en JSON y umbrales de regresión.")
+    suite.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                       help="Tamaños del journal (p. ej. 10000 100000 1000000 10000000).")
+    suite.add_argument("--activos", type=int, default=60)
+    suite.add_argument("--confirmaciones", type=int, default=40)
+    suite.add_argument("--repeticiones", type=int, default=1, help="Se reporta el tiempo mínimo.")
+    suite.add_argument("--semilla", type=int, default=0)
+    suite.add_argument("--sin-memoria", action="store_true", help="No medir la memoria pico (más rápido).")
+    suite.add_argument("--salida", default="benchmark_resultados.json")
+    suite.add_argument("--umbrales", default=None, help="JSON con límites por etapa y tamaño (ver benchmark_umbrales.json).")
+    suite.add_argument("--base", default=None, help="Resultados de una corrida anterior para detectar regresiones.")
+    suite.add_argument("--tolerancia", type=float, default=None,
+                       help="Aumento relativo permitido respecto de la base (p. ej. 0.25).")
+
+    args = parser.parse_args()
+    if args.benchmark == "expansion":
+        bench_confirmation_expansion(args.tamanos, args.omitir_original_desde)
+    elif args.benchmark == "confirmaciones":
+        bench_confirmation_analysis(args.tamanos, args.confirmaciones, args.omitir_original_desde)
+    elif args.benchmark == "metricas":
+        bench_key_metrics(args.tamanos)
+    elif args.benchmark == "tabla":
+        bench_trade_table(args.tamanos, skip_legacy_above=args.omitir_original_desde)
+    elif args.benchmark == "inicio":
+        bench_startup(args.repeticiones)
+    elif args.benchmark == "snapshot":
+        bench_snapshot(args.tamanos)
+    elif args.benchmark == "importacion":
+        bench_import(args.tamanos, args.bloque)
+    elif args.benchmark == "memoria":
+        bench_compact_memory(args.tamanos, args.confirmaciones)
+    elif args.benchmark == "combinaciones":
+        bench_combinations(args.tamanos, args.confirmaciones, args.tamano_maximo, args.soporte_minimo,
+                           args.omitir_original_desde)
+    elif args.benchmark == "curva":
+        bench_equity_curve(args.tamanos)
+    elif args.benchmark == "filtros":
+        bench_filters(args.tamanos)
+    elif args.benchmark == "concurrencia":
+        bench_concurrency(args.procesos, args.hilos, args.trades, not args.sin_grupo, args.compactaciones)
+    elif args.benchmark == "particiones":
+        bench_partitions(args.tamanos, args.cuentas, args.procesos)
+    elif args.benchmark == "decodificacion":
+        bench_decoding(args.tamanos)
+    elif args.benchmark == "suite":
+        sys.exit(bench_suite(args))
+
+if __name__ == "__main__":
+    main()
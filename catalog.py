@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de catálogos: confirmaciones y mejoras en memoria, indexadas por nombre.
+
+Los catálogos se leen una vez (la primera vez que se usan) y quedan en
+diccionarios nombre -> registro, que conservan el orden del archivo. Las
+búsquedas y los duplicados se resuelven en O(1) sin leer el disco; un alta
+solo escribe el registro nuevo (ver data_loader.add_confirmation).
+Quien necesite enterarse de las altas (la UI) se suscribe con subscribe(), así
+que editar un catálogo nunca recarga ni reprocesa los trades.
+"""
+import threading
+from typing import Any, Callable, Dict, List
+
+# Tipos de catálogo (mismas claves que load_all_data / load_catalogs)
+CONFIRMATIONS = 'confirmations'
+IMPROVEMENTS = 'improvements'
+# Valor de 'mejorar' que se acepta aunque no esté en el catálogo (trade sin mejora)
+NO_IMPROVEMENT = "N/A"
+
+class CatalogService:
+    """
+    Catálogos indexados por 'nombre', con altas O(1) y notificaciones de cambios.
+
+    Es seguro usarlo desde el hilo de Tk y desde el hilo de análisis (que lo
+    recarga junto con los datos). Los suscriptores se llaman en el hilo que hizo el alta.
+    """
+    def __init__(self, load_catalogs: Callable[[], Dict[str, List[Dict[str, Any]]]],
+                 save_confirmation: Callable[[Dict[str, Any]], None],
+                 save_improvement: Callable[[Dict[str, Any]], None]):
+        self._load_catalogs = load_catalogs
+        self._save = {CONFIRMATIONS: save_confirmation, IMPROVEMENTS: save_improvement}
+        # tipo -> {nombre: registro}; None hasta la primera carga
+        self._index: Dict[str, Dict[str, Dict[str, Any]]] = None
+        self._subscribers: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._lock = threading.RLock()
+
+    def _catalog(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if self._index is None:
+                self.replace(self._load_catalogs())
+            return self._index[kind]
+
+    def replace(self, catalogs: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Reemplaza los índices con catálogos ya cargados (p. ej. los de load_all_data) y los retorna."""
+        index = {kind: {record['nombre']: record for record in catalogs.get(kind, [])}
+                 for kind in (CONFIRMATIONS, IMPROVEMENTS)}
+        with self._lock:
+            self._index = index
+        return catalogs
+
+    def reload(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Vuelve a leer los catálogos del almacenamiento (p. ej. en una recarga completa)."""
+        return self.replace(self._load_catalogs())
+
+    def catalogs(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Ambos catálogos como listas, en el formato de load_catalogs."""
+        return {CONFIRMATIONS: self.confirmations(), IMPROVEMENTS: self.improvements()}
+
+    def confirmations(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._catalog(CONFIRMATIONS).values())
+
+    def improvements(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._catalog(IMPROVEMENTS).values())
+
+    def get(self, kind: str, name: str) -> Dict[str, Any]:
+        """Registro del catálogo con ese nombre, o None."""
+        with self._lock:
+            return self._catalog(kind).get(name)
+
+    def has_improvement(self, name: str) -> bool:
+        return self.get(IMPROVEMENTS, name) is not None
+
+    def add(self, kind: str, record: Dict[str, Any]) -> bool:
+        """
+        Agrega un registro si su nombre no existe: lo guarda, lo indexa y avisa a
+        los suscriptores. Retorna False (sin escribir nada) si ya existía.
+        """
+        with self._lock:
+            catalog = self._catalog(kind)
+            if record['nombre'] in catalog:
+                return False
+            self._save[kind](record)
+            # Se reemplaza el diccionario: las listas ya entregadas a otros hilos no cambian
+            self._index = {**self._index, kind: {**catalog, record['nombre']: record}}
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(kind, record)
+        return True
+
+    def add_confirmation(self, record: Dict[str, Any]) -> bool:
+        return self.add(CONFIRMATIONS, record)
+
+    def add_improvement(self, record: Dict[str, Any]) -> bool:
+        return self.add(IMPROVEMENTS, record)
+
+    def validate_improvement(self, name: str):
+        """Lanza ValueError si `name` no es una mejora del catálogo (ni NO_IMPROVEMENT)."""
+        if name != NO_IMPROVEMENT and not self.has_improvement(name):
+            raise ValueError(f"La mejora '{name}' no está en el catálogo de mejoras.")
+
+    def subscribe(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """Registra callback(tipo, registro), que se llama después de cada alta."""
+        with self._lock:
+            self._subscribers.append(callback)
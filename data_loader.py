@@ -1,14 +1,34 @@
 # -*- coding: utf-8 -*-
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from typing import Callable, Iterator, List, Dict, Any, Set, Tuple, TYPE_CHECKING
+
+import locking
+from trade_record import Trade, TradeDecoder
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Definición de las rutas de los archivos JSON
 DATA_DIR = "data"
-TRADES_FILE = os.path.join(DATA_DIR, "movimientos.json")
+# El journal de trades es append-only en formato JSON Lines (un trade por línea).
+TRADES_FILE = os.path.join(DATA_DIR, "movimientos.jsonl")
+# Formato anterior (arreglo JSON completo); se migra automáticamente al journal.
+LEGACY_TRADES_FILE = os.path.join(DATA_DIR, "movimientos.json")
 CONFIRMATIONS_FILE = os.path.join(DATA_DIR, "confirmaciones.json")
 IMPROVEMENTS_FILE = os.path.join(DATA_DIR, "mejoras.json")
 ACTIVOS = os.path.join(DATA_DIR, "activos.json")
+# Caché en disco de resultados del pipeline (ver analysis_cache.py)
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+# Journal particionado por cuenta y mes (ver partitions.py)
+PARTITIONS_DIR = os.path.join(DATA_DIR, "particiones")
+# Campo con el identificador del trade en el broker (p. ej. el ticket de MetaTrader)
+TRADE_ID_FIELD = "ticket"
+# Archivos cuyo contenido determina los resultados del análisis
+DATA_FILES = [TRADES_FILE, LEGACY_TRADES_FILE, CONFIRMATIONS_FILE, IMPROVEMENTS_FILE]
+# Agrupar las escrituras concurrentes al journal en un solo fsync (ver locking.GroupCommit)
+JOURNAL_GROUP_COMMIT = True
 
 def _initialize_data_directory():
     """Asegura que el directorio de datos exista."""
@@ -17,7 +37,11 @@ def _initialize_data_directory():
         print(f"Directorio creado: {DATA_DIR}")
 
 def _load_json_data(filepath: str) -> List[Dict[str, Any]]:
-    """Función helper para cargar datos de un archivo JSON."""
+    """
+    Función helper para cargar datos de un archivo JSON. Un archivo corrupto
+    lanza ValueError en lugar de leerse como vacío: la siguiente escritura lo
+    reemplazaría y se perderían sus datos.
+    """
     if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
         print(f"Advertencia: Archivo {filepath} no encontrado o vacío. Inicializando con lista vacía.")
         return []
@@ -25,55 +49,364 @@ def _load_json_data(filepath: str) -> List[Dict[str, Any]]:
     with open(filepath, 'r', encoding='utf-8') as f:
         try:
             return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Error: El archivo {filepath} no tiene un formato JSON válido.")
-            return []
+        except json.JSONDecodeError as e:
+            raise ValueError(f"El archivo {filepath} no tiene un formato JSON válido: {e}") from e
 
 def _save_json_data(filepath: str, data: List[Dict[str, Any]]):
-    """Función helper para guardar datos en un archivo JSON."""
+    """Función helper para guardar datos en un archivo JSON (con el candado y reemplazo atómico)."""
     _initialize_data_directory() # Asegurar la existencia antes de guardar
-    with open(filepath, 'w', encoding='utf-8') as f:
-        # Uso de indent para que el archivo sea legible
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
-def load_all_data() -> Dict[str, List[Dict[str, Any]]]:
-    """Carga los tres datasets principales del proyecto."""
-    data = {
-        'trades': _load_json_data(TRADES_FILE),
+    with locking.file_lock(filepath):
+        _write_json_data(filepath, data)
+
+def _write_json_data(filepath: str, data: List[Dict[str, Any]]):
+    # Uso de indent para que el archivo sea legible
+    locking.atomic_write(filepath, json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8'))
+
+def _update_json_data(filepath: str, update: Callable[[List[Dict[str, Any]]], bool]) -> bool:
+    """
+    Lee, modifica y guarda un archivo JSON con el candado tomado, así dos
+    procesos no pisan sus cambios. update(datos) modifica la lista y retorna
+    True si hay que guardarla.
+    """
+    _initialize_data_directory()
+    with locking.file_lock(filepath):
+        data = _load_json_data(filepath)
+        changed = update(data)
+        if changed:
+            _write_json_data(filepath, data)
+    return changed
+
+# --- Journal de Trades (JSON Lines) ---
+
+def _migrate_legacy_trades():
+    """
+    Convierte el antiguo movimientos.json (arreglo JSON) al journal JSON Lines.
+
+    Solo actúa si existe el archivo antiguo y todavía no existe el journal. El
+    archivo original se conserva renombrado con el sufijo '.migrado'.
+    """
+    if os.path.exists(TRADES_FILE) or not os.path.exists(LEGACY_TRADES_FILE):
+        return
+    with locking.file_lock(TRADES_FILE):
+        # Otro proceso pudo migrar mientras se esperaba el candado
+        if not os.path.exists(TRADES_FILE) and os.path.exists(LEGACY_TRADES_FILE):
+            _migrate_legacy_trades_locked()
+
+def _migrate_legacy_trades_locked():
+    if os.path.getsize(LEGACY_TRADES_FILE) == 0:
+        os.remove(LEGACY_TRADES_FILE)
+        return
+
+    with open(LEGACY_TRADES_FILE, 'r', encoding='utf-8') as f:
+        try:
+            trades = json.load(f)
+        except json.JSONDecodeError:
+            # No se migra un archivo corrupto: se deja intacto para revisión manual
+            print(f"Error: El archivo {LEGACY_TRADES_FILE} no tiene un formato JSON válido. No se migró.")
+            return
+
+    _write_trades_journal(trades)
+    os.replace(LEGACY_TRADES_FILE, LEGACY_TRADES_FILE + ".migrado")
+    print(f"Trades migrados a {TRADES_FILE} ({len(trades)} registros).")
+
+def _write_trades_journal(trades: List[Dict[str, Any]], filepath: str = None):
+    """
+    Reescribe el journal completo de forma atómica (archivo temporal + replace).
+    No toma el candado: si otros procesos pueden estar escribiendo, quien llama debe tenerlo.
+    """
+    filepath = filepath or TRADES_FILE
+    _initialize_data_directory()
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for trade in trades:
+            f.write(json.dumps(trade, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+    locking.fsync_directory(filepath)
+
+def _parse_journal(filepath: str, torn_tail: bool = False) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """
+    Trades válidos y líneas inválidas (número, texto) del journal. Una última
+    línea sin salto de línea que no es JSON válido se ignora sin contarla como
+    inválida: puede ser la escritura en curso de otro proceso. Con
+    torn_tail=True (quien llama tiene el candado, así que nadie está
+    escribiendo) esa línea es un registro cortado y se cuenta como inválida.
+    """
+    trades = []
+    invalid_lines = []
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                trades.append(json.loads(line))
+            except json.JSONDecodeError:
+                if line.endswith("\n"):
+                    invalid_lines.append((line_number, line))
+                elif torn_tail:
+                    invalid_lines.append((line_number, line + "\n"))
+    return trades, invalid_lines
+
+def _load_trades_journal(filepath: str = None) -> List[Dict[str, Any]]:
+    """
+    Lee el journal JSON Lines de trades.
+
+    Las líneas vacías se ignoran. Las líneas inválidas (p. ej. una escritura
+    interrumpida) se reportan y disparan una compactación del journal.
+    """
+    filepath = filepath or TRADES_FILE
+    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
+        print(f"Advertencia: Archivo {filepath} no encontrado o vacío. Inicializando con lista vacía.")
+        return []
+
+    trades, invalid_lines = _parse_journal(filepath)
+    if invalid_lines:
+        print(f"Advertencia: {len(invalid_lines)} línea(s) inválida(s) en {filepath} "
+              f"(líneas {', '.join(str(n) for n, _ in invalid_lines)}).")
+        trades = compact_trades_journal(filepath)
+    return trades
+
+def compact_trades_journal(filepath: str = None) -> List[Dict[str, Any]]:
+    """
+    Compacta el journal: lo reescribe solo con registros válidos y sin líneas vacías.
+
+    Es una reparación: se ejecuta cuando la carga encuentra JSON inválido (o a
+    pedido). El journal solo recibe appends, sin registros reemplazados ni
+    borrados, así que no hay nada más que recuperar compactándolo periódicamente.
+
+    Se relee con el candado tomado, para no perder los trades que otro proceso
+    agregó después de la última lectura. Las líneas inválidas no se descartan:
+    se anexan a '<journal>.rechazados' para poder recuperarlas manualmente,
+    incluida una última línea cortada (con el candado tomado no puede ser una
+    escritura en curso). Retorna los trades válidos.
+    """
+    filepath = filepath or TRADES_FILE
+    with locking.file_lock(filepath):
+        trades, invalid_lines = _parse_journal(filepath, torn_tail=True)
+        if invalid_lines:
+            with open(filepath + ".rechazados", 'a', encoding='utf-8') as f:
+                for _, line in invalid_lines:
+                    f.write(line)
+        _write_trades_journal(trades, filepath)
+    print(f"Journal compactado: {filepath} ({len(trades)} registros).")
+    return trades
+
+def decode_journals(paths: List[str], keep_records: bool = False, compact: bool = True,
+                    fill_columns: bool = True) -> TradeDecoder:
+    """
+    Decodifica uno o más journals (en orden) a columnas validadas, sin pasar por
+    la lista de diccionarios. Un journal con JSON inválido se compacta como en
+    _load_trades_journal y se vuelve a decodificar. Los trades que no pasan la
+    validación se reportan con su archivo y línea (y quedan en decoder.rejected).
+    Con keep_records=True los trades válidos quedan además en decoder.records
+    (y con fill_columns=False solo ahí, sin armar las columnas).
+
+    Con compact=False los journals solo se leen (p. ej. desde el reporte, que
+    no debe reescribir los datos de otras cuentas): las líneas con JSON
+    inválido se omiten y quedan en decoder.rejected como los demás rechazos.
+    """
+    decoder = TradeDecoder(keep_records, fill_columns)
+    for path in paths:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        checkpoint = decoder.checkpoint()
+        json_errors = decoder.decode_file(path)
+        if json_errors and compact:
+            print(f"Advertencia: {json_errors} línea(s) inválida(s) en {path}.")
+            compact_trades_journal(path)
+            decoder.rollback(checkpoint)
+            decoder.decode_file(path)
+    decoder.warn()
+    return decoder
+
+def decode_legacy_trades(filepath: str, keep_records: bool = False, fill_columns: bool = True) -> TradeDecoder:
+    """
+    Como decode_journals, para un movimientos.json antiguo (lista JSON). Los
+    rechazos se numeran por la posición del trade en la lista.
+    """
+    decoder = TradeDecoder(keep_records, fill_columns)
+    decoder.decode_records(_load_json_data(filepath), filepath)
+    decoder.warn()
+    return decoder
+
+def load_all_data(data_dir: str = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Carga los tres datasets principales del proyecto.
+
+    Los trades pasan por la misma validación que decode_journals (y que el
+    snapshot, las particiones y el backend SQLite): los inválidos se reportan
+    con su línea y no se incluyen.
+
+    data_dir permite leer otro directorio con la misma estructura (p. ej. el de
+    otra cuenta); en ese caso no se migra el movimientos.json antiguo, se lee tal cual.
+    """
+    if data_dir is None:
+        return {
+            'trades': _decode_trades(data_dir, records_only=True).records,
+            'confirmations': _load_json_data(CONFIRMATIONS_FILE),
+            'improvements': _load_json_data(IMPROVEMENTS_FILE)
+        }
+    return {
+        'trades': _decode_trades(data_dir, records_only=True).records,
+        'confirmations': _load_json_data(os.path.join(data_dir, os.path.basename(CONFIRMATIONS_FILE))),
+        'improvements': _load_json_data(os.path.join(data_dir, os.path.basename(IMPROVEMENTS_FILE)))
+    }
+
+def load_trades_frame(data_dir: str = None) -> 'pd.DataFrame':
+    """
+    DataFrame preprocesado de los trades (mismo esquema que preprocess_data),
+    decodificado una sola vez desde el journal: no se arman los diccionarios
+    para después volver a preprocesarlos. data_dir como en load_all_data.
+    """
+    return _decode_trades(data_dir).to_frame()
+
+def _decode_trades(data_dir: str = None, records_only: bool = False) -> TradeDecoder:
+    """
+    Decodifica el journal del directorio (o el movimientos.json antiguo de otro
+    directorio). Con records_only=True solo se arman los diccionarios (decoder.records).
+    """
+    options = {'keep_records': records_only, 'fill_columns': not records_only}
+    if data_dir is None:
+        _migrate_legacy_trades()
+        return decode_journals([TRADES_FILE], **options)
+    journal = os.path.join(data_dir, os.path.basename(TRADES_FILE))
+    if os.path.exists(journal):
+        return decode_journals([journal], **options)
+    return decode_legacy_trades(os.path.join(data_dir, os.path.basename(LEGACY_TRADES_FILE)), **options)
+
+def load_catalogs() -> Dict[str, List[Dict[str, Any]]]:
+    """Carga solo los catálogos (confirmaciones y mejoras), sin el journal de trades."""
+    return {
         'confirmations': _load_json_data(CONFIRMATIONS_FILE),
         'improvements': _load_json_data(IMPROVEMENTS_FILE)
     }
-    return data
 
 # --- Lógica de Persistencia y Agregación (CRUD) ---
 
+# Un GroupCommit por journal (ruta absoluta): los hilos del proceso comparten los fsync
+_journal_committers: Dict[str, locking.GroupCommit] = {}
+_journal_committers_lock = threading.Lock()
+
+def _write_journal_batch(filepath: str, payloads: List[bytes]):
+    """
+    Agrega varios bloques de líneas al journal con el candado tomado, en una
+    sola escritura. El fsync se hace después de soltar el candado, así otros
+    procesos pueden agregar mientras tanto (y un fsync posterior cubre también
+    sus datos).
+    """
+    with locking.file_lock(filepath):
+        with open(filepath, 'a+b') as f:
+            payload = b"".join(payloads)
+            # Si una escritura anterior quedó a medias, cerrar esa línea para no
+            # pegar el nuevo registro a un fragmento inválido.
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    payload = b"\n" + payload
+            f.write(payload)
+            f.flush()
+            fd = os.dup(f.fileno())
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _journal_committer(filepath: str) -> locking.GroupCommit:
+    key = os.path.abspath(filepath)
+    with _journal_committers_lock:
+        if key not in _journal_committers:
+            _journal_committers[key] = locking.GroupCommit(lambda payloads: _write_journal_batch(key, payloads))
+        return _journal_committers[key]
+
+def _append_to_journal(payload: bytes, filepath: str = None):
+    """
+    Agrega líneas ya serializadas al final del journal (o de otro archivo JSON
+    Lines, p. ej. una partición) y retorna cuando están persistidas. Con
+    JOURNAL_GROUP_COMMIT, las escrituras concurrentes de otros hilos se agrupan
+    en una sola escritura y un solo fsync.
+    """
+    if filepath is None:
+        _initialize_data_directory()
+        _migrate_legacy_trades()
+        filepath = TRADES_FILE
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    if JOURNAL_GROUP_COMMIT:
+        _journal_committer(filepath).submit(payload)
+    else:
+        _write_journal_batch(filepath, [payload])
+
 def add_trade(trade_data: Dict[str, Any]):
-    """Agrega un nuevo registro de trade y guarda el archivo."""
-    trades = _load_json_data(TRADES_FILE)
-    trades.append(trade_data)
-    _save_json_data(TRADES_FILE, trades)
+    """
+    Agrega un nuevo registro de trade al final del journal (una sola escritura O(1)).
+    Lanza InvalidTrade (sin escribir nada) si algún campo no es válido.
+    """
+    Trade.from_raw(trade_data)
+    _append_to_journal((json.dumps(trade_data, ensure_ascii=False) + "\n").encode('utf-8'))
     print(f"Trade agregado exitosamente: {trade_data.get('activo')}")
 
-def add_confirmation(conf_data: Dict[str, str]):
-    """Agrega una nueva confirmación al catálogo."""
-    confirmations = _load_json_data(CONFIRMATIONS_FILE)
-    # Evitar duplicados basados en el campo 'nombre'
-    if not any(c['nombre'] == conf_data['nombre'] for c in confirmations):
-        confirmations.append(conf_data)
-        _save_json_data(CONFIRMATIONS_FILE, confirmations)
+def add_trades(trades: List[Dict[str, Any]]):
+    """
+    Agrega un lote de trades al journal (una sola escritura para todo el lote).
+    Si alguno es inválido lanza InvalidTrade y no se escribe ninguno.
+    """
+    if not trades:
+        return
+    for trade in trades:
+        Trade.from_raw(trade)
+    _append_to_journal("".join(json.dumps(trade, ensure_ascii=False) + "\n" for trade in trades).encode('utf-8'))
+
+def iter_trade_ids(filepath: str = None) -> Iterator[str]:
+    """
+    Identificadores de broker (campo TRADE_ID_FIELD) de los trades del journal,
+    uno por uno (sin armar el conjunto completo en memoria). Lee el archivo
+    línea por línea y solo decodifica las líneas que tienen el campo.
+    """
+    filepath = filepath or TRADES_FILE
+    _migrate_legacy_trades()
+    if not os.path.exists(filepath):
+        return
+    marker = json.dumps(TRADE_ID_FIELD).encode('utf-8')
+    with open(filepath, 'rb') as f:
+        for line in f:
+            if marker not in line:
+                continue
+            try:
+                trade_id = json.loads(line).get(TRADE_ID_FIELD)
+            except (json.JSONDecodeError, AttributeError):
+                continue
+            if trade_id is not None:
+                yield str(trade_id)
+
+def load_trade_ids(filepath: str = None) -> Set[str]:
+    """Conjunto de los identificadores de broker de los trades del journal (ver iter_trade_ids)."""
+    return set(iter_trade_ids(filepath))
+
+def _add_to_catalog(filepath: str, record: Dict[str, str]) -> bool:
+    """Agrega un registro a un catálogo si su 'nombre' no existe (comprobado con el candado tomado)."""
+    def append_new(items: List[Dict[str, Any]]) -> bool:
+        # Evitar duplicados basados en el campo 'nombre'
+        if any(item['nombre'] == record['nombre'] for item in items):
+            return False
+        items.append(record)
+        return True
+    return _update_json_data(filepath, append_new)
+
+def add_confirmation(conf_data: Dict[str, str]) -> bool:
+    """Agrega una nueva confirmación al catálogo. Retorna False si ya existía."""
+    if _add_to_catalog(CONFIRMATIONS_FILE, conf_data):
         print(f"Confirmación agregada: {conf_data['nombre']}")
-    else:
-        print(f"Advertencia: La confirmación '{conf_data['nombre']}' ya existe.")
-
-def add_improvement(improv_data: Dict[str, str]):
-    """Agrega una nueva mejora al catálogo."""
-    improvements = _load_json_data(IMPROVEMENTS_FILE)
-    # Evitar duplicados basados en el campo 'nombre'
-    if not any(i['nombre'] == improv_data['nombre'] for i in improvements):
-        improvements.append(improv_data)
-        _save_json_data(IMPROVEMENTS_FILE, improvements)
+        return True
+    print(f"Advertencia: La confirmación '{conf_data['nombre']}' ya existe.")
+    return False
+
+def add_improvement(improv_data: Dict[str, str]) -> bool:
+    """Agrega una nueva mejora al catálogo. Retorna False si ya existía."""
+    if _add_to_catalog(IMPROVEMENTS_FILE, improv_data):
         print(f"Mejora agregada: {improv_data['nombre']}")
-    else:
-        print(f"Advertencia: La mejora '{improv_data['nombre']}' ya existe.")
+        return True
+    print(f"Advertencia: La mejora '{improv_data['nombre']}' ya existe.")
+    return False
 
 # Para inicialización y pruebas, se crearán archivos JSON de ejemplo en el siguiente paso.
\ No newline at end of file
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Importación masiva de historiales exportados por el broker (CSV tipo MetaTrader).
+
+El archivo se lee por bloques (memoria acotada por el tamaño del bloque), cada
+columna se mapea a los campos del trade y los registros ya importados se omiten
+por su ticket (ver TicketSet). Las filas sin una ganancia/pérdida numérica se rechazan y se
+reportan con su número de línea. Cada bloque se guarda con una sola escritura
+del backend.
+
+Uso:
+    python importer.py historial.csv
+    python importer.py historial.csv --almacenamiento sqlite --bloque 50000
+    python importer.py historial.csv --columna confirmaciones=Comment
+"""
+import argparse
+import csv
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import data_loader as dl
+from trade_record import MAX_REPORTED_REJECTED
+
+# Filas del CSV que se procesan (y guardan) por bloque
+DEFAULT_CHUNK_ROWS = 50_000
+# Tickets que se convierten juntos a int64 al cargar los ya guardados
+TICKET_BATCH = 65_536
+# Dígitos de un ticket entero que siempre entra en int64
+MAX_TICKET_DIGITS = 18
+# Línea del CSV de la primera fila de datos (la 1 es el encabezado)
+FIRST_DATA_LINE = 2
+# Nombres de columna reconocidos para cada campo del trade (sin distinguir mayúsculas)
+COLUMN_ALIASES = {
+    dl.TRADE_ID_FIELD: ['ticket', 'position', 'posición', 'posicion', 'order', 'orden', 'deal', 'id'],
+    'activo': ['activo', 'symbol', 'símbolo', 'simbolo', 'item'],
+    'accion': ['accion', 'acción', 'type', 'tipo', 'direction'],
+    'ganancia/perdida': ['ganancia/perdida', 'profit', 'beneficio', 'p/l', 'pnl'],
+    'tipo entrada': ['tipo entrada', 'setup', 'estrategia', 'strategy'],
+    'mejorar': ['mejorar', 'mejora'],
+    'confirmaciones': ['confirmaciones', 'tags', 'etiquetas'],
+    # En el historial de posiciones de MetaTrader las dos columnas se llaman 'Time' (pandas renombra la segunda)
+    'apertura': ['apertura', 'open time', 'fecha apertura', 'time'],
+    'cierre': ['cierre', 'close time', 'fecha cierre', 'time.1'],
+}
+# Columnas que se suman a la ganancia/pérdida si existen (resultado neto del trade)
+COST_ALIASES = ['commission', 'comisión', 'comision', 'swap', 'fee', 'fees']
+# Tipos de movimiento del estado de cuenta que no son trades
+NON_TRADE_ACTIONS = {'BALANCE', 'CREDIT', 'DEPOSIT', 'WITHDRAWAL'}
+# Separadores de la lista de confirmaciones dentro de una celda
+CONFIRMATION_SEPARATORS = [';', '|', ',']
+
+def _sniff_separator(filepath: str) -> str:
+    """Detecta el separador del CSV a partir de las primeras líneas."""
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ','
+
+def resolve_columns(header: Iterable[str], column_map: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Decide qué columna del CSV alimenta cada campo del trade.
+    column_map (campo -> columna) tiene prioridad sobre los alias conocidos.
+    """
+    by_name = {str(name).strip().lower(): name for name in header}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        if column_map and field in column_map:
+            mapping[field] = column_map[field]
+            continue
+        for alias in aliases:
+            if alias in by_name:
+                mapping[field] = by_name[alias]
+                break
+    if 'activo' not in mapping or 'ganancia/perdida' not in mapping:
+        raise ValueError("El CSV debe tener al menos las columnas de activo (p. ej. 'Symbol') "
+                         "y de ganancia/pérdida (p. ej. 'Profit').")
+    mapping['costos'] = [by_name[alias] for alias in COST_ALIASES if alias in by_name]
+    return mapping
+
+def _split_confirmations(cell: Any) -> Dict[str, bool]:
+    """Convierte 'hch; fuerza' en {'hch': True, 'fuerza': True}."""
+    if not isinstance(cell, str) or not cell.strip():
+        return {}
+    separator = next((sep for sep in CONFIRMATION_SEPARATORS if sep in cell), None)
+    names = cell.split(separator) if separator else [cell]
+    return {name.strip().lower(): True for name in names if name.strip()}
+
+class TicketSet:
+    """
+    Conjunto exacto de tickets con memoria compacta.
+
+    Los tickets de MetaTrader son enteros: los que se escriben como un entero
+    canónico (solo dígitos, sin ceros a la izquierda) se guardan en un arreglo
+    int64 ordenado (8 bytes cada uno) y se buscan con searchsorted; el resto,
+    tal cual en un set. Así se recuerdan todos los tickets del backend y del
+    archivo importado sin un objeto str por ticket.
+    """
+    def __init__(self, tickets: Iterable[str] = ()):
+        self._numbers = np.empty(0, dtype=np.int64)
+        self._others = set()
+        batch, runs = [], []
+        for ticket in tickets:
+            batch.append(ticket)
+            if len(batch) == TICKET_BATCH:
+                runs.append(self._numeric(batch))
+                batch = []
+        runs.append(self._numeric(batch))
+        self._numbers = np.sort(np.concatenate(runs))
+
+    def __len__(self) -> int:
+        return len(self._numbers) + len(self._others)
+
+    @staticmethod
+    def _is_numeric(ticket: str) -> bool:
+        return (ticket.isascii() and ticket.isdigit() and len(ticket) <= MAX_TICKET_DIGITS
+                and (ticket[0] != "0" or ticket == "0"))
+
+    def _numeric(self, tickets: List[str]) -> np.ndarray:
+        """Los tickets enteros como int64; los demás pasan a self._others."""
+        numbers = []
+        for ticket in tickets:
+            if self._is_numeric(ticket):
+                numbers.append(int(ticket))
+            else:
+                self._others.add(ticket)
+        return np.array(numbers, dtype=np.int64)
+
+    def contains(self, tickets: List[str]) -> np.ndarray:
+        """Para cada ticket, True si ya está en el conjunto."""
+        found = np.zeros(len(tickets), dtype=bool)
+        positions = [i for i, ticket in enumerate(tickets) if self._is_numeric(ticket)]
+        if positions and len(self._numbers):
+            numbers = np.array([int(tickets[i]) for i in positions], dtype=np.int64)
+            index = np.minimum(np.searchsorted(self._numbers, numbers), len(self._numbers) - 1)
+            found[positions] = self._numbers[index] == numbers
+        for i, ticket in enumerate(tickets):
+            if not found[i] and ticket in self._others:
+                found[i] = True
+        return found
+
+    def add(self, tickets: List[str]):
+        """Agrega tickets nuevos (un bloque importado)."""
+        numbers = self._numeric(tickets)
+        if len(numbers):
+            # Dos tramos ordenados: el ordenamiento estable (timsort) los une en tiempo lineal
+            self._numbers = np.sort(np.concatenate([self._numbers, np.sort(numbers)]), kind='stable')
+
+def chunk_to_trades(chunk: pd.DataFrame, mapping: Dict[str, Any],
+                    rejected: Optional[List[Dict[str, Any]]] = None, source: str = None) -> List[Dict[str, Any]]:
+    """
+    Convierte un bloque del CSV (todas las columnas como texto) en trades del journal.
+
+    Los trades sin ganancia/pérdida numérica (vacía o con texto) no se convierten:
+    se agregan a `rejected` con el mismo formato que TradeDecoder.rejected
+    (archivo, linea, campo, valor, error). Los costos vacíos cuentan como 0.
+    """
+    pnl_column = mapping['ganancia/perdida']
+    pnl = pd.to_numeric(chunk[pnl_column], errors='coerce')
+    for column in mapping['costos']:
+        pnl = pnl + pd.to_numeric(chunk[column], errors='coerce').fillna(0)
+
+    activo = chunk[mapping['activo']].fillna("").str.strip()
+    keep = activo != ""
+    if 'accion' in mapping:
+        accion = chunk[mapping['accion']].fillna("").str.strip().str.upper()
+        keep &= ~accion.isin(NON_TRADE_ACTIONS)
+    invalid = keep & ~np.isfinite(pnl.to_numpy(dtype=float))
+    if invalid.any():
+        keep &= ~invalid
+        if rejected is not None:
+            # El índice del bloque sigue la numeración de filas de todo el archivo
+            for row, value in chunk.loc[invalid, pnl_column].items():
+                rejected.append({'archivo': source, 'linea': int(row) + FIRST_DATA_LINE,
+                                 'campo': 'ganancia/perdida', 'valor': value,
+                                 'error': f"ganancia/perdida no numérica: {value!r}"})
+
+    fields = {'activo': activo, 'ganancia/perdida': pnl.round(2)}
+    if 'accion' in mapping:
+        fields['accion'] = accion
+    for field in ('tipo entrada', 'mejorar', dl.TRADE_ID_FIELD):
+        if field in mapping:
+            fields[field] = chunk[mapping[field]].fillna("").str.strip()
+    # Fechas normalizadas a ISO 8601 (p. ej. '2024.01.02 10:00' de MetaTrader); las inválidas se omiten
+    for field in ('apertura', 'cierre'):
+        if field in mapping:
+            times = pd.to_datetime(chunk[mapping[field]], format='mixed', errors='coerce')
+            fields[field] = times.dt.strftime('%Y-%m-%dT%H:%M:%S').fillna("")
+
+    keep = keep.to_numpy()
+    columns = {field: np.asarray(values.to_numpy(dtype=object))[keep] for field, values in fields.items()}
+    if 'confirmaciones' in mapping:
+        columns['confirmaciones'] = [_split_confirmations(cell)
+                                     for cell in chunk[mapping['confirmaciones']].to_numpy(dtype=object)[keep]]
+    else:
+        columns['confirmaciones'] = [{} for _ in range(int(keep.sum()))]
+
+    # Mismo orden de claves que los trades del formulario; los campos vacíos se omiten
+    order = ['activo', 'accion', 'ganancia/perdida', 'tipo entrada', 'mejorar', 'confirmaciones',
+             'apertura', 'cierre', dl.TRADE_ID_FIELD]
+    names = [field for field in order if field in columns]
+    trades = []
+    for values in zip(*(columns[field] for field in names)):
+        trades.append({field: value for field, value in zip(names, values) if value != ""})
+    return trades
+
+def import_trades(filepath: str,
+                  add_trades: Callable[[List[Dict[str, Any]]], None],
+                  load_trade_ids: Callable[[], Iterable[str]],
+                  column_map: Optional[Dict[str, str]] = None,
+                  chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                  progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """
+    Importa un CSV de historial del broker por bloques.
+
+    Los trades cuyo ticket ya existe (en el backend o antes en el mismo archivo)
+    se cuentan como duplicados y no se guardan. `load_trade_ids` puede retornar
+    un iterador (p. ej. data_loader.iter_trade_ids): los tickets se guardan en
+    un TicketSet a medida que se leen. Las filas con la ganancia/pérdida vacía
+    o no numérica se cuentan como rechazadas y se reportan con su número de
+    línea. Retorna los contadores finales; `progress` recibe los mismos
+    contadores después de cada bloque.
+    """
+    seen = TicketSet(load_trade_ids())
+    rejected = []
+    stats = {'filas': 0, 'importados': 0, 'duplicados': 0, 'omitidos': 0, 'rechazados': 0,
+             'bytes': 0, 'total_bytes': os.path.getsize(filepath)}
+    separator = _sniff_separator(filepath)
+
+    with open(filepath, 'rb') as f:
+        reader = pd.read_csv(f, sep=separator, dtype=str, keep_default_na=False,
+                             encoding='utf-8-sig', chunksize=chunk_rows)
+        mapping = None
+        for chunk in reader:
+            if mapping is None:
+                mapping = resolve_columns(chunk.columns, column_map)
+            chunk_rejected = []
+            trades = chunk_to_trades(chunk, mapping, chunk_rejected, filepath)
+            stats['filas'] += len(chunk)
+            stats['rechazados'] += len(chunk_rejected)
+            stats['omitidos'] += len(chunk) - len(trades) - len(chunk_rejected)
+            rejected.extend(chunk_rejected[:MAX_REPORTED_REJECTED - len(rejected)])
+
+            chunk_ids = [trade[dl.TRADE_ID_FIELD] for trade in trades if trade.get(dl.TRADE_ID_FIELD) is not None]
+            known = iter(seen.contains(chunk_ids))
+            batch, new_ids = [], set()
+            for trade in trades:
+                trade_id = trade.get(dl.TRADE_ID_FIELD)
+                if trade_id is not None:
+                    # Repetido en el backend, en un bloque anterior o antes en este bloque
+                    if next(known) or trade_id in new_ids:
+                        stats['duplicados'] += 1
+                        continue
+                    new_ids.add(trade_id)
+                batch.append(trade)
+            add_trades(batch)
+            seen.add(list(new_ids))
+            stats['importados'] += len(batch)
+            stats['bytes'] = f.tell()
+            if progress is not None:
+                progress(dict(stats))
+
+    stats['bytes'] = stats['total_bytes']
+    if rejected:
+        print(f"Advertencia: {stats['rechazados']} fila(s) sin ganancia/pérdida numérica no se importaron:")
+        for item in rejected:
+            print(f"  {item['archivo']}:{item['linea']}: {item['error']}")
+        if stats['rechazados'] > len(rejected):
+            print(f"  ... y {stats['rechazados'] - len(rejected)} más.")
+    return stats
+
+def format_progress(stats: Dict[str, int]) -> str:
+    """Texto de avance para la barra de estado o la consola."""
+    percent = 100 * stats['bytes'] / stats['total_bytes'] if stats['total_bytes'] else 100
+    return (f"Importando... {percent:.0f}% ({stats['filas']} filas, {stats['importados']} nuevos, "
+            f"{stats['duplicados']} duplicados)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un historial de trades exportado por el broker (CSV).")
+    parser.add_argument("archivo", help="CSV exportado (p. ej. historial de MetaTrader).")
+    parser.add_argument("--almacenamiento", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--bloque", type=int, default=DEFAULT_CHUNK_ROWS, help="Filas por bloque.")
+    parser.add_argument("--columna", action="append", default=[], metavar="CAMPO=COLUMNA",
+                        help="Columna del CSV para un campo del trade (p. ej. confirmaciones=Comment).")
+    args = parser.parse_args()
+    column_map = dict(item.split("=", 1) for item in args.columna)
+
+    if args.almacenamiento == "sqlite":
+        import sqlite_loader as sl
+        sl.migrate_from_json()
+        storage = sl
+    else:
+        storage = dl
+    stats = import_trades(args.archivo, storage.add_trades, storage.iter_trade_ids, column_map, args.bloque,
+                          progress=lambda s: print(format_progress(s), flush=True))
+    print(f"Importación terminada: {stats['importados']} trades nuevos, {stats['duplicados']} duplicados, "
+          f"{stats['omitidos']} filas omitidas, {stats['rechazados']} rechazadas.")
+
+if __name__ == "__main__":
+    main()
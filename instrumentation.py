@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentación del pipeline de la aplicación: tiempo, llamadas y memoria por etapa.
+
+Cada etapa (carga, preprocesamiento, métricas, confirmaciones, presentación,
+gráficos...) se envuelve con `stats.stage(nombre)`. Se acumulan las llamadas y
+el tiempo total, último y máximo, y además los tiempos del último refresco por
+separado para mostrarlos en la barra de estado. Con trace_memory=True se mide
+también el pico de memoria de cada etapa con tracemalloc (hace todo más lento,
+por eso es opcional). Las estadísticas se exportan como JSON.
+
+Para ver dónde se va el tiempo dentro de una etapa, la app puede además
+capturar un refresco completo con cProfile (ver TradingAnalysisApp.profile_next_refresh).
+"""
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator
+
+class PipelineStats:
+    """
+    Estadísticas acumuladas por etapa. Se usa desde el hilo de Tk y desde el
+    hilo de análisis a la vez, así que las actualizaciones van con un lock.
+
+    tracemalloc mide la memoria de todo el proceso: si dos etapas corren a la
+    vez en hilos distintos, el pico de cada una incluye lo que asignó la otra.
+    """
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        # etapa -> {'llamadas', 'total_s', 'ultimo_s', 'max_s', 'memoria_pico_mb'}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        # etapa -> segundos dentro del refresco en curso (o del último)
+        self.last_refresh: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Por hilo: [memoria al empezar, pico hasta ahora] de cada etapa abierta (la última es la más interna)
+        self._memory_frames = threading.local()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Mide el bloque como una llamada a la etapa `name` (también si lanza una excepción).
+        Las etapas se pueden anidar: el pico de la externa incluye el de las internas.
+        """
+        frame = None
+        if self.trace_memory:
+            frames = self._open_frames()
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak borra el pico de las etapas que la contienen: se guarda antes
+            for outer in frames:
+                outer[1] = max(outer[1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            frames.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_mb = None
+            if frame is not None:
+                frames.pop()
+                peak_mb = (max(frame[1], tracemalloc.get_traced_memory()[1]) - frame[0]) / 2**20
+            self._record(name, elapsed, peak_mb)
+
+    def _open_frames(self) -> list:
+        """Etapas con memoria medida abiertas en este hilo."""
+        frames = getattr(self._memory_frames, 'frames', None)
+        if frames is None:
+            frames = self._memory_frames.frames = []
+        return frames
+
+    def _record(self, name: str, elapsed: float, peak_mb: float = None):
+        with self._lock:
+            stats = self.stages.setdefault(name, {'llamadas': 0, 'total_s': 0.0, 'ultimo_s': 0.0,
+                                                  'max_s': 0.0, 'memoria_pico_mb': None})
+            stats['llamadas'] += 1
+            stats['total_s'] += elapsed
+            stats['ultimo_s'] = elapsed
+            stats['max_s'] = max(stats['max_s'], elapsed)
+            if peak_mb is not None:
+                stats['memoria_pico_mb'] = max(stats['memoria_pico_mb'] or 0.0, peak_mb)
+            self.last_refresh[name] = self.last_refresh.get(name, 0.0) + elapsed
+
+    def begin_refresh(self):
+        """Empieza a contar un nuevo refresco en last_refresh."""
+        with self._lock:
+            self.last_refresh = {}
+
+    def reset(self):
+        """Descarta todas las estadísticas."""
+        with self._lock:
+            self.stages = {}
+            self.last_refresh = {}
+
+    def summary_line(self) -> str:
+        """Tiempos del último refresco en una línea (para la barra de estado)."""
+        with self._lock:
+            items = list(self.last_refresh.items())
+        return " | ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in items)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Estadísticas serializables (con el promedio por llamada de cada etapa)."""
+        with self._lock:
+            stages = {name: {**stats, 'promedio_s': stats['total_s'] / stats['llamadas']}
+                      for name, stats in self.stages.items()}
+            last = dict(self.last_refresh)
+        return {
+            'generado': datetime.now().isoformat(timespec='seconds'),
+            'memoria_medida': self.trace_memory,
+            'etapas': stages,
+            'ultimo_refresco': last,
+        }
+
+    def export_json(self, path: str):
+        """Guarda las estadísticas en un archivo JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
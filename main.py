@@ -1,22 +1,75 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
+"""
+Punto de entrada de la aplicación.
+
+Medición del arranque:
+    python main.py --medir-inicio
+
+Abre la ventana, espera a que la carga y el análisis inicial estén en pantalla,
+imprime una línea JSON con 'primera_ventana' (segundos hasta que la ventana
+aparece) e 'interactiva' (segundos hasta que el dashboard muestra los datos),
+medidos desde el inicio de main.py, y cierra la aplicación. No incluye el
+arranque del intérprete. `python benchmark.py inicio` repite la medición.
+
+Diagnóstico del pipeline (tiempo por etapa en la barra de estado; pestaña
+"Diagnóstico" oculta que se muestra con F12):
+    python main.py --diagnostico --memoria --exportar-diagnostico diag.json
+    python main.py --perfil refresco.prof    (cProfile de la carga inicial)
+
+Significancia de las confirmaciones (intervalos bootstrap y prueba de permutaciones):
+    python main.py --remuestreos 10000 --permutaciones 10000
+
+Journal particionado por cuenta y mes (solo se cargan las particiones pedidas):
+    python main.py --particiones --cuenta principal --desde 2024-01 --hasta 2024-06
+"""
+import time
+_STARTUP_T0 = time.perf_counter()
+
+import argparse
+import functools
+import importlib
+import json
+import os
+
+# pandas, preprocessor, analyzer y snapshot no se importan aquí: se cargan en el hilo de
+# análisis la primera vez que se usan, para que la ventana aparezca antes.
 import data_loader as dl
-import preprocessor as pp
-import analyzer as an
+import catalog as ct
+import instrumentation as ins
+import sqlite_loader as sl
+import analysis_cache as ac
 import ui_manager as ui
-import os
-import json
+
+class LazyFunction:
+    """Función (o clase) de un módulo que se importa recién en la primera llamada."""
+    def __init__(self, module_name: str, attr: str):
+        self.module_name = module_name
+        self.attr = attr
+        self.__name__ = attr
+
+    @property
+    def __wrapped__(self):
+        # inspect.unwrap (usado por la caché para identificar el código) llega al objeto real
+        return getattr(importlib.import_module(self.module_name), self.attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.__wrapped__(*args, **kwargs)
 
 # --- Funciones de Inicialización de Datos de Ejemplo ---
 
-def create_initial_json_files():
-    """Crea los archivos JSON iniciales con datos de ejemplo si no existen."""
+def create_initial_json_files(sample_trades: bool = True):
+    """
+    Crea los archivos JSON iniciales con datos de ejemplo si no existen.
+    Con sample_trades=False no se crea el journal de trades de ejemplo.
+    """
     # Asegurarse de que el directorio exista (data_loader ya lo hace, pero por seguridad)
     if not os.path.exists(dl.DATA_DIR):
         os.makedirs(dl.DATA_DIR)
 
     # 1. Movimientos de Ejemplo (Trades)
-    if not os.path.exists(dl.TRADES_FILE) or os.path.getsize(dl.TRADES_FILE) == 0:
+    # Si existe un movimientos.json del formato anterior, se migra al journal primero.
+    dl._migrate_legacy_trades()
+    if sample_trades and (not os.path.exists(dl.TRADES_FILE) or os.path.getsize(dl.TRADES_FILE) == 0):
         trades_ejemplo = [
             {
                 "activo": "EURUSD",
@@ -65,8 +118,7 @@ def create_initial_json_files():
                 "confirmaciones": {"noticia": True, "divergencia": True, "hch": True}
             }
         ]
-        with open(dl.TRADES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(trades_ejemplo, f, indent=4, ensure_ascii=False)
+        dl._write_trades_journal(trades_ejemplo)
         print(f"Archivo de trades de ejemplo creado en: {dl.TRADES_FILE}")
 
 
@@ -94,37 +146,154 @@ def create_initial_json_files():
             json.dump(improvements_ejemplo, f, indent=4, ensure_ascii=False)
         print(f"Archivo de mejoras de ejemplo creado en: {dl.IMPROVEMENTS_FILE}")
 
+def _partitioned_data_files(**partition_args):
+    """Archivos de datos de la vista particionada: catálogos y particiones seleccionadas."""
+    # partitions importa pandas: solo se carga cuando la caché calcula la huella
+    partitions = importlib.import_module('partitions')
+    return [dl.CONFIRMATIONS_FILE, dl.IMPROVEMENTS_FILE] + partitions.partition_files(**partition_args)
+
+def _apply_pandas_display_options(app):
+    """Opciones de pandas; se aplican cuando pandas ya fue importado por el hilo de análisis."""
+    import pandas as pd
+    # Aseguramos que pandas pueda usar Float64 para cálculos
+    pd.set_option('display.float_format', lambda x: '%.2f' % x)
+
+def _report_startup(app):
+    """Imprime los tiempos de arranque y cierra la aplicación (modo --medir-inicio)."""
+    _apply_pandas_display_options(app)
+    print(json.dumps(app.startup_times))
+    app.after(0, app.destroy)
+
 def main():
     """Punto de entrada de la aplicación."""
+    parser = argparse.ArgumentParser(description="Análisis y minería de datos de trades.")
+    parser.add_argument("--almacenamiento", choices=["json", "sqlite"], default="json",
+                        help="Backend de datos: journal JSON (por defecto) o base SQLite "
+                             "(en el primer uso se migran los archivos JSON).")
+    parser.add_argument("--medir-inicio", action="store_true",
+                        help="Imprime el tiempo hasta la primera ventana y hasta estar interactiva, y sale.")
+    parser.add_argument("--diagnostico", action="store_true",
+                        help="Muestra desde el inicio la pestaña de diagnóstico (también se abre con F12).")
+    parser.add_argument("--memoria", action="store_true",
+                        help="Mide además el pico de memoria de cada etapa con tracemalloc (más lento).")
+    parser.add_argument("--perfil", metavar="ARCHIVO",
+                        help="Captura con cProfile el refresco inicial y lo guarda en ARCHIVO (.prof).")
+    parser.add_argument("--remuestreos", type=int, default=0, metavar="N",
+                        help="Intervalos de confianza bootstrap (N remuestreos) para cada confirmación; "
+                             "el ranking usa sus extremos.")
+    parser.add_argument("--permutaciones", type=int, default=0, metavar="N",
+                        help="P-valor de una prueba de N permutaciones contra la tasa de éxito global.")
+    parser.add_argument("--particiones", action="store_true",
+                        help="Journal particionado por cuenta y mes (en el primer uso se reparte movimientos.jsonl).")
+    parser.add_argument("--cuenta", nargs="+", default=None,
+                        help="Con --particiones: cargar solo estas cuentas (los trades nuevos van a la primera).")
+    parser.add_argument("--desde", metavar="AAAA-MM", help="Con --particiones: primer mes cargado.")
+    parser.add_argument("--hasta", metavar="AAAA-MM", help="Con --particiones: último mes cargado.")
+    parser.add_argument("--exportar-diagnostico", metavar="ARCHIVO",
+                        help="Al cerrar, guarda en ARCHIVO las estadísticas por etapa en JSON.")
+    args = parser.parse_args()
+    if args.particiones and args.almacenamiento != "json":
+        parser.error("--particiones solo está disponible con el almacenamiento json.")
+
     print("--- Iniciando Proyecto de Análisis de Trades ---")
 
     # 1. Crear archivos de datos de ejemplo si no existen
-    create_initial_json_files()
+    # (con el journal ya particionado, los trades de ejemplo se repetirían en cada inicio)
+    create_initial_json_files(sample_trades=not (args.particiones and os.path.isdir(dl.PARTITIONS_DIR)))
     
     # 2. Ensamblar las funciones para inyección de dependencias
+    if args.almacenamiento == "sqlite":
+        sl.migrate_from_json()
+        storage = sl
+        data_files = [sl.DB_FILE]
+        # La base ya indexa los catálogos por nombre (UNIQUE): el alta va directo a SQLite
+        catalog = ct.CatalogService(sl.load_catalogs, sl.add_confirmation, sl.add_improvement)
+    else:
+        storage = dl
+        data_files = dl.DATA_FILES
+        # Los duplicados se detectan en memoria; el alta los vuelve a comprobar con el
+        # candado del directorio (por si otro proceso agregó el mismo nombre)
+        catalog = ct.CatalogService(dl.load_catalogs, dl.add_confirmation, dl.add_improvement)
+
+    if args.particiones:
+        if os.path.exists(dl.TRADES_FILE):
+            # Primer uso: el journal único se reparte en particiones (y se conserva renombrado)
+            LazyFunction('partitions', 'partition_journal')()
+        partition_args = {'accounts': args.cuenta, 'start': args.desde, 'end': args.hasta}
+        # Las particiones de la vista cambian con el tiempo (meses nuevos): la lista se arma en cada consulta
+        data_files = functools.partial(_partitioned_data_files, **partition_args)
+
+    # La caché evita repetir carga, preprocesamiento y análisis si los datos no cambiaron.
+    cache = ac.AnalysisCache(dl.CACHE_DIR, data_files)
+
     loader_functions = {
-        'load_all_data': dl.load_all_data,
-        'add_trade': dl.add_trade,
-        'add_confirmation': dl.add_confirmation,
-        'add_improvement': dl.add_improvement,
+        'load_all_data': cache.cached(f'load_all_data_{args.almacenamiento}', storage.load_all_data),
+        'add_trade': storage.add_trade,
+        'add_trades': storage.add_trades,
+        'import_trades': functools.partial(LazyFunction('importer', 'import_trades'),
+                                           add_trades=storage.add_trades, load_trade_ids=storage.iter_trade_ids),
+        'add_confirmation': storage.add_confirmation,
+        'add_improvement': storage.add_improvement,
     }
+    if args.particiones:
+        account = args.cuenta[0] if args.cuenta else None
+        add_trades = functools.partial(LazyFunction('partitions', 'add_trades'), account=account)
+        loader_functions.update({
+            'add_trade': functools.partial(LazyFunction('partitions', 'add_trade'), account=account),
+            'add_trades': add_trades,
+            'import_trades': functools.partial(LazyFunction('importer', 'import_trades'), add_trades=add_trades,
+                                               load_trade_ids=LazyFunction('partitions', 'iter_trade_ids')),
+            # Solo las particiones pedidas, parseadas y preprocesadas en paralelo
+            'load_trades_frame': cache.tracked('load_trades_frame', functools.partial(
+                LazyFunction('partitions', 'load_frame'), **partition_args)),
+        })
+    elif storage is dl:
+        # Con el journal JSON, el DataFrame preprocesado se abre desde el snapshot
+        # columnar (memory-mapped) en lugar de parsear y preprocesar todo el historial.
+        loader_functions['load_trades_frame'] = cache.tracked('load_trades_frame', LazyFunction('snapshot', 'load_trades_frame'))
+    else:
+        # SQLite: las filas van directo al DataFrame (sin la lista de trades cacheada aparte)
+        loader_functions['load_trades_frame'] = cache.cached('load_trades_frame_sqlite', sl.load_trades_frame)
     
+    analyze_confirmations = LazyFunction('analyzer', 'analyze_confirmations')
+    confirmations_stage = 'analyze_confirmations'
+    if args.remuestreos > 0 or args.permutaciones > 0:
+        # Modo de significancia: los parámetros van en el nombre de la etapa (y así en la clave de caché)
+        analyze_confirmations = functools.update_wrapper(
+            functools.partial(analyze_confirmations, resamples=args.remuestreos, permutations=args.permutaciones),
+            analyze_confirmations)
+        confirmations_stage = f'analyze_confirmations_r{args.remuestreos}_p{args.permutaciones}'
+
     analyzer_functions = {
-        'calculate_key_metrics': an.calculate_key_metrics,
-        'analyze_confirmations': an.analyze_confirmations,
+        'calculate_key_metrics': cache.cached('calculate_key_metrics', LazyFunction('analyzer', 'calculate_key_metrics')),
+        'analyze_confirmations': cache.cached(confirmations_stage, analyze_confirmations),
+        'metrics_accumulator': cache.cached('metrics_accumulator', LazyFunction('analyzer', 'MetricsAccumulator')),
+        'analyze_combinations': cache.cached('analyze_combinations', LazyFunction('analyzer', 'analyze_confirmation_combinations')),
+        'equity_curve': cache.cached('equity_curve', LazyFunction('timeseries', 'EquityCurve')),
+        'trade_index': cache.cached('trade_index', LazyFunction('query', 'TradeIndex')),
     }
 
     # 3. Iniciar la aplicación de Tkinter
     app = ui.TradingAnalysisApp(
         data_loader_funcs=loader_functions,
-        preprocessor_func=pp.preprocess_data,
-        analyzer_funcs=analyzer_functions
+        preprocessor_func=cache.cached('preprocess_data', LazyFunction('preprocessor', 'preprocess_data')),
+        analyzer_funcs=analyzer_functions,
+        incremental_preprocessor_func=LazyFunction('preprocessor', 'extend_preprocessed'),
+        startup_t0=_STARTUP_T0,
+        on_interactive=_report_startup if args.medir_inicio else _apply_pandas_display_options,
+        pipeline_stats=ins.PipelineStats(trace_memory=args.memoria),
+        profile_path=args.perfil,
+        show_diagnostics=args.diagnostico,
+        catalog_service=catalog
     )
+    print(f"Caché de análisis al iniciar: {cache.stats()}")
     
     # Asegurarse de que el análisis inicial se muestre correctamente al inicio.
     app.mainloop()
+    print(f"Caché de análisis al cerrar: {cache.stats()}")
+    if args.exportar_diagnostico:
+        app.stats.export_json(args.exportar_diagnostico)
+        print(f"Diagnóstico del pipeline guardado en: {args.exportar_diagnostico}")
 
 if __name__ == "__main__":
-    # Aseguramos que pandas pueda usar Float64 para cálculos
-    pd.set_option('display.float_format', lambda x: '%.2f' % x)
     main()
\ No newline at end of file
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Journal de trades particionado por cuenta y por mes.
+
+    data/particiones/<cuenta>/<AAAA-MM>.jsonl
+
+Cada partición es un journal JSON Lines como movimientos.jsonl, con las mismas
+escrituras (candado del directorio de la cuenta y group commit). La cuenta sale
+del campo 'cuenta' del trade y el mes de su fecha de apertura (o de cierre); los
+trades sin cuenta van a DEFAULT_ACCOUNT y los que no tienen fecha a UNDATED_MONTH.
+
+Solo se leen las particiones que pide la vista o el reporte (select_partitions).
+load_frame las decodifica a columnas (trade_record.TradeDecoder, que descarta y
+reporta los trades inválidos) en paralelo en procesos del pool, por grupos de
+particiones consecutivas, y las une con preprocessor.concat_preprocessed. Los agregados de cada partición
+(acumulador de métricas, totales por confirmación y curva de capital) se
+guardan en data/particiones/.agregados junto con la firma (tamaño, mtime) del
+archivo: partition_aggregates solo vuelve a leer las particiones que cambiaron.
+"""
+import json
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+import analyzer as an
+import data_loader as dl
+import locking
+import preprocessor as pp
+import timeseries as ts
+from trade_record import Trade
+
+PARTITIONS_DIR = dl.PARTITIONS_DIR
+PARTITION_SUFFIX = ".jsonl"
+# Campo del trade con la cuenta, y cuenta de los trades que no lo tienen
+ACCOUNT_FIELD = "cuenta"
+DEFAULT_ACCOUNT = "principal"
+# Campos de fecha (ISO 8601) que definen el mes, en orden de preferencia
+DATE_FIELDS = ['apertura', 'cierre']
+UNDATED_MONTH = "sin-fecha"
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}")
+# Subdirectorio (dentro de PARTITIONS_DIR) con los agregados por partición
+AGGREGATES_DIR = ".agregados"
+# Cambiar este valor invalida los agregados guardados (p. ej. si cambia su contenido)
+AGGREGATES_VERSION = 3
+# Por debajo de este tamaño total las particiones se leen en el proceso actual:
+# arrancar el pool cuesta más que parsearlas
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+Partition = Tuple[str, str]
+
+# --- Ubicación ---
+
+def partition_key(trade: Dict[str, Any]) -> Partition:
+    """(cuenta, mes AAAA-MM) de un trade."""
+    account = trade.get(ACCOUNT_FIELD)
+    account = DEFAULT_ACCOUNT if account is None or account == "" else str(account)
+    for field in DATE_FIELDS:
+        value = trade.get(field)
+        if isinstance(value, str) and MONTH_PATTERN.match(value):
+            return account, value[:7]
+    return account, UNDATED_MONTH
+
+def _account_dirname(account: str) -> str:
+    # Cualquier nombre de cuenta es un nombre de directorio válido; nunca empieza
+    # con '.', así no se confunde con '..' ni con AGGREGATES_DIR
+    name = quote(account, safe="")
+    return "%2E" + name[1:] if name.startswith(".") else name
+
+def account_dir(account: str, partitions_dir: str = None) -> str:
+    """Directorio de las particiones de una cuenta."""
+    return os.path.join(partitions_dir or PARTITIONS_DIR, _account_dirname(account))
+
+def partition_path(partition: Partition, partitions_dir: str = None) -> str:
+    account, month = partition
+    return os.path.join(account_dir(account, partitions_dir), month + PARTITION_SUFFIX)
+
+def list_accounts(partitions_dir: str = None) -> List[str]:
+    """Cuentas con al menos una partición, ordenadas."""
+    partitions_dir = partitions_dir or PARTITIONS_DIR
+    if not os.path.isdir(partitions_dir):
+        return []
+    return sorted(unquote(name) for name in os.listdir(partitions_dir)
+                  if not name.startswith(".") and os.path.isdir(os.path.join(partitions_dir, name)))
+
+def select_partitions(partitions_dir: str = None, accounts: List[str] = None,
+                      start: str = None, end: str = None) -> List[Partition]:
+    """
+    Particiones existentes de las cuentas pedidas (todas si es None) con mes
+    entre start y end (AAAA-MM, inclusive), ordenadas por cuenta y mes. Las de
+    trades sin fecha van primero (como el historial sin fechas en timeseries),
+    y con un rango de meses no se incluyen.
+    """
+    partitions_dir = partitions_dir or PARTITIONS_DIR
+    selected = []
+    for account in (list_accounts(partitions_dir) if accounts is None else accounts):
+        directory = account_dir(account, partitions_dir)
+        if not os.path.isdir(directory):
+            continue
+        months = sorted(name[:-len(PARTITION_SUFFIX)] for name in os.listdir(directory)
+                        if name.endswith(PARTITION_SUFFIX))
+        for month in months:
+            if month == UNDATED_MONTH:
+                if start is None and end is None:
+                    selected.append((account, month))
+            elif (start is None or month >= start) and (end is None or month <= end):
+                selected.append((account, month))
+    return sorted(selected, key=lambda partition: partition[1] != UNDATED_MONTH)
+
+def partition_files(partitions_dir: str = None, accounts: List[str] = None,
+                    start: str = None, end: str = None) -> List[str]:
+    """Rutas de las particiones seleccionadas (p. ej. para la huella de la caché de análisis)."""
+    return [partition_path(p, partitions_dir) for p in select_partitions(partitions_dir, accounts, start, end)]
+
+# --- Escritura ---
+
+def add_trades(trades: List[Dict[str, Any]], partitions_dir: str = None, account: str = None):
+    """
+    Agrega trades a sus particiones: una escritura por partición tocada. Con
+    `account`, los trades sin cuenta se asignan a esa (el campo se agrega al
+    mismo diccionario, así el DataFrame en memoria coincide con una recarga).
+    Si algún trade es inválido lanza InvalidTrade y no se escribe ninguno.
+    """
+    for trade in trades:
+        Trade.from_raw(trade)
+    payloads: Dict[str, List[str]] = {}
+    for trade in trades:
+        if account is not None:
+            trade.setdefault(ACCOUNT_FIELD, account)
+        path = partition_path(partition_key(trade), partitions_dir)
+        payloads.setdefault(path, []).append(json.dumps(trade, ensure_ascii=False) + "\n")
+    for path, lines in payloads.items():
+        dl._append_to_journal("".join(lines).encode('utf-8'), path)
+
+def add_trade(trade_data: Dict[str, Any], partitions_dir: str = None, account: str = None):
+    """Agrega un trade a su partición (ver add_trades)."""
+    add_trades([trade_data], partitions_dir, account)
+    print(f"Trade agregado exitosamente: {trade_data.get('activo')} ({'/'.join(partition_key(trade_data))})")
+
+def iter_trade_ids(partitions_dir: str = None) -> Iterator[str]:
+    """Identificadores de broker de todas las particiones, uno por uno (para no importar duplicados)."""
+    for path in partition_files(partitions_dir):
+        yield from dl.iter_trade_ids(path)
+
+def load_trade_ids(partitions_dir: str = None) -> set:
+    """Conjunto de los identificadores de broker de todas las particiones."""
+    return set(iter_trade_ids(partitions_dir))
+
+def partition_journal(journal: str = None, partitions_dir: str = None) -> int:
+    """
+    Reparte el journal único (movimientos.jsonl) en particiones y lo renombra
+    con el sufijo '.particionado'. Retorna la cantidad de trades movidos.
+    """
+    journal = journal or dl.TRADES_FILE
+    if journal == dl.TRADES_FILE:
+        dl._migrate_legacy_trades()
+    if not os.path.exists(journal):
+        return 0
+    # Compacta antes las líneas inválidas, si las hay (toma el candado por su cuenta)
+    dl._load_trades_journal(journal)
+    with locking.file_lock(journal):
+        trades, _ = dl._parse_journal(journal)
+        add_trades(trades, partitions_dir)
+        os.replace(journal, journal + ".particionado")
+    print(f"Journal particionado: {len(trades)} trades de {journal} en {partitions_dir or PARTITIONS_DIR}.")
+    return len(trades)
+
+# --- Lectura ---
+
+def _load_partitions(paths: List[str]) -> pd.DataFrame:
+    """
+    Decodifica varias particiones a un solo DataFrame (se ejecuta en un proceso
+    del pool): armar uno por partición chica cuesta más que la decodificación.
+    """
+    return dl.decode_journals(paths).to_frame()
+
+def _workers(paths: List[str], processes: int = None) -> int:
+    """Procesos a usar para leer `paths`: 1 si son pocas o chicas."""
+    total_bytes = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+    if processes == 1 or len(paths) < 2 or total_bytes < PARALLEL_MIN_BYTES:
+        return 1
+    return min(processes or os.cpu_count() or 1, len(paths))
+
+def _map_partitions(func, paths: List[str], processes: int = None) -> List[Any]:
+    """func(ruta) por cada partición, en paralelo si son varias y suficientemente grandes."""
+    workers = _workers(paths, processes)
+    if workers == 1:
+        return [func(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, paths))
+
+def _split_by_size(paths: List[str], parts: int) -> List[List[str]]:
+    """Divide las rutas (en orden) en `parts` grupos consecutivos de tamaño total parecido."""
+    sizes = [os.path.getsize(path) if os.path.exists(path) else 0 for path in paths]
+    target = sum(sizes) / parts
+    groups, current, current_bytes = [], [], 0
+    for path, size in zip(paths, sizes):
+        current.append(path)
+        current_bytes += size
+        if current_bytes >= target * (len(groups) + 1) and len(groups) < parts - 1:
+            groups.append(current)
+            current = []
+    return groups + [current] if current else groups
+
+def load_frame(accounts: List[str] = None, start: str = None, end: str = None,
+               partitions_dir: str = None, processes: int = None) -> pd.DataFrame:
+    """
+    DataFrame preprocesado de las particiones seleccionadas (ver select_partitions),
+    en orden de cuenta y mes. Se reparten en grupos consecutivos de tamaño
+    parecido, uno por proceso; cada proceso decodifica su grupo y los
+    resultados se unen con concat_preprocessed.
+    """
+    paths = partition_files(partitions_dir, accounts, start, end)
+    workers = _workers(paths, processes)
+    if workers == 1:
+        return _load_partitions(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(_load_partitions, _split_by_size(paths, workers)))
+    return pp.concat_preprocessed(frames)
+
+# --- Agregados por Partición ---
+
+def _signature(path: str) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _aggregates_path(partition: Partition, partitions_dir: str = None) -> str:
+    account, month = partition
+    return os.path.join(partitions_dir or PARTITIONS_DIR, AGGREGATES_DIR, _account_dirname(account), month + ".pkl")
+
+def _compute_aggregates(path: str) -> Dict[str, Any]:
+    """Agregados combinables de una partición (se ejecuta en un proceso del pool)."""
+    # La firma se toma antes de leer: si la partición crece mientras tanto, la
+    # próxima consulta la ve distinta y recalcula
+    signature = _signature(path)
+    decoder = dl.decode_journals([path], compact=False)
+    df_trades = decoder.to_frame()
+    return {
+        'version': AGGREGATES_VERSION,
+        'firma': signature,
+        'trades': len(df_trades),
+        'acumulador': an.MetricsAccumulator(df_trades),
+        'totales_confirmaciones': an.confirmation_totals(df_trades),
+        'curva': ts.EquityCurve(df_trades),
+        # Trades inválidos de la partición (archivo, línea, campo y error)
+        'rechazados': decoder.rejected,
+    }
+
+def _read_aggregates(partition: Partition, partitions_dir: str = None) -> Dict[str, Any]:
+    """Agregados guardados de la partición, o None si no existen o la partición cambió."""
+    path = _aggregates_path(partition, partitions_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            aggregates = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if aggregates.get('version') != AGGREGATES_VERSION or \
+            aggregates['firma'] != _signature(partition_path(partition, partitions_dir)):
+        return None
+    return aggregates
+
+def partition_aggregates(partitions: List[Partition], partitions_dir: str = None,
+                         processes: int = None) -> Dict[Partition, Dict[str, Any]]:
+    """
+    Agregados de cada partición. Los de las particiones que no cambiaron se leen
+    de disco; los demás se recalculan en paralelo y se guardan.
+    """
+    aggregates = {partition: _read_aggregates(partition, partitions_dir) for partition in partitions}
+    stale = [partition for partition, value in aggregates.items() if value is None]
+    computed = _map_partitions(_compute_aggregates, [partition_path(p, partitions_dir) for p in stale], processes)
+    for partition, value in zip(stale, computed):
+        aggregates[partition] = value
+        locking.atomic_write(_aggregates_path(partition, partitions_dir), pickle.dumps(value))
+    return aggregates
+
+def merge_aggregates(aggregates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combina agregados de varias particiones: acumulador, totales por confirmación, curva y rechazos."""
+    accumulator = an.MetricsAccumulator()
+    for value in aggregates:
+        accumulator.merge(value['acumulador'])
+    return {
+        'trades': accumulator.total_trades,
+        'acumulador': accumulator,
+        'totales_confirmaciones': an.merge_confirmation_totals([value['totales_confirmaciones'] for value in aggregates]),
+        'curva': ts.EquityCurve.combine(value['curva'] for value in aggregates),
+        'rechazados': [item for value in aggregates for item in value['rechazados']],
+    }
@@ -1,7 +1,66 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Any
 
+# Columnas esperadas en un DataFrame de trades sin registros
+BASE_COLUMNS = ['activo', 'accion', 'resultado', 'ganancia/perdida', 'tipo entrada', 'mejorar']
+# Columnas numéricas que se convierten con pd.to_numeric
+NUMERIC_COLUMNS = ['ganancia/perdida', 'resultado']
+# Fechas de apertura y cierre (texto ISO 8601 en el journal); se guardan con resolución de segundos
+TIMESTAMP_COLUMNS = ['apertura', 'cierre']
+TIMESTAMP_DTYPE = 'datetime64[s]'
+
+def _expand_confirmations(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Expande el campo anidado 'confirmaciones' en una columna booleana 'conf_<clave>'
+    por cada clave encontrada. Si el campo no existe, retorna el DataFrame intacto.
+
+    La matriz booleana se construye en una sola pasada sobre los diccionarios:
+    se registran las claves por orden de aparición y las posiciones activas, y
+    luego se marca todo en un arreglo NumPy de una vez (sin un pd.Series por fila).
+    """
+    if 'confirmaciones' not in df.columns:
+        return df
+
+    col_index = {}
+    rows, cols = [], []
+    for i, confs in enumerate(df['confirmaciones'].tolist()):
+        # Los valores que no son diccionarios se tratan como "sin confirmaciones"
+        if not isinstance(confs, dict):
+            continue
+        for key, value in confs.items():
+            j = col_index.setdefault(key, len(col_index))
+            # Los valores nulos (None/NaN) cuentan como False
+            if value and value == value:
+                rows.append(i)
+                cols.append(j)
+
+    matrix = np.zeros((len(df), len(col_index)), dtype=bool)
+    matrix[rows, cols] = True
+
+    # Renombrar columnas para claridad (ej. 'hch' -> 'conf_hch')
+    conf_df = pd.DataFrame(matrix, columns=['conf_' + key for key in col_index], index=df.index)
+
+    # Combinar el DataFrame original con las nuevas columnas de confirmación
+    return pd.concat([df.drop('confirmaciones', axis=1), conf_df], axis=1)
+
+def _clean_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte las columnas numéricas y de fecha, y rellena los nulos de ganancia/perdida."""
+    # Asegurar que la columna numérica clave esté en el formato correcto
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    # Las fechas inválidas quedan como NaT
+    for col in TIMESTAMP_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce').astype(TIMESTAMP_DTYPE)
+
+    # Rellenar valores nulos de ganancia/perdida con 0 (o la estrategia más adecuada)
+    if 'ganancia/perdida' in df.columns:
+        df['ganancia/perdida'] = df['ganancia/perdida'].fillna(0)
+    return df
+
 def preprocess_data(raw_trades: List[Dict[str, Any]]) -> pd.DataFrame:
     """
     Toma los datos brutos de trades, los convierte a DataFrame, expande
@@ -16,37 +75,204 @@ def preprocess_data(raw_trades: List[Dict[str, Any]]) -> pd.DataFrame:
     if not raw_trades:
         print("Advertencia: No hay datos de trades para preprocesar.")
         # Retorna un DataFrame vacío con las columnas esperadas
-        return pd.DataFrame(columns=[
-            'activo', 'accion', 'resultado', 'ganancia/perdida', 
-            'tipo entrada', 'mejorar'
-        ])
+        return pd.DataFrame(columns=BASE_COLUMNS)
 
     df = pd.DataFrame(raw_trades)
 
     # 1. Expansión del campo 'confirmaciones' (La clave para esquema dinámico)
     # Crea nuevas columnas por cada clave en el diccionario anidado.
-    if 'confirmaciones' in df.columns:
-        # Usa json_normalize si fuera un JSON más complejo, pero para un diccionario
-        # simple dentro de una columna, .apply(pd.Series) es más directo.
-        
-        # Primero, aseguramos que todos los valores en 'confirmaciones' son diccionarios
-        df['confirmaciones'] = df['confirmaciones'].apply(lambda x: x if isinstance(x, dict) else {})
-        
-        conf_df = df['confirmaciones'].apply(pd.Series).fillna(False).astype(bool)
-        
-        # Renombrar columnas para claridad (ej. 'hch' -> 'conf_hch')
-        conf_df.columns = ['conf_' + col for col in conf_df.columns]
-        
-        # Combinar el DataFrame original con las nuevas columnas de confirmación
-        df = pd.concat([df.drop('confirmaciones', axis=1), conf_df], axis=1)
+    df = _expand_confirmations(df)
 
     # 2. Limpieza básica y conversión de tipos
-    # Asegurar que la columna numérica clave esté en el formato correcto
-    df['ganancia/perdida'] = pd.to_numeric(df['ganancia/perdida'], errors='coerce')
-    df['resultado'] = pd.to_numeric(df['resultado'], errors='coerce')
-    
-    # Rellenar valores nulos de ganancia/perdida con 0 (o la estrategia más adecuada)
-    df['ganancia/perdida'] = df['ganancia/perdida'].fillna(0)
+    df = _clean_types(df)
+
+    conf_cols = [col for col in df.columns if col.startswith('conf_')]
+    print(f"Datos preprocesados. Columnas expandidas: {conf_cols if conf_cols else 'Ninguna'}")
+    return df
+
+def extend_preprocessed(df_trades: pd.DataFrame, new_raw_trades: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Agrega trades nuevos a un DataFrame ya preprocesado sin reprocesar el historial.
+
+    El resultado es idéntico a llamar preprocess_data sobre todos los trades
+    (históricos + nuevos): las confirmaciones nunca vistas se agregan como
+    columnas nuevas con False para las filas anteriores.
+
+    Args:
+        df_trades: DataFrame preprocesado con el historial existente.
+        new_raw_trades: Lista de diccionarios con los trades nuevos.
+
+    Returns:
+        pd.DataFrame: DataFrame extendido con los trades nuevos al final.
+    """
+    if not new_raw_trades:
+        return df_trades
+    if df_trades.empty:
+        return preprocess_data(new_raw_trades)
+
+    new_df = _expand_confirmations(pd.DataFrame(new_raw_trades))
 
-    print(f"Datos preprocesados. Columnas expandidas: {list(conf_df.columns) if 'conf_df' in locals() else 'Ninguna'}")
-    return df
\ No newline at end of file
+    # Orden de columnas igual al de una reconstrucción completa: primero las
+    # columnas base (por orden de aparición) y luego las de confirmación.
+    old_cols = list(df_trades.columns)
+    added_cols = [col for col in new_df.columns if col not in df_trades.columns]
+    base_cols = [c for c in old_cols if not c.startswith('conf_')] + [c for c in added_cols if not c.startswith('conf_')]
+    conf_cols = [c for c in old_cols if c.startswith('conf_')] + [c for c in added_cols if c.startswith('conf_')]
+    columns = base_cols + conf_cols
+
+    new_df = new_df.reindex(columns=columns)
+    new_df[conf_cols] = new_df[conf_cols].fillna(False).astype(bool)
+    new_df = _clean_types(new_df)
+
+    old_df = df_trades.reindex(columns=columns)
+    new_conf_cols = [c for c in conf_cols if c not in df_trades.columns]
+    if new_conf_cols:
+        old_df[new_conf_cols] = False
+
+    # Una columna que viene totalmente vacía en uno de los lados no debe degradar
+    # el tipo de texto del otro lado (p. ej. 'accion' omitida en un trade nuevo).
+    for col in base_cols:
+        if col in added_cols or old_df[col].dtype == new_df[col].dtype:
+            continue
+        if new_df[col].isna().all() and not pd.api.types.is_numeric_dtype(old_df[col].dtype):
+            new_df[col] = new_df[col].astype(old_df[col].dtype)
+        elif old_df[col].isna().all() and not pd.api.types.is_numeric_dtype(new_df[col].dtype):
+            old_df[col] = old_df[col].astype(new_df[col].dtype)
+
+    df = pd.concat([old_df, new_df], ignore_index=True)
+
+    # Las columnas base que no existían en el historial quedaron con el tipo de
+    # un relleno nulo; se vuelve a inferir el tipo sobre la columna completa.
+    for col in added_cols:
+        if not col.startswith('conf_'):
+            df[col] = pd.Series(df[col].tolist(), index=df.index)
+    if any(col in added_cols for col in ['ganancia/perdida'] + TIMESTAMP_COLUMNS):
+        df = _clean_types(df)
+
+    return df
+
+def concat_preprocessed(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Une DataFrames ya preprocesados (p. ej. los de cada partición del journal).
+
+    El resultado es idéntico a llamar preprocess_data sobre todos sus trades en
+    ese orden: columnas base y luego conf_* por orden de aparición, y las
+    confirmaciones que no existen en una parte quedan en False para sus filas.
+    """
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=BASE_COLUMNS)
+    if len(frames) == 1:
+        return frames[0]
+
+    seen = {}
+    for df in frames:
+        seen.update((col, None) for col in df.columns if col not in seen)
+    base_cols = [c for c in seen if not c.startswith('conf_')]
+    conf_cols = [c for c in seen if c.startswith('conf_')]
+    columns = base_cols + conf_cols
+
+    aligned = []
+    for df in frames:
+        missing_conf_cols = [c for c in conf_cols if c not in df.columns]
+        df = df.reindex(columns=columns)
+        if missing_conf_cols:
+            df[missing_conf_cols] = False
+        aligned.append(df)
+
+    # Una columna que falta (o viene vacía) en una parte no debe degradar el
+    # tipo de texto o de fecha de las demás, igual que en extend_preprocessed.
+    for col in base_cols:
+        dtypes = [df[col].dtype for df in aligned]
+        if all(dtype == dtypes[0] for dtype in dtypes):
+            continue
+        filled = [df[col].dtype for df in aligned if not df[col].isna().all()]
+        target = filled[0] if filled else None
+        if target is None or pd.api.types.is_numeric_dtype(target) or any(dtype != target for dtype in filled):
+            continue
+        for df in aligned:
+            if df[col].dtype != target:
+                df[col] = df[col].astype(target)
+
+    df = pd.concat(aligned, ignore_index=True)
+    # Los trades sin ganancia/perdida de una parte que no tenía la columna cuentan como 0
+    if 'ganancia/perdida' in df.columns:
+        df['ganancia/perdida'] = df['ganancia/perdida'].fillna(0)
+    return df
+
+# --- Representación Compacta ---
+
+# Columnas de texto que compact_trades convierte a 'category' si tienen baja cardinalidad
+CATEGORICAL_COLUMNS = ['activo', 'accion', 'tipo entrada', 'mejorar']
+# Máximo de valores distintos (como fracción de las filas) para usar 'category'
+MAX_CATEGORY_RATIO = 0.5
+# Columnas que se guardan como float32: 'resultado' es un precio que no se suma.
+# 'ganancia/perdida' se mantiene en float64 para que sumas y promedios no cambien.
+FLOAT32_COLUMNS = ['resultado']
+# Prefijo de las columnas uint64 con las confirmaciones empaquetadas (64 por columna)
+CONF_MASK_PREFIX = 'confmask_'
+# Clave de df.attrs con los nombres de las confirmaciones, en orden de bit
+CONF_NAMES_ATTR = 'confirmaciones'
+CONF_WORD_BITS = 64
+
+def compact_trades(df_trades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte un DataFrame preprocesado a su forma compacta:
+
+    - Las columnas de texto de baja cardinalidad pasan a 'category'.
+    - 'resultado' pasa a float32 si el cambio no pierde precisión relevante.
+    - Las columnas conf_* se empaquetan en columnas uint64 'confmask_<n>'
+      (bit i de la palabra n = confirmación 64*n + i). Los nombres quedan en
+      df.attrs['confirmaciones'].
+
+    El análisis (calculate_key_metrics, MetricsAccumulator y
+    analyze_confirmations) acepta directamente esta forma.
+    """
+    conf_cols = [col for col in df_trades.columns if col.startswith('conf_')]
+    df = df_trades.drop(columns=conf_cols)
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and df[col].nunique() <= MAX_CATEGORY_RATIO * max(len(df), 1):
+            df[col] = df[col].astype('category')
+
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and pd.api.types.is_float_dtype(df[col].dtype):
+            values = df[col].to_numpy(dtype=np.float64)
+            narrow = values.astype(np.float32)
+            if np.allclose(narrow, values, rtol=1e-6, atol=0, equal_nan=True):
+                df[col] = narrow
+
+    matrix = df_trades[conf_cols].fillna(False).to_numpy(dtype=bool) if conf_cols else np.zeros((len(df), 0), dtype=bool)
+    words = pack_confirmations(matrix)
+    for word in range(words.shape[1]):
+        df[f"{CONF_MASK_PREFIX}{word}"] = words[:, word]
+    df.attrs[CONF_NAMES_ATTR] = [col.replace('conf_', '', 1) for col in conf_cols]
+    return df
+
+def pack_confirmations(matrix: np.ndarray) -> np.ndarray:
+    """Empaqueta una matriz booleana (trades x confirmaciones) en palabras uint64 (trades x palabras)."""
+    n_rows, n_confs = matrix.shape
+    n_words = (n_confs + CONF_WORD_BITS - 1) // CONF_WORD_BITS
+    padded = np.zeros((n_rows, n_words * CONF_WORD_BITS), dtype=bool)
+    padded[:, :n_confs] = matrix
+    packed = np.packbits(padded, axis=1, bitorder='little')
+    return np.ascontiguousarray(packed).view('<u8')
+
+def unpack_confirmations(words: np.ndarray, n_confs: int) -> np.ndarray:
+    """Inverso de pack_confirmations: palabras uint64 -> matriz booleana (trades x confirmaciones)."""
+    as_bytes = np.ascontiguousarray(words, dtype='<u8').view(np.uint8)
+    return np.unpackbits(as_bytes, axis=1, count=n_confs, bitorder='little').astype(bool)
+
+def packed_confirmations(df_trades: pd.DataFrame):
+    """
+    Retorna (nombres, palabras uint64) si el DataFrame está en forma compacta, o
+    None si tiene columnas conf_* normales.
+    """
+    mask_cols = [col for col in df_trades.columns if col.startswith(CONF_MASK_PREFIX)]
+    if CONF_NAMES_ATTR not in df_trades.attrs:
+        if mask_cols:
+            raise ValueError("Columnas de confirmaciones empaquetadas sin df.attrs['confirmaciones'].")
+        return None
+    mask_cols.sort(key=lambda col: int(col[len(CONF_MASK_PREFIX):]))
+    words = df_trades[mask_cols].to_numpy(dtype=np.uint64) if mask_cols else np.zeros((len(df_trades), 0), dtype=np.uint64)
+    return df_trades.attrs[CONF_NAMES_ATTR], words
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Consultas sobre el journal: selecciona un subconjunto de trades antes del análisis.
+
+TradeIndex precalcula índices invertidos (de cada valor de las columnas de texto
+y de cada confirmación a las posiciones de sus filas) y un índice ordenado por
+fecha de cierre, de modo que un filtro se resuelve combinando listas de
+posiciones sin recorrer el DataFrame.
+
+Los filtros son un diccionario (las claves ausentes o vacías no filtran):
+    'activo', 'accion', 'tipo entrada', 'mejorar': valores aceptados (cualquiera)
+    'desde', 'hasta': rango de fecha de cierre, inclusivo
+    'con': confirmaciones requeridas (todas)
+    'sin': confirmaciones excluidas (ninguna)
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+import preprocessor as pp
+
+# Columnas de texto con índice invertido (valor -> posiciones)
+FILTER_COLUMNS = ['activo', 'accion', 'tipo entrada', 'mejorar']
+# Columna del índice ordenado por fecha
+TIME_COLUMN = 'cierre'
+# Las posiciones se guardan como int32 (alcanza para 2^31 trades y ocupa la mitad)
+POSITION_DTYPE = np.int32
+
+def filters_active(filters: Dict[str, Any]) -> bool:
+    """True si algún filtro restringe la selección."""
+    return bool(filters) and any(value not in (None, "", [], ()) for value in filters.values())
+
+def _group_positions(values: pd.Series, offset: int) -> Dict[Any, np.ndarray]:
+    """Posiciones (ordenadas) de cada valor no nulo de una columna, en una pasada."""
+    codes, uniques = pd.factorize(values)
+    valid = codes >= 0
+    positions = np.flatnonzero(valid)
+    codes = codes[valid]
+    # Con pocos valores distintos, códigos de 16 bits: el orden estable de NumPy usa radix sort
+    sort_codes = codes.astype(np.int16) if len(uniques) <= np.iinfo(np.int16).max else codes
+    grouped = (positions[np.argsort(sort_codes, kind='stable')] + offset).astype(POSITION_DTYPE)
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return dict(zip(uniques.tolist(), np.split(grouped, bounds)))
+
+class TradeIndex:
+    """
+    Índices de consulta sobre df_trades (forma normal o compacta).
+
+    Se construye una vez con el historial; los trades nuevos se agregan con
+    extend() procesando solo sus filas, igual que MetricsAccumulator. extend()
+    reemplaza los diccionarios y arreglos en lugar de modificarlos, así que una
+    copia superficial (copy.copy) no se ve afectada.
+    """
+    def __init__(self, df_trades: pd.DataFrame = None):
+        self.rows = 0
+        # columna -> {valor: posiciones}
+        self.values: Dict[str, Dict[Any, np.ndarray]] = {col: {} for col in FILTER_COLUMNS}
+        # confirmación -> posiciones de los trades que la tienen
+        self.confirmations: Dict[str, np.ndarray] = {}
+        # Fechas de cierre (segundos) ordenadas y la posición de cada una; sin los NaT
+        self.time_keys = np.empty(0, dtype=np.int64)
+        self.time_positions = np.empty(0, dtype=POSITION_DTYPE)
+        if df_trades is not None and not df_trades.empty:
+            self.extend(df_trades)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def extend(self, df_new: pd.DataFrame):
+        """Agrega al índice trades nuevos (p. ej. la cola de df_trades)."""
+        if df_new.empty:
+            return
+        offset = self.rows
+        self.values = {col: dict(index) for col, index in self.values.items()}
+        self.confirmations = dict(self.confirmations)
+        for col in FILTER_COLUMNS:
+            if col not in df_new.columns:
+                continue
+            index = self.values[col]
+            for value, positions in _group_positions(df_new[col], offset).items():
+                index[value] = np.concatenate([index[value], positions]) if value in index else positions
+
+        packed = pp.packed_confirmations(df_new)
+        if packed is None:
+            columns = [(col.replace('conf_', '', 1), df_new[col].to_numpy(dtype=bool))
+                       for col in df_new.columns if col.startswith('conf_')]
+        else:
+            names, words = packed
+            # Bit i de la palabra n = confirmación 64*n + i (ver pp.pack_confirmations)
+            columns = [(name, (words[:, j // pp.CONF_WORD_BITS] >> np.uint64(j % pp.CONF_WORD_BITS)) & np.uint64(1) != 0)
+                       for j, name in enumerate(names)]
+        for name, flags in columns:
+            positions = (np.flatnonzero(flags) + offset).astype(POSITION_DTYPE)
+            if name in self.confirmations:
+                positions = np.concatenate([self.confirmations[name], positions])
+            self.confirmations[name] = positions
+
+        if TIME_COLUMN in df_new.columns:
+            self._extend_times(df_new[TIME_COLUMN], offset)
+        self.rows += len(df_new)
+
+    def _extend_times(self, column: pd.Series, offset: int):
+        times = pd.to_datetime(column, format='ISO8601', errors='coerce').to_numpy(dtype=pp.TIMESTAMP_DTYPE)
+        valid = np.flatnonzero(~np.isnat(times))
+        keys = times.view(np.int64)[valid]
+        positions = (valid + offset).astype(POSITION_DTYPE)
+        order = np.argsort(keys, kind='stable')
+        keys, positions = keys[order], positions[order]
+        if len(keys) and len(self.time_keys) and keys[0] < self.time_keys[-1]:
+            # Cierres anteriores a los ya indexados: se reordena todo el índice
+            keys = np.concatenate([self.time_keys, keys])
+            positions = np.concatenate([self.time_positions, positions])
+            order = np.argsort(keys, kind='stable')
+            self.time_keys, self.time_positions = keys[order], positions[order]
+        else:
+            self.time_keys = np.concatenate([self.time_keys, keys])
+            self.time_positions = np.concatenate([self.time_positions, positions])
+
+    def options(self) -> Dict[str, List[Any]]:
+        """Valores disponibles para cada filtro (para poblar los controles de la UI)."""
+        options = {col: sorted(index, key=str) for col, index in self.values.items()}
+        options['confirmaciones'] = sorted(self.confirmations)
+        return options
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Posiciones (ordenadas) de los trades que cumplen todos los filtros."""
+        mask = np.ones(self.rows, dtype=bool)
+        empty = np.empty(0, dtype=POSITION_DTYPE)
+
+        def keep_only(positions: np.ndarray):
+            allowed = np.zeros(self.rows, dtype=bool)
+            allowed[positions] = True
+            np.logical_and(mask, allowed, out=mask)
+
+        for col in FILTER_COLUMNS:
+            accepted = filters.get(col)
+            if accepted:
+                index = self.values[col]
+                keep_only(np.concatenate([index.get(value, empty) for value in accepted]))
+        for name in filters.get('con') or []:
+            keep_only(self.confirmations.get(name, empty))
+        for name in filters.get('sin') or []:
+            mask[self.confirmations.get(name, empty)] = False
+
+        start, end = filters.get('desde'), filters.get('hasta')
+        if start is not None or end is not None:
+            lo = 0 if start is None else np.searchsorted(self.time_keys, _time_key(start), side='left')
+            hi = len(self.time_keys) if end is None else np.searchsorted(self.time_keys, _time_key(end), side='right')
+            keep_only(self.time_positions[lo:hi])
+        return np.flatnonzero(mask)
+
+    def take(self, df_trades: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFrame:
+        """Subconjunto de df_trades que cumple los filtros (sobre él corren los mismos análisis)."""
+        if not filters_active(filters):
+            return df_trades
+        return df_trades.iloc[self.select(filters)]
+
+def _time_key(value: Any) -> int:
+    """Convierte una fecha (texto ISO, datetime o Timestamp) a la clave entera del índice."""
+    return int(np.datetime64(pd.Timestamp(value), 's').view(np.int64))
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Reportes por lotes sin interfaz gráfica (no requiere Tk ni pantalla).
+
+Analiza uno o varios directorios de datos (p. ej. uno por trader o cuenta, con
+la misma estructura que data/) en paralelo con un pool de procesos y escribe un
+reporte por cuenta más un resumen combinado de todas las cuentas.
+
+Uso:
+    python report.py data
+    python report.py cuentas/ana cuentas/luis cuentas/marta --salida reportes --procesos 4
+    python report.py cuentas/* --formato csv
+    python report.py --particiones data/particiones --cuentas ana luis --desde 2024-01 --hasta 2024-06
+    python report.py data --remuestreos 10000 --permutaciones 10000
+    python report.py --sqlite data/bitacora.db
+
+Salida (en --salida):
+    reporte.json           métricas, confirmaciones y curva de capital por cuenta, y el resumen combinado
+                           (y los trades inválidos excluidos de cada cuenta, en 'rechazados')
+    resumen.csv            una fila de métricas globales por cuenta y una fila TOTAL
+    confirmaciones.csv     una fila por cuenta y confirmación (y las del TOTAL)
+
+Con --remuestreos/--permutaciones, las confirmaciones de cada cuenta llevan
+intervalos de confianza bootstrap y p-valores (ver analyzer.confirmation_significance);
+el TOTAL no, porque se arma sumando totales y no tiene los trades.
+
+Con --particiones, las cuentas son las del journal particionado (ver
+partitions.py) y solo se leen los meses pedidos. Métricas, confirmaciones y
+curva de capital se combinan de los agregados guardados por partición, así que
+solo se releen los meses que cambiaron desde el último reporte.
+
+Con --sqlite, métricas y confirmaciones se calculan en SQL dentro de la base
+(ver sqlite_loader), sin cargar los trades en memoria; por eso ese reporte no
+lleva curva de capital ni admite --remuestreos/--permutaciones.
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+import analyzer as an
+import data_loader as dl
+import partitions as pt
+import sqlite_loader as sl
+import timeseries as ts
+
+# Nombre de la fila del resumen combinado en los CSV
+TOTAL_LABEL = "TOTAL"
+# Métricas escalares de calculate_key_metrics que van en resumen.csv
+SUMMARY_METRICS = ['ganancia_promedio_total', 'perdida_promedio_total', 'rentabilidad_neta_total',
+                   'tasa_de_exito', 'activo_mas_operado', 'mejora_mas_repetitiva']
+CONFIRMATION_FIELDS = ['total', 'asertividad', 'ineficiencia', 'rentabilidad_promedio']
+# Columnas extra de confirmaciones.csv en el modo de significancia
+SIGNIFICANCE_FIELDS = ['asertividad_ic_min', 'asertividad_ic_max', 'rentabilidad_ic_min', 'rentabilidad_ic_max', 'p_valor']
+
+def analyze_journal(data_dir: str, resamples: int = 0, permutations: int = 0, processes: int = None) -> Dict[str, Any]:
+    """
+    Carga, preprocesa y analiza un directorio de datos (se ejecuta en un proceso del pool).
+    Los trades inválidos del journal se excluyen y se listan en 'rechazados'
+    (archivo, línea, campo y error).
+
+    Además del reporte, retorna los parciales combinables (acumulador de métricas y
+    totales por confirmación) para el resumen entre cuentas. Un error no detiene
+    el lote: se informa en el campo 'error' de esa cuenta. Con resamples o
+    permutations > 0 se agrega la significancia de cada confirmación, usando
+    `processes` procesos para el remuestreo.
+    """
+    try:
+        journal = os.path.join(data_dir, os.path.basename(dl.TRADES_FILE))
+        if os.path.exists(journal):
+            decoder = dl.decode_journals([journal], compact=False)
+        else:
+            # movimientos.json antiguo (lista de diccionarios)
+            decoder = dl.decode_legacy_trades(os.path.join(data_dir, os.path.basename(dl.LEGACY_TRADES_FILE)))
+        df_trades, rejected = decoder.to_frame(), decoder.rejected
+        conf_totals = an.confirmation_totals(df_trades)
+        if resamples > 0 or permutations > 0:
+            confirmations = an.analyze_confirmations(df_trades, resamples, permutations, processes=processes)
+        else:
+            confirmations = an.rank_confirmations(an.confirmation_stats(conf_totals))
+        report = {
+            'directorio': data_dir,
+            'trades': len(df_trades),
+            'metricas': an.calculate_key_metrics(df_trades),
+            'confirmaciones': confirmations,
+            'curva_de_capital': ts.EquityCurve(df_trades).summary(),
+            'acumulador': an.MetricsAccumulator(df_trades),
+            'totales_confirmaciones': conf_totals,
+        }
+        if rejected:
+            report['rechazados'] = rejected
+        return report
+    except Exception as e:
+        return {'directorio': data_dir, 'error': f"{type(e).__name__}: {e}"}
+
+def analyze_partitions(account: str, partitions_dir: str = None, start: str = None, end: str = None,
+                       resamples: int = 0, permutations: int = 0, processes: int = None) -> Dict[str, Any]:
+    """
+    Analiza una cuenta del journal particionado, con los meses entre start y end.
+
+    Métricas, confirmaciones y curva salen de los agregados por partición (las
+    que cambiaron se recalculan en `processes` procesos). La significancia
+    necesita los trades: en ese modo se cargan las particiones en paralelo.
+    Los trades inválidos de las particiones se listan en 'rechazados', como en
+    analyze_journal.
+    """
+    directory = pt.account_dir(account, partitions_dir)
+    try:
+        partitions = pt.select_partitions(partitions_dir, [account], start, end)
+        aggregates = pt.partition_aggregates(partitions, partitions_dir, processes)
+        merged = pt.merge_aggregates([aggregates[partition] for partition in partitions])
+        if resamples > 0 or permutations > 0:
+            df_trades = pt.load_frame([account], start, end, partitions_dir, processes)
+            confirmations = an.analyze_confirmations(df_trades, resamples, permutations, processes=processes)
+        else:
+            confirmations = an.rank_confirmations(an.confirmation_stats(merged['totales_confirmaciones']))
+        report = {
+            'directorio': directory,
+            'trades': merged['trades'],
+            'metricas': merged['acumulador'].metrics(),
+            'confirmaciones': confirmations,
+            'curva_de_capital': merged['curva'].summary(),
+            'acumulador': merged['acumulador'],
+            'totales_confirmaciones': merged['totales_confirmaciones'],
+        }
+        if merged['rechazados']:
+            report['rechazados'] = merged['rechazados']
+        return report
+    except Exception as e:
+        return {'directorio': directory, 'error': f"{type(e).__name__}: {e}"}
+
+def analyze_database(db_path: str) -> Dict[str, Any]:
+    """
+    Analiza una base SQLite con las consultas agregadas de sqlite_loader, sin
+    cargar los trades (ni armar el DataFrame) en memoria.
+    """
+    try:
+        return {
+            'directorio': db_path,
+            'trades': sl.count_trades_sql(db_path),
+            'metricas': sl.calculate_key_metrics_sql(db_path),
+            'confirmaciones': sl.analyze_confirmations_sql(db_path),
+        }
+    except Exception as e:
+        return {'directorio': db_path, 'error': f"{type(e).__name__}: {e}"}
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resumen combinado de las cuentas analizadas sin error."""
+    ok = [report for report in reports if 'error' not in report]
+    accumulator = an.MetricsAccumulator()
+    for report in ok:
+        accumulator.merge(report['acumulador'])
+    conf_totals = an.merge_confirmation_totals([report['totales_confirmaciones'] for report in ok])
+    return {
+        'cuentas': len(ok),
+        'trades': accumulator.total_trades,
+        'metricas': accumulator.metrics(),
+        'confirmaciones': an.rank_confirmations(an.confirmation_stats(conf_totals)),
+    }
+
+def run_reports(data_dirs: List[str], processes: int = None, resamples: int = 0, permutations: int = 0) -> Dict[str, Any]:
+    """Analiza los directorios (en paralelo si son varios) y arma el reporte completo."""
+    if len(data_dirs) == 1 or processes == 1:
+        # Una sola cuenta: el pool se usa dentro de la cuenta, para el remuestreo
+        analyze = functools.partial(analyze_journal, resamples=resamples, permutations=permutations, processes=processes)
+        reports = [analyze(data_dir) for data_dir in data_dirs]
+    else:
+        # Las cuentas ya se reparten entre procesos: cada una remuestrea en el suyo
+        analyze = functools.partial(analyze_journal, resamples=resamples, permutations=permutations, processes=1)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            reports = list(executor.map(analyze, data_dirs))
+    return _assemble_report(reports, resamples, permutations)
+
+def run_partition_reports(partitions_dir: str = None, accounts: List[str] = None, start: str = None,
+                          end: str = None, processes: int = None, resamples: int = 0,
+                          permutations: int = 0) -> Dict[str, Any]:
+    """Reporte de las cuentas del journal particionado (todas si accounts es None)."""
+    accounts = pt.list_accounts(partitions_dir) if accounts is None else accounts
+    # Las cuentas van una tras otra: el pool se usa dentro de cada una, por partición
+    reports = [analyze_partitions(account, partitions_dir, start, end, resamples, permutations, processes)
+               for account in accounts]
+    return _assemble_report(reports, resamples, permutations)
+
+def run_database_report(db_path: str) -> Dict[str, Any]:
+    """Reporte de una base SQLite: una sola cuenta, que es también el resumen."""
+    account = analyze_database(db_path)
+    summary = {'cuentas': 0, 'trades': 0, 'metricas': {}, 'confirmaciones': {}}
+    if 'error' not in account:
+        summary = {'cuentas': 1, 'trades': account['trades'], 'metricas': account['metricas'],
+                   'confirmaciones': account['confirmaciones']}
+    return {'generado': datetime.now().isoformat(timespec='seconds'), 'cuentas': [account], 'resumen': summary}
+
+def _assemble_report(reports: List[Dict[str, Any]], resamples: int, permutations: int) -> Dict[str, Any]:
+    summary = merge_reports(reports)
+    accounts = [{key: value for key, value in report.items()
+                 if key not in ('acumulador', 'totales_confirmaciones')} for report in reports]
+    report = {'generado': datetime.now().isoformat(timespec='seconds'), 'cuentas': accounts, 'resumen': summary}
+    if resamples > 0 or permutations > 0:
+        report['significancia'] = {'remuestreos': resamples, 'permutaciones': permutations,
+                                   'confianza': an.SIGNIFICANCE_CONFIDENCE}
+    return report
+
+def _json_default(value: Any) -> Any:
+    """Convierte escalares de NumPy a tipos nativos para json.dump."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+def write_json(report: Dict[str, Any], output_dir: str) -> str:
+    path = os.path.join(output_dir, "reporte.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False, default=_json_default)
+    return path
+
+def write_csv(report: Dict[str, Any], output_dir: str) -> List[str]:
+    rows = [(account['directorio'], account) for account in report['cuentas']]
+    rows.append((TOTAL_LABEL, report['resumen']))
+
+    summary_path = os.path.join(output_dir, "resumen.csv")
+    with open(summary_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cuenta', 'trades'] + SUMMARY_METRICS + ['error'])
+        for name, section in rows:
+            metrics = section.get('metricas', {})
+            writer.writerow([name, section.get('trades', '')] + [metrics.get(key, '') for key in SUMMARY_METRICS]
+                            + [section.get('error', metrics.get('Error', ''))])
+
+    significance = 'significancia' in report
+    conf_path = os.path.join(output_dir, "confirmaciones.csv")
+    with open(conf_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cuenta', 'confirmacion'] + CONFIRMATION_FIELDS + (SIGNIFICANCE_FIELDS if significance else []))
+        for name, section in rows:
+            for conf_name, stats in section.get('confirmaciones', {}).get('analisis_completo', {}).items():
+                row = [stats[key] for key in CONFIRMATION_FIELDS]
+                if significance:
+                    rate, mean = stats.get('asertividad_ic') or ('', ''), stats.get('rentabilidad_ic') or ('', '')
+                    row += [*rate, *mean, '' if stats.get('p_valor') is None else stats['p_valor']]
+                writer.writerow([name, conf_name] + row)
+    return [summary_path, conf_path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Reportes de trades por lotes, sin interfaz gráfica.")
+    parser.add_argument("directorios", nargs="*", help="Directorios de datos (misma estructura que data/).")
+    parser.add_argument("--particiones", nargs="?", const=pt.PARTITIONS_DIR, metavar="DIR",
+                        help=f"Usar el journal particionado por cuenta y mes (por defecto {pt.PARTITIONS_DIR}).")
+    parser.add_argument("--cuentas", nargs="+", default=None, help="Con --particiones: solo estas cuentas.")
+    parser.add_argument("--desde", metavar="AAAA-MM", help="Con --particiones: primer mes incluido.")
+    parser.add_argument("--hasta", metavar="AAAA-MM", help="Con --particiones: último mes incluido.")
+    parser.add_argument("--sqlite", nargs="?", const=sl.DB_FILE, metavar="BASE",
+                        help=f"Analizar una base SQLite en SQL, sin cargar los trades (por defecto {sl.DB_FILE}).")
+    parser.add_argument("--salida", default="reportes", help="Directorio donde se escriben los reportes.")
+    parser.add_argument("--formato", nargs="+", choices=["json", "csv"], default=["json", "csv"])
+    parser.add_argument("--procesos", type=int, default=None,
+                        help="Procesos en paralelo (por defecto, uno por CPU).")
+    parser.add_argument("--remuestreos", type=int, default=0, metavar="N",
+                        help="Intervalos de confianza bootstrap de cada confirmación con N remuestreos.")
+    parser.add_argument("--permutaciones", type=int, default=0, metavar="N",
+                        help="P-valor de cada confirmación con una prueba de N permutaciones.")
+    args = parser.parse_args()
+
+    if args.sqlite is not None:
+        if args.directorios or args.particiones is not None:
+            parser.error("Con --sqlite no se indican directorios ni --particiones.")
+        if args.remuestreos > 0 or args.permutaciones > 0:
+            parser.error("--remuestreos y --permutaciones necesitan los trades: no están disponibles con --sqlite.")
+        if not os.path.isfile(args.sqlite):
+            parser.error(f"No existe la base: {args.sqlite}")
+        report = run_database_report(args.sqlite)
+    elif args.particiones is not None:
+        if args.directorios:
+            parser.error("Con --particiones no se indican directorios.")
+        if not os.path.isdir(args.particiones):
+            parser.error(f"No existe el directorio de particiones: {args.particiones}")
+        report = run_partition_reports(args.particiones, args.cuentas, args.desde, args.hasta,
+                                       args.procesos, args.remuestreos, args.permutaciones)
+    else:
+        if not args.directorios:
+            parser.error("Indique al menos un directorio de datos (o --particiones).")
+        missing = [data_dir for data_dir in args.directorios if not os.path.isdir(data_dir)]
+        if missing:
+            parser.error(f"No existen los directorios: {', '.join(missing)}")
+        report = run_reports(args.directorios, args.procesos, args.remuestreos, args.permutaciones)
+    os.makedirs(args.salida, exist_ok=True)
+    written = []
+    if "json" in args.formato:
+        written.append(write_json(report, args.salida))
+    if "csv" in args.formato:
+        written.extend(write_csv(report, args.salida))
+
+    failed = [account for account in report['cuentas'] if 'error' in account]
+    for account in failed:
+        print(f"Error en {account['directorio']}: {account['error']}", file=sys.stderr)
+    print(f"Reporte de {report['resumen']['cuentas']} cuenta(s), {report['resumen']['trades']} trades: "
+          f"{', '.join(written)}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
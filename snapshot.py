@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot columnar del DataFrame preprocesado de trades.
+
+Cada columna se guarda como un archivo binario plano que se abre con
+np.memmap: las columnas numéricas y conf_* se usan directamente desde el
+archivo, sin copiarlas al heap. Las columnas de texto se guardan como códigos
+enteros (memory-mapped) más su lista de categorías en meta.json.
+
+El snapshot recuerda hasta qué byte del journal JSON Lines leyó. Si el journal
+solo creció (append), se decodifican y agregan únicamente los trades nuevos; si
+cambió de otra forma (p. ej. una compactación), se reconstruye completo. La
+extensión y la reconstrucción se hacen con el candado de archivo del directorio
+del snapshot (ver locking.py), así varias instancias no escriben a la vez. Las
+líneas se decodifican con trade_record.TradeDecoder: los trades inválidos no
+entran al snapshot y se reportan con su número de línea.
+"""
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import data_loader as dl
+import locking
+import preprocessor as pp
+from trade_record import TradeDecoder
+
+SNAPSHOT_DIR = os.path.join(dl.DATA_DIR, ".snapshot")
+META_FILE = "meta.json"
+SNAPSHOT_VERSION = 3
+# Bytes del inicio y del final de la porción leída que identifican al journal
+JOURNAL_PROBE_BYTES = 64 * 1024
+# Códigos especiales de las columnas de texto
+CODE_NAN = -1
+CODE_NONE = -2
+CODE_DTYPE = np.int32
+
+class SnapshotUnsupported(Exception):
+    """El DataFrame tiene columnas que no se pueden representar en el snapshot."""
+
+# --- Journal ---
+
+def _journal_probe(filepath: str, size: int) -> Dict[str, Any]:
+    """Identifica los primeros `size` bytes del journal sin hashearlo completo."""
+    with open(filepath, 'rb') as f:
+        head = f.read(min(size, JOURNAL_PROBE_BYTES))
+        f.seek(max(size - JOURNAL_PROBE_BYTES, 0))
+        tail = f.read(size - f.tell())
+    return {
+        'size': size,
+        'head': hashlib.blake2b(head, digest_size=16).hexdigest(),
+        'tail': hashlib.blake2b(tail, digest_size=16).hexdigest(),
+    }
+
+def _read_journal_lines(filepath: str, offset: int = 0) -> Tuple[List[str], int]:
+    """
+    Lee las líneas completas del journal desde `offset`. Una última línea sin
+    salto de línea (escritura en curso) no se consume. Retorna (líneas, byte final).
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end].decode('utf-8').split("\n")[:-1], offset + end
+
+def _line_number(filepath: str, offset: int) -> int:
+    """Cantidad de líneas del journal antes del byte `offset` (para numerar las que siguen)."""
+    with open(filepath, 'rb') as f:
+        return f.read(offset).count(b"\n")
+
+# --- Escritura ---
+
+def _column_spec(series: pd.Series) -> Tuple[Dict[str, Any], np.ndarray]:
+    """Describe una columna y retorna el arreglo plano que se guarda en disco."""
+    dtype = series.dtype
+    # Las fechas (datetime64 sin zona horaria) se guardan como su entero de ancho fijo
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufM':
+        return {'kind': 'numeric', 'dtype': dtype.str}, series.to_numpy()
+
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        categories: List[Any] = []
+        codes = _encode_text(categories, series)
+        return {'kind': 'text', 'dtype': str(dtype), 'categories': categories}, codes
+
+    raise SnapshotUnsupported(f"Tipo no soportado en la columna {series.name!r}: {dtype}")
+
+def _write_meta(snapshot_dir: str, meta: Dict[str, Any]):
+    locking.atomic_write(os.path.join(snapshot_dir, META_FILE), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+def _remove_unreferenced(snapshot_dir: str, meta: Dict[str, Any]):
+    """Borra archivos de columnas de generaciones anteriores (pueden seguir mapeados: se ignoran errores)."""
+    referenced = {column['file'] for column in meta['columns']}
+    for name in os.listdir(snapshot_dir):
+        if name.endswith(".bin") and name not in referenced:
+            try:
+                os.remove(os.path.join(snapshot_dir, name))
+            except OSError:
+                pass
+
+def _write_column(path: str, values: np.ndarray):
+    """Escribe un archivo de columna completo y lo persiste antes de que meta.json lo referencie."""
+    with open(path, 'wb') as f:
+        np.ascontiguousarray(values).tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_snapshot(df_trades: pd.DataFrame, journal: Dict[str, Any], snapshot_dir: str = None):
+    """Escribe un snapshot completo nuevo (archivos de una generación nueva + meta.json)."""
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    os.makedirs(snapshot_dir, exist_ok=True)
+    generation = uuid.uuid4().hex[:8]
+
+    columns = []
+    for i, name in enumerate(df_trades.columns):
+        spec, values = _column_spec(df_trades[name])
+        spec.update({'name': name, 'file': f"c{i}-{generation}.bin"})
+        _write_column(os.path.join(snapshot_dir, spec['file']), values)
+        columns.append(spec)
+
+    meta = {'version': SNAPSHOT_VERSION, 'rows': len(df_trades), 'journal': journal, 'columns': columns}
+    _write_meta(snapshot_dir, meta)
+    _remove_unreferenced(snapshot_dir, meta)
+
+def _append_snapshot(meta: Dict[str, Any], df_extended: pd.DataFrame, journal: Dict[str, Any], snapshot_dir: str) -> bool:
+    """
+    Agrega al snapshot las filas nuevas de df_extended (solo escribe la cola).
+    Retorna False si el esquema cambió de una forma que exige reconstruir.
+    """
+    old_rows = meta['rows']
+    old_names = [column['name'] for column in meta['columns']]
+    names = list(df_extended.columns)
+    # Solo se admiten columnas conf_* nuevas al final
+    if names[:len(old_names)] != old_names or not all(n.startswith('conf_') for n in names[len(old_names):]):
+        return False
+
+    tail = df_extended.iloc[old_rows:]
+    pending = []
+    for column in meta['columns']:
+        series = tail[column['name']]
+        if column['kind'] == 'numeric':
+            if not isinstance(series.dtype, np.dtype) or series.dtype.str != column['dtype']:
+                return False
+            pending.append((column, series.to_numpy()))
+        else:
+            if str(series.dtype) != column['dtype']:
+                return False
+            pending.append((column, _encode_text(column['categories'], series)))
+
+    generation = uuid.uuid4().hex[:8]
+    new_columns = []
+    for i, name in enumerate(names[len(old_names):], start=len(old_names)):
+        spec, values = _column_spec(df_extended[name])
+        spec.update({'name': name, 'file': f"c{i}-{generation}.bin"})
+        new_columns.append((spec, values))
+
+    for column, values in pending:
+        # Se escribe justo después de las filas que registra meta.json (no al final
+        # del archivo): si una escritura anterior se cortó antes de actualizar
+        # meta.json, sus filas huérfanas se descartan en vez de quedar en medio
+        itemsize = (np.dtype(column['dtype']) if column['kind'] == 'numeric' else np.dtype(CODE_DTYPE)).itemsize
+        with open(os.path.join(snapshot_dir, column['file']), 'r+b') as f:
+            f.truncate(old_rows * itemsize)
+            f.seek(old_rows * itemsize)
+            np.ascontiguousarray(values).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+    for spec, values in new_columns:
+        _write_column(os.path.join(snapshot_dir, spec['file']), values)
+        meta['columns'].append(spec)
+
+    meta['rows'] = len(df_extended)
+    meta['journal'] = journal
+    _write_meta(snapshot_dir, meta)
+    return True
+
+def _encode_text(categories: List[Any], series: pd.Series) -> np.ndarray:
+    """Codifica una columna de texto extendiendo (en el lugar) la lista de categorías existente."""
+    values = series.to_numpy(dtype=object)
+    local_codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    if not all(type(value) is str for value in uniques):
+        return _encode_text_generic(categories, series.name, values)
+
+    index = {value: i for i, value in enumerate(categories) if type(value) is str}
+    mapping = np.empty(len(uniques) + 1, dtype=CODE_DTYPE)
+    for i, value in enumerate(uniques):
+        if value not in index:
+            index[value] = len(categories)
+            categories.append(value)
+        mapping[i] = index[value]
+    mapping[-1] = CODE_NAN
+    codes = mapping[local_codes]
+    if series.dtype == object:
+        # factorize trata None y NaN igual; en columnas object se distinguen
+        codes[np.equal(values, None)] = CODE_NONE
+    return codes
+
+def _encode_text_generic(categories: List[Any], name: Any, values: np.ndarray) -> np.ndarray:
+    """Codificación valor por valor para columnas con tipos mezclados (str, bool, int, float)."""
+    index = {(type(value), value): i for i, value in enumerate(categories)}
+    codes = np.full(len(values), CODE_NAN, dtype=CODE_DTYPE)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = CODE_NONE
+        elif isinstance(value, float) and value != value:
+            continue
+        elif isinstance(value, (str, bool, int, float)):
+            key = (type(value), value)
+            if key not in index:
+                index[key] = len(categories)
+                categories.append(value)
+            codes[i] = index[key]
+        else:
+            raise SnapshotUnsupported(f"Valor no soportado en la columna {name!r}: {value!r}")
+    return codes
+
+# --- Lectura ---
+
+def _read_meta(snapshot_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(snapshot_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            meta = json.load(f)
+        except json.JSONDecodeError:
+            return None
+    return meta if meta.get('version') == SNAPSHOT_VERSION else None
+
+def _decode_text(column: Dict[str, Any], codes: np.ndarray) -> Any:
+    """Reconstruye una columna de texto a partir de sus códigos y categorías."""
+    lookup = np.empty(len(column['categories']) + 2, dtype=object)
+    lookup[:len(column['categories'])] = column['categories']
+    lookup[CODE_NAN] = np.nan
+    lookup[CODE_NONE] = None
+    values = lookup[codes]
+    if column['dtype'] == 'object':
+        return values
+    return pd.array(values, dtype=column['dtype'])
+
+def read_snapshot(meta: Dict[str, Any], snapshot_dir: str = None) -> pd.DataFrame:
+    """
+    Abre el snapshot como DataFrame. Las columnas numéricas y conf_* quedan
+    respaldadas por np.memmap de solo lectura (sin copiarse al heap).
+    """
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    rows = meta['rows']
+    data = {}
+    for column in meta['columns']:
+        path = os.path.join(snapshot_dir, column['file'])
+        dtype = np.dtype(column['dtype']) if column['kind'] == 'numeric' else np.dtype(CODE_DTYPE)
+        # np.asarray: vista ndarray sobre el memmap (comparte memoria, sin copiar)
+        values = np.asarray(np.memmap(path, dtype=dtype, mode='r', shape=(rows,))) if rows else np.empty(0, dtype=dtype)
+        data[column['name']] = values if column['kind'] == 'numeric' else _decode_text(column, values)
+    return pd.DataFrame(data, copy=False)
+
+def load_trades_frame(journal_path: str = None, snapshot_dir: str = None) -> pd.DataFrame:
+    """
+    Retorna el DataFrame preprocesado del journal usando el snapshot.
+
+    - Si el journal no cambió, abre el snapshot tal cual.
+    - Si solo se agregaron líneas, decodifica las nuevas y las agrega al snapshot.
+    - En cualquier otro caso (o si el snapshot no existe) lo reconstruye.
+    """
+    if journal_path is None:
+        dl._migrate_legacy_trades()
+        journal_path = dl.TRADES_FILE
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+        return pp.preprocess_data([])
+
+    # Varias instancias pueden cargar a la vez: la lectura de meta.json y la
+    # extensión o reconstrucción se hacen con el candado del directorio del snapshot
+    with locking.file_lock(os.path.join(snapshot_dir, META_FILE)):
+        return _load_locked(journal_path, snapshot_dir)
+
+def _load_locked(journal_path: str, snapshot_dir: str) -> pd.DataFrame:
+    """load_trades_frame con el candado del snapshot tomado."""
+    meta = _read_meta(snapshot_dir)
+    if meta is not None:
+        recorded = meta['journal']
+        size = os.path.getsize(journal_path)
+        if size >= recorded['size'] and _journal_probe(journal_path, recorded['size']) == recorded:
+            lines, end = _read_journal_lines(journal_path, recorded['size'])
+            if not any(line.strip() for line in lines):
+                return read_snapshot(meta, snapshot_dir)
+            decoder = TradeDecoder()
+            # Con JSON inválido se reconstruye (la reconstrucción compacta el journal)
+            if not decoder.decode_lines(lines, journal_path):
+                if decoder.rejected:
+                    previous_lines = _line_number(journal_path, recorded['size'])
+                    for item in decoder.rejected:
+                        item['linea'] += previous_lines
+                    decoder.warn()
+                df_snapshot = read_snapshot(meta, snapshot_dir)
+                extended = pp.concat_preprocessed([df_snapshot, decoder.to_frame()]) if decoder.rows else df_snapshot
+                try:
+                    if _append_snapshot(meta, extended, _journal_probe(journal_path, end), snapshot_dir):
+                        print(f"Snapshot extendido con {decoder.rows} trade(s) nuevo(s).")
+                        return read_snapshot(_read_meta(snapshot_dir), snapshot_dir)
+                except SnapshotUnsupported:
+                    return extended
+
+    return _rebuild(journal_path, snapshot_dir)
+
+def _rebuild(journal_path: str, snapshot_dir: str) -> pd.DataFrame:
+    """Decodifica el journal completo y escribe un snapshot nuevo."""
+    lines, end = _read_journal_lines(journal_path)
+    decoder = TradeDecoder()
+    if decoder.decode_lines(lines, journal_path):
+        # JSON inválido: la carga normal lo reporta y compacta el journal
+        dl._load_trades_journal(journal_path)
+        lines, end = _read_journal_lines(journal_path)
+        decoder = TradeDecoder()
+        decoder.decode_lines(lines, journal_path)
+    decoder.warn()
+
+    df_trades = decoder.to_frame()
+    try:
+        write_snapshot(df_trades, _journal_probe(journal_path, end), snapshot_dir)
+    except SnapshotUnsupported as e:
+        print(f"Advertencia: no se pudo crear el snapshot ({e}). Se usa el DataFrame en memoria.")
+        return df_trades
+    print(f"Snapshot reconstruido: {len(df_trades)} trades.")
+    return read_snapshot(_read_meta(snapshot_dir), snapshot_dir)
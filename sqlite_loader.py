@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Backend de almacenamiento SQLite con la misma interfaz que data_loader
+(load_all_data, load_trades_frame, add_trade, add_trades, load_trade_ids,
+add_confirmation, add_improvement).
+
+Los trades viven en una tabla normalizada y sus confirmaciones en una tabla de
+unión trade↔confirmación. Además de la carga completa, expone las métricas y el
+análisis de confirmaciones calculados directamente en SQL, sin cargar el
+historial en memoria.
+"""
+import json
+import os
+import sqlite3
+from typing import Iterator, List, Dict, Any, Set, TYPE_CHECKING
+
+import data_loader as dl
+from trade_record import MAX_REPORTED_REJECTED, Trade
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DB_FILE = os.path.join(dl.DATA_DIR, "bitacora.db")
+
+# Claves del trade con columna propia (clave del JSON -> columna SQL), en el orden del journal
+TRADE_COLUMNS = {
+    'activo': 'activo',
+    'accion': 'accion',
+    'resultado': 'resultado',
+    'ganancia/perdida': 'ganancia_perdida',
+    'tipo entrada': 'tipo_entrada',
+    'mejorar': 'mejorar',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    activo TEXT,
+    accion TEXT,
+    resultado REAL,
+    ganancia_perdida REAL,
+    tipo_entrada TEXT,
+    mejorar TEXT,
+    -- Claves adicionales del trade (JSON), para no perder campos libres
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_activo ON trades(activo);
+CREATE INDEX IF NOT EXISTS idx_trades_tipo_entrada ON trades(tipo_entrada);
+CREATE INDEX IF NOT EXISTS idx_trades_mejorar ON trades(mejorar);
+
+-- Todas las confirmaciones conocidas: las del catálogo y las usadas en trades
+CREATE TABLE IF NOT EXISTS confirmaciones (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE,
+    descripcion TEXT,
+    en_catalogo INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS trade_confirmaciones (
+    trade_id INTEGER NOT NULL REFERENCES trades(id),
+    confirmacion_id INTEGER NOT NULL REFERENCES confirmaciones(id),
+    -- Orden de la clave dentro del diccionario original del trade
+    posicion INTEGER NOT NULL,
+    valor INTEGER,
+    PRIMARY KEY (trade_id, confirmacion_id)
+);
+CREATE INDEX IF NOT EXISTS idx_trade_confirmaciones_confirmacion
+    ON trade_confirmaciones(confirmacion_id, valor);
+
+CREATE TABLE IF NOT EXISTS mejoras (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE,
+    descripcion TEXT
+);
+"""
+
+# Trades con ganancia/pérdida numérica. add_trade, add_trades y migrate_from_json
+# validan con Trade.from_raw; el filtro excluye además (como TradeDecoder, sin
+# contarlas como 0) las filas inválidas de bases creadas antes de esa validación.
+VALID_TRADE_SQL = "typeof(t.ganancia_perdida) IN ('integer', 'real')"
+PNL_SQL = "t.ganancia_perdida"
+
+def _connect(db_path: str = None) -> sqlite3.Connection:
+    """Abre la base de datos y crea el esquema si no existe."""
+    dl._initialize_data_directory()
+    conn = sqlite3.connect(db_path or DB_FILE)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _confirmation_id(conn: sqlite3.Connection, name: str) -> int:
+    """Id de una confirmación por nombre; la registra (fuera del catálogo) si no existe."""
+    row = conn.execute("SELECT id FROM confirmaciones WHERE nombre = ?", (name,)).fetchone()
+    if row is not None:
+        return row[0]
+    return conn.execute("INSERT INTO confirmaciones (nombre) VALUES (?)", (name,)).lastrowid
+
+def _insert_trade(conn: sqlite3.Connection, trade_data: Dict[str, Any]):
+    """Inserta un trade y sus confirmaciones (sin confirmar la transacción)."""
+    values = [trade_data.get(key) for key in TRADE_COLUMNS]
+    extra = {k: v for k, v in trade_data.items() if k not in TRADE_COLUMNS and k != 'confirmaciones'}
+    trade_id = conn.execute(
+        f"INSERT INTO trades ({', '.join(TRADE_COLUMNS.values())}, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        values + [json.dumps(extra, ensure_ascii=False) if extra else None]
+    ).lastrowid
+
+    confirmations = trade_data.get('confirmaciones')
+    if isinstance(confirmations, dict):
+        conn.executemany(
+            "INSERT INTO trade_confirmaciones (trade_id, confirmacion_id, posicion, valor) VALUES (?, ?, ?, ?)",
+            [(trade_id, _confirmation_id(conn, name), position, None if value is None else bool(value))
+             for position, (name, value) in enumerate(confirmations.items())]
+        )
+
+def _load_trades(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Reconstruye los trades como diccionarios con el mismo formato del journal."""
+    confirmations_by_trade = {}
+    for trade_id, name, value in conn.execute(
+        "SELECT tc.trade_id, c.nombre, tc.valor FROM trade_confirmaciones tc "
+        "JOIN confirmaciones c ON c.id = tc.confirmacion_id ORDER BY tc.trade_id, tc.posicion"
+    ):
+        confirmations_by_trade.setdefault(trade_id, {})[name] = None if value is None else bool(value)
+
+    invalid = [trade_id for (trade_id,) in conn.execute(f"SELECT id FROM trades t WHERE NOT {VALID_TRADE_SQL} ORDER BY id")]
+    if invalid:
+        shown = ", ".join(str(trade_id) for trade_id in invalid[:MAX_REPORTED_REJECTED])
+        print(f"Advertencia: {len(invalid)} trade(s) sin ganancia/pérdida numérica no se incluyen (id {shown}"
+              f"{'...' if len(invalid) > MAX_REPORTED_REJECTED else ''}).")
+
+    trades = []
+    for row in conn.execute(f"SELECT id, {', '.join(TRADE_COLUMNS.values())}, extra FROM trades t "
+                            f"WHERE {VALID_TRADE_SQL} ORDER BY id"):
+        trade_id, values, extra = row[0], row[1:-1], row[-1]
+        # Los campos nulos se tratan como ausentes, igual que en el journal original
+        trade = {key: value for key, value in zip(TRADE_COLUMNS, values) if value is not None}
+        if extra:
+            trade.update(json.loads(extra))
+        trade['confirmaciones'] = confirmations_by_trade.get(trade_id, {})
+        trades.append(trade)
+    return trades
+
+def _load_catalog(conn: sqlite3.Connection, query: str) -> List[Dict[str, str]]:
+    return [{'nombre': name, 'descripcion': description} for name, description in conn.execute(query)]
+
+def _load_catalogs(conn: sqlite3.Connection) -> Dict[str, List[Dict[str, str]]]:
+    return {
+        'confirmations': _load_catalog(conn, "SELECT nombre, descripcion FROM confirmaciones WHERE en_catalogo = 1 ORDER BY id"),
+        'improvements': _load_catalog(conn, "SELECT nombre, descripcion FROM mejoras ORDER BY id"),
+    }
+
+def load_all_data(db_path: str = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Carga los tres datasets principales del proyecto desde SQLite."""
+    conn = _connect(db_path)
+    try:
+        return {'trades': _load_trades(conn), **_load_catalogs(conn)}
+    finally:
+        conn.close()
+
+def load_trades_frame(db_path: str = None) -> 'pd.DataFrame':
+    """
+    DataFrame preprocesado de los trades (mismo esquema que preprocess_data),
+    sin cargar los catálogos ni pasar la lista de trades por la caché de análisis.
+    """
+    import preprocessor as pp
+
+    conn = _connect(db_path)
+    try:
+        trades = _load_trades(conn)
+    finally:
+        conn.close()
+    # Las filas ya se validaron al insertarse (y _load_trades omite las
+    # inválidas): preprocess_data es más rápido que volver a decodificarlas
+    return pp.preprocess_data(trades)
+
+def load_catalogs(db_path: str = None) -> Dict[str, List[Dict[str, str]]]:
+    """Carga solo los catálogos (confirmaciones y mejoras), sin los trades."""
+    conn = _connect(db_path)
+    try:
+        return _load_catalogs(conn)
+    finally:
+        conn.close()
+
+# --- Lógica de Persistencia (CRUD) ---
+
+def add_trade(trade_data: Dict[str, Any], db_path: str = None):
+    """Agrega un nuevo trade en una transacción de una sola fila (lanza InvalidTrade si no es válido)."""
+    Trade.from_raw(trade_data)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _insert_trade(conn, trade_data)
+    finally:
+        conn.close()
+    print(f"Trade agregado exitosamente: {trade_data.get('activo')}")
+
+def add_trades(trades: List[Dict[str, Any]], db_path: str = None):
+    """Agrega un lote de trades en una sola transacción (ninguno si alguno es inválido)."""
+    for trade_data in trades:
+        Trade.from_raw(trade_data)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            for trade_data in trades:
+                _insert_trade(conn, trade_data)
+    finally:
+        conn.close()
+
+def iter_trade_ids(db_path: str = None) -> Iterator[str]:
+    """Identificadores de broker (campo dl.TRADE_ID_FIELD) de los trades guardados, leídos con un cursor."""
+    conn = _connect(db_path)
+    try:
+        for (trade_id,) in conn.execute(
+            "SELECT json_extract(extra, ?) FROM trades WHERE extra IS NOT NULL", (f"$.{dl.TRADE_ID_FIELD}",)
+        ):
+            if trade_id is not None:
+                yield str(trade_id)
+    finally:
+        conn.close()
+
+def load_trade_ids(db_path: str = None) -> Set[str]:
+    """Conjunto de los identificadores de broker de los trades guardados (ver iter_trade_ids)."""
+    return set(iter_trade_ids(db_path))
+
+def add_confirmation(conf_data: Dict[str, str], db_path: str = None):
+    """Agrega una nueva confirmación al catálogo."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            row = conn.execute("SELECT en_catalogo FROM confirmaciones WHERE nombre = ?", (conf_data['nombre'],)).fetchone()
+            if row is not None and row[0]:
+                print(f"Advertencia: La confirmación '{conf_data['nombre']}' ya existe.")
+                return
+            # Puede existir ya como clave usada en trades, pero fuera del catálogo
+            conn.execute(
+                "INSERT INTO confirmaciones (nombre, descripcion, en_catalogo) VALUES (?, ?, 1) "
+                "ON CONFLICT(nombre) DO UPDATE SET descripcion = excluded.descripcion, en_catalogo = 1",
+                (conf_data['nombre'], conf_data.get('descripcion'))
+            )
+    finally:
+        conn.close()
+    print(f"Confirmación agregada: {conf_data['nombre']}")
+
+def add_improvement(improv_data: Dict[str, str], db_path: str = None):
+    """Agrega una nueva mejora al catálogo."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO mejoras (nombre, descripcion) VALUES (?, ?)",
+                                  (improv_data['nombre'], improv_data.get('descripcion')))
+    finally:
+        conn.close()
+    if cursor.rowcount:
+        print(f"Mejora agregada: {improv_data['nombre']}")
+    else:
+        print(f"Advertencia: La mejora '{improv_data['nombre']}' ya existe.")
+
+# --- Migración desde los archivos JSON ---
+
+def migrate_from_json(db_path: str = None) -> bool:
+    """
+    Importa el journal de trades y los catálogos JSON a una base vacía, en una
+    sola transacción. No hace nada si la base ya tiene datos. Retorna True si migró.
+    Los trades inválidos (ver trade_record) se reportan con su línea y se omiten.
+    """
+    conn = _connect(db_path)
+    try:
+        already_populated = any(
+            conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ('trades', 'confirmaciones', 'mejoras')
+        )
+        if already_populated:
+            return False
+
+        dl._migrate_legacy_trades()
+        # Misma validación que la carga del journal: los trades inválidos se
+        # reportan con su línea y no se migran (quedan en el journal JSON)
+        decoder = dl.decode_journals([dl.TRADES_FILE], keep_records=True, fill_columns=False)
+        trades = decoder.records
+        confirmations = dl._load_json_data(dl.CONFIRMATIONS_FILE)
+        improvements = dl._load_json_data(dl.IMPROVEMENTS_FILE)
+        with conn:
+            # El catálogo primero, para conservar su orden
+            conn.executemany("INSERT OR IGNORE INTO confirmaciones (nombre, descripcion, en_catalogo) VALUES (?, ?, 1)",
+                             [(c['nombre'], c.get('descripcion')) for c in confirmations])
+            conn.executemany("INSERT OR IGNORE INTO mejoras (nombre, descripcion) VALUES (?, ?)",
+                             [(i['nombre'], i.get('descripcion')) for i in improvements])
+            for trade in trades:
+                _insert_trade(conn, trade)
+    finally:
+        conn.close()
+    skipped = f", {len(decoder.rejected)} trades inválidos omitidos" if decoder.rejected else ""
+    print(f"Datos migrados a {db_path or DB_FILE}: {len(trades)} trades, "
+          f"{len(confirmations)} confirmaciones, {len(improvements)} mejoras{skipped}.")
+    return True
+
+# --- Agregaciones en SQL ---
+
+def _mode(conn: sqlite3.Connection, column: str) -> Any:
+    """Valor más frecuente de una columna; ante empates, el menor (como Series.mode().iloc[0])."""
+    row = conn.execute(
+        f"SELECT {column} FROM trades t WHERE {column} IS NOT NULL AND {VALID_TRADE_SQL} "
+        f"GROUP BY {column} ORDER BY COUNT(*) DESC, {column} ASC LIMIT 1"
+    ).fetchone()
+    return row[0] if row is not None else "N/A"
+
+def count_trades_sql(db_path: str = None) -> int:
+    """Cantidad de trades válidos de la base (los mismos que cuentan las métricas)."""
+    conn = _connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM trades t WHERE {VALID_TRADE_SQL}").fetchone()[0]
+    finally:
+        conn.close()
+
+def calculate_key_metrics_sql(db_path: str = None) -> Dict[str, Any]:
+    """Mismo resultado que analyzer.calculate_key_metrics, calculado en SQL sobre toda la base."""
+    conn = _connect(db_path)
+    try:
+        total, pnl_sum, winners, winners_sum, losers, losers_sum = conn.execute(
+            f"SELECT COUNT(*), TOTAL({PNL_SQL}), "
+            f"SUM({PNL_SQL} > 0), TOTAL(CASE WHEN {PNL_SQL} > 0 THEN {PNL_SQL} END), "
+            f"SUM({PNL_SQL} < 0), TOTAL(CASE WHEN {PNL_SQL} < 0 THEN {PNL_SQL} END) "
+            f"FROM trades t WHERE {VALID_TRADE_SQL}"
+        ).fetchone()
+        if total == 0:
+            return {"Error": "El DataFrame está vacío. No se pueden calcular métricas."}
+
+        def grouped(column: str, key: str) -> List[Dict[str, Any]]:
+            return [
+                {key: value, 'mean': mean, 'count': count}
+                for value, mean, count in conn.execute(
+                    f"SELECT {column}, AVG({PNL_SQL}), COUNT(*) FROM trades t "
+                    f"WHERE {column} IS NOT NULL AND {VALID_TRADE_SQL} GROUP BY {column} ORDER BY {column}"
+                )
+            ]
+
+        return {
+            'ganancia_promedio_total': winners_sum / winners if winners else 0,
+            'perdida_promedio_total': losers_sum / losers if losers else 0,
+            'rentabilidad_neta_total': pnl_sum,
+            'tasa_de_exito': winners / total,
+            'activo_mas_operado': _mode(conn, 'activo'),
+            'mejora_mas_repetitiva': _mode(conn, 'mejorar'),
+            'rendimiento_por_tipo_entrada': grouped('tipo_entrada', 'tipo entrada'),
+            'rendimiento_por_activo': grouped('activo', 'activo'),
+        }
+    finally:
+        conn.close()
+
+def analyze_confirmations_sql(db_path: str = None) -> Dict[str, Any]:
+    """Mismo resultado que analyzer.analyze_confirmations, calculado en SQL sobre toda la base."""
+    from analyzer import rank_confirmations
+
+    conn = _connect(db_path)
+    try:
+        # Confirmaciones usadas en algún trade, en el orden en que aparecieron
+        # (el mismo orden que las columnas conf_* del DataFrame)
+        rows = conn.execute(
+            f"SELECT c.nombre, "
+            f"       SUM(tc.valor = 1), "
+            f"       SUM(tc.valor = 1 AND {PNL_SQL} > 0), "
+            f"       SUM(tc.valor = 1 AND {PNL_SQL} < 0), "
+            f"       TOTAL(CASE WHEN tc.valor = 1 THEN {PNL_SQL} END) "
+            f"FROM trade_confirmaciones tc "
+            f"JOIN confirmaciones c ON c.id = tc.confirmacion_id "
+            f"JOIN trades t ON t.id = tc.trade_id "
+            f"WHERE {VALID_TRADE_SQL} "
+            f"GROUP BY c.id ORDER BY MIN(tc.trade_id * 1000000 + tc.posicion)"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    conf_results = {}
+    for name, total, wins, losses, pnl_sum in rows:
+        if not total:
+            conf_results[name] = {'total': 0, 'asertividad': 0, 'ineficiencia': 0, 'rentabilidad_promedio': 0}
+            continue
+        conf_results[name] = {
+            'total': total,
+            'asertividad': round(wins / total * 100, 2), # En porcentaje
+            'ineficiencia': round(losses / total * 100, 2), # En porcentaje
+            'rentabilidad_promedio': pnl_sum / total
+        }
+    return rank_confirmations(conf_results)
@@ -0,0 +1,689 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de equivalencia del pipeline: cada ruta optimizada debe dar el mismo
+resultado que la ruta completa que reemplaza.
+
+Uso:
+    python -m unittest test_pipeline
+    python -m pytest test_pipeline.py
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import tracemalloc
+import unittest
+import unittest.mock
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+import analysis_cache as ac
+import analyzer as an
+import data_loader as dl
+import importer
+import partitions as pt
+import preprocessor as pp
+import query
+import report
+import snapshot
+import sqlite_loader as sl
+import timeseries
+from catalog import CatalogService
+from instrumentation import PipelineStats
+from trade_record import InvalidTrade, Trade, TradeDecoder
+from ui_manager import TradingAnalysisApp
+
+ACTIVOS = ["ORO", "DJ30", "NAS100", "EURUSD"]
+ORDENES = ["BUY", "SELL", "BUY LIMIT", "SELL STOP"]
+TIPOS_ENTRADA = ["Rebrote", "Ruptura", "Rango"]
+MEJORAS = ["Toma Parcial", "Manejo Riego", "Ninguna"]
+
+def make_trades(n: int, seed: int = 0, confirmations: List[str] = None, first: int = 0) -> List[Dict[str, Any]]:
+    """Trades sintéticos con el esquema de movimientos.jsonl (fechas crecientes desde `first`)."""
+    rng = random.Random(seed)
+    confirmations = confirmations or [f"conf{i}" for i in range(6)]
+    trades = []
+    for i in range(first, first + n):
+        trade = {
+            'activo': rng.choice(ACTIVOS),
+            'accion': rng.choice(ORDENES),
+            'ganancia/perdida': round(rng.uniform(-100, 100), 2),
+            'tipo entrada': rng.choice(TIPOS_ENTRADA),
+            'mejorar': rng.choice(MEJORAS),
+            'confirmaciones': {key: True for key in confirmations if rng.random() < 0.4},
+            'apertura': f"2024-01-{1 + i // 48 % 28:02d}T{i % 24:02d}:00:00",
+            'cierre': f"2024-01-{1 + i // 48 % 28:02d}T{i % 24:02d}:30:00",
+        }
+        trades.append(trade)
+    return trades
+
+def quiet(func, *args, **kwargs):
+    """Ejecuta func sin los mensajes que imprime en consola."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+def preprocess(trades: List[Dict[str, Any]]) -> pd.DataFrame:
+    return quiet(pp.preprocess_data, trades)
+
+class EquivalenceTestCase(unittest.TestCase):
+    """Comparaciones tolerantes a diferencias de redondeo en sumas acumuladas."""
+
+    def assert_metrics_equal(self, got: Dict[str, Any], expected: Dict[str, Any]):
+        self.assertEqual(list(got), list(expected))
+        for key, value in expected.items():
+            if key.startswith('rendimiento_por_'):
+                self.assertEqual(len(got[key]), len(value), key)
+                for got_record, record in zip(got[key], value):
+                    self.assertEqual(list(got_record.values())[0], list(record.values())[0], key)
+                    self.assertAlmostEqual(got_record['mean'], record['mean'], places=9, msg=key)
+                    self.assertEqual(got_record['count'], record['count'], key)
+            elif isinstance(value, (float, np.floating)):
+                self.assertAlmostEqual(got[key], value, places=9, msg=key)
+            else:
+                self.assertEqual(got[key], value, key)
+
+    def assert_confirmations_equal(self, got: Dict[str, Any], expected: Dict[str, Any]):
+        self.assertEqual(list(got), list(expected))
+        for name, stats in expected.items():
+            self.assertEqual(got[name]['total'], stats['total'], name)
+            self.assertEqual(got[name]['asertividad'], stats['asertividad'], name)
+            self.assertEqual(got[name]['ineficiencia'], stats['ineficiencia'], name)
+            self.assertTrue(np.isclose(got[name]['rentabilidad_promedio'], stats['rentabilidad_promedio'],
+                                       equal_nan=True), name)
+
+    def assert_combinations_equal(self, got: Dict[str, Any], expected: Dict[str, Any]):
+        # Con promedios empatados el orden puede variar por el redondeo: se compara por combinación
+        def by_names(result):
+            return {tuple(sorted(record['confirmaciones'])): record for record in result['combinaciones']}
+        got_records, expected_records = by_names(got), by_names(expected)
+        self.assertEqual(got_records.keys(), expected_records.keys())
+        for names, record in expected_records.items():
+            for key, value in record.items():
+                if key == 'confirmaciones':
+                    continue
+                self.assertTrue(np.isclose(got_records[names][key], value), (names, key))
+
+# --- Preprocesamiento Incremental ---
+
+class ExtendPreprocessedTest(unittest.TestCase):
+    """extend_preprocessed debe ser idéntico a preprocess_data sobre todos los trades."""
+
+    def assert_extension_matches(self, history: List[Dict[str, Any]], new: List[Dict[str, Any]]):
+        extended = quiet(pp.extend_preprocessed, preprocess(history), new)
+        pd.testing.assert_frame_equal(extended, preprocess(history + new))
+
+    def test_same_schema(self):
+        trades = make_trades(60)
+        self.assert_extension_matches(trades[:50], trades[50:])
+
+    def test_one_trade_at_a_time(self):
+        trades = make_trades(20, seed=1)
+        df = preprocess(trades[:5])
+        for trade in trades[5:]:
+            df = quiet(pp.extend_preprocessed, df, [trade])
+        pd.testing.assert_frame_equal(df, preprocess(trades))
+
+    def test_new_confirmation_keys_are_false_for_older_rows(self):
+        history = make_trades(10, seed=2, confirmations=["hch", "doble_techo"])
+        new = make_trades(3, seed=3, confirmations=["hch"], first=10)
+        new[1]['confirmaciones']['divergencia'] = True
+        self.assert_extension_matches(history, new)
+        extended = quiet(pp.extend_preprocessed, preprocess(history), new)
+        self.assertFalse(extended['conf_divergencia'].iloc[:11].any())
+        self.assertTrue(extended['conf_divergencia'].iloc[11])
+        self.assertEqual(extended['conf_divergencia'].dtype, bool)
+
+    def test_new_base_column(self):
+        history = make_trades(8, seed=4)
+        new = make_trades(2, seed=5, first=8)
+        new[0]['ticket'] = "12345"
+        self.assert_extension_matches(history, new)
+
+    def test_missing_fields_in_new_trade(self):
+        history = make_trades(8, seed=6)
+        new = make_trades(2, seed=7, first=8)
+        del new[0]['accion'], new[1]['cierre'], new[1]['confirmaciones']
+        self.assert_extension_matches(history, new)
+
+    def test_empty_history_and_empty_new(self):
+        trades = make_trades(5, seed=8)
+        pd.testing.assert_frame_equal(quiet(pp.extend_preprocessed, preprocess([]), trades), preprocess(trades))
+        df = preprocess(trades)
+        self.assertIs(quiet(pp.extend_preprocessed, df, []), df)
+
+# --- Acumulador de Métricas ---
+
+class MetricsAccumulatorTest(EquivalenceTestCase):
+    """MetricsAccumulator debe dar el mismo diccionario que calculate_key_metrics."""
+
+    def test_seeded_from_history(self):
+        df = preprocess(make_trades(200, seed=10))
+        self.assert_metrics_equal(an.MetricsAccumulator(df).metrics(), an.calculate_key_metrics(df))
+
+    def test_incremental_updates(self):
+        df = preprocess(make_trades(120, seed=11))
+        accumulator = an.MetricsAccumulator(df.iloc[:40])
+        accumulator.update(df.iloc[40:41])
+        accumulator.update(df.iloc[41:])
+        self.assert_metrics_equal(accumulator.metrics(), an.calculate_key_metrics(df))
+
+    def test_empty_then_updated(self):
+        df = preprocess(make_trades(30, seed=12))
+        accumulator = an.MetricsAccumulator()
+        self.assertIn("Error", accumulator.metrics())
+        accumulator.update(df)
+        self.assert_metrics_equal(accumulator.metrics(), an.calculate_key_metrics(df))
+
+    def test_merge(self):
+        df = preprocess(make_trades(90, seed=13))
+        merged = an.MetricsAccumulator(df.iloc[:50])
+        merged.merge(an.MetricsAccumulator(df.iloc[50:]))
+        self.assert_metrics_equal(merged.metrics(), an.calculate_key_metrics(df))
+
+    def test_mode_ties_take_the_smallest(self):
+        trades = make_trades(4, seed=14)
+        for trade, activo in zip(trades, ["NAS100", "DJ30", "NAS100", "DJ30"]):
+            trade['activo'] = activo
+        df = preprocess(trades)
+        self.assertEqual(an.MetricsAccumulator(df).metrics()['activo_mas_operado'], "DJ30")
+        self.assertEqual(an.calculate_key_metrics(df)['activo_mas_operado'], "DJ30")
+
+    def test_mixed_types_in_free_form_fields(self):
+        accumulator = an.MetricsAccumulator()
+        for activo, mejorar in (("ORO", 1), (7, "Ninguna"), ("ORO", None), (7, 1), (None, "Ninguna")):
+            accumulator.add_trade(activo, mejorar, activo, 10.0)
+        metrics = accumulator.metrics()
+        self.assertEqual(metrics['activo_mas_operado'], 7)
+        self.assertEqual(metrics['mejora_mas_repetitiva'], 1)
+        self.assertEqual([record['activo'] for record in metrics['rendimiento_por_activo']], [7, "ORO"])
+
+# --- Forma Compacta ---
+
+class CompactTradesTest(EquivalenceTestCase):
+    """El análisis sobre compact_trades debe coincidir con el de la forma normal."""
+
+    def test_pack_round_trip(self):
+        rng = np.random.default_rng(40)
+        for n_confs in (0, 1, 63, 64, 65, 130):
+            matrix = rng.random((25, n_confs)) < 0.3
+            words = pp.pack_confirmations(matrix)
+            self.assertEqual(words.shape, (25, (n_confs + 63) // 64))
+            np.testing.assert_array_equal(pp.unpack_confirmations(words, n_confs), matrix)
+
+    def assert_analysis_matches(self, df: pd.DataFrame, combinations: bool = True):
+        compact = pp.compact_trades(df)
+        self.assert_metrics_equal(an.calculate_key_metrics(compact), an.calculate_key_metrics(df))
+        self.assert_metrics_equal(an.MetricsAccumulator(compact).metrics(), an.calculate_key_metrics(df))
+        self.assert_confirmations_equal(quiet(an.analyze_confirmations, compact)['analisis_completo'],
+                                        quiet(an.analyze_confirmations, df)['analisis_completo'])
+        if combinations:
+            self.assert_combinations_equal(an.analyze_confirmation_combinations(compact),
+                                           an.analyze_confirmation_combinations(df))
+
+    def test_analysis_matches_wide_form(self):
+        self.assert_analysis_matches(preprocess(make_trades(200, seed=41)))
+
+    def test_more_than_64_confirmations(self):
+        df = preprocess(make_trades(150, seed=42, confirmations=[f"c{i:03d}" for i in range(70)]))
+        self.assertGreater(len([col for col in df.columns if col.startswith('conf_')]), 64)
+        # Con tantas confirmaciones por trade las combinaciones frecuentes son demasiadas para una prueba
+        self.assert_analysis_matches(df, combinations=False)
+        names, words = pp.packed_confirmations(pp.compact_trades(df))
+        self.assertEqual(words.shape[1], 2)
+        wide = df[[f"conf_{name}" for name in names]].to_numpy(dtype=bool)
+        np.testing.assert_array_equal(pp.unpack_confirmations(words, len(names)), wide)
+
+    def test_unobserved_categories_are_not_reported(self):
+        compact = pp.compact_trades(preprocess(make_trades(200, seed=43)))
+        subset = compact[compact['activo'] == "ORO"]
+        self.assertGreater(len(subset['activo'].cat.categories), 1)
+        for metrics in (an.calculate_key_metrics(subset), an.MetricsAccumulator(subset).metrics()):
+            self.assertEqual([record['activo'] for record in metrics['rendimiento_por_activo']], ["ORO"])
+            self.assertTrue(all(record['count'] > 0 for record in metrics['rendimiento_por_tipo_entrada']))
+
+# --- Snapshot Columnar ---
+
+class SnapshotTest(unittest.TestCase):
+    """El snapshot (reconstruido o extendido) debe equivaler a preprocesar el journal completo."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp.name, "movimientos.jsonl")
+        self.snapshot_dir = os.path.join(self.tmp.name, ".snapshot")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def append(self, trades: List[Dict[str, Any]], mode: str = 'a'):
+        with open(self.journal, mode, encoding='utf-8') as f:
+            for trade in trades:
+                f.write(json.dumps(trade, ensure_ascii=False) + "\n")
+
+    def load(self) -> pd.DataFrame:
+        return quiet(snapshot.load_trades_frame, self.journal, self.snapshot_dir)
+
+    def assert_frame_matches(self, df: pd.DataFrame, trades: List[Dict[str, Any]]):
+        pd.testing.assert_frame_equal(df, preprocess(trades))
+
+    def test_rebuild_matches_preprocess(self):
+        trades = make_trades(80, seed=30)
+        self.append(trades)
+        self.assert_frame_matches(self.load(), trades)
+        # Sin cambios en el journal se abre el mismo snapshot
+        self.assert_frame_matches(self.load(), trades)
+
+    def test_append_matches_rebuild(self):
+        trades = make_trades(60, seed=31, confirmations=["hch", "doble_techo"])
+        new = make_trades(10, seed=32, confirmations=["hch"], first=60)
+        new[4]['confirmaciones']['divergencia'] = True
+        new[7]['ticket'] = "998"
+        self.append(trades)
+        self.load()
+        self.append(new)
+        extended = self.load()
+        self.assertFalse(extended['conf_divergencia'].iloc[:64].any())
+        self.assertTrue(extended['conf_divergencia'].iloc[64])
+        self.assert_frame_matches(extended, trades + new)
+        self.assert_frame_matches(self.load(), trades + new)
+
+    def test_stale_meta_does_not_append_twice(self):
+        trades = make_trades(10, seed=33)
+        self.append(trades[:4])
+        self.load()
+        self.append(trades[4:7])
+        meta_path = os.path.join(self.snapshot_dir, snapshot.META_FILE)
+        with open(meta_path, 'rb') as f:
+            stale_meta = f.read()
+        self.load()
+        # Otra instancia (o una caída antes de escribir meta.json) vuelve a ver el meta anterior
+        with open(meta_path, 'wb') as f:
+            f.write(stale_meta)
+        self.assert_frame_matches(self.load(), trades[:7])
+        self.append(trades[7:])
+        self.assert_frame_matches(self.load(), trades)
+
+    def test_rewritten_journal_is_rebuilt(self):
+        trades = make_trades(30, seed=34)
+        self.append(trades)
+        self.load()
+        self.append(trades[10:], mode='w')
+        self.assert_frame_matches(self.load(), trades[10:])
+
+# --- Importación del Broker ---
+
+class ImporterTest(unittest.TestCase):
+    """La importación rechaza los trades sin ganancia/pérdida y omite todos los tickets repetidos."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, "historial.csv")
+        self.saved = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rows: List[str]):
+        with open(self.csv, 'w', encoding='utf-8') as f:
+            f.write("\n".join(["Ticket,Symbol,Type,Profit,Commission"] + rows) + "\n")
+
+    def import_rows(self, rows: List[str], **kwargs) -> Dict[str, int]:
+        self.write(rows)
+        return quiet(importer.import_trades, self.csv, self.saved.extend, lambda: {"1"}, **kwargs)
+
+    def test_invalid_pnl_is_rejected_with_its_line(self):
+        rows = ["1,ORO,buy,10,0", "2,ORO,buy,,0", "3,DJ30,sell,abc,-1", "4,,balance,,",
+                "5,ORO,buy,5.5,", "6,ORO,buy,-2,-0.5"]
+        rejected = []
+        self.write(rows)
+        chunk = pd.read_csv(self.csv, dtype=str, keep_default_na=False)
+        mapping = importer.resolve_columns(chunk.columns)
+        importer.chunk_to_trades(chunk, mapping, rejected, self.csv)
+        self.assertEqual([(item['linea'], item['valor']) for item in rejected], [(3, ""), (4, "abc")])
+
+        stats = self.import_rows(rows, chunk_rows=2)
+        self.assertEqual(stats['rechazados'], 2)
+        self.assertEqual(stats['duplicados'], 1)
+        self.assertEqual(stats['omitidos'], 1)
+        self.assertEqual([(trade['ticket'], trade['ganancia/perdida']) for trade in self.saved],
+                         [("5", 5.5), ("6", -2.5)])
+
+    def test_repeats_are_caught_anywhere_in_the_file(self):
+        rows = [f"{i},ORO,buy,1,0" for i in (10, 11, 10, 12, 13, 14, 11, "A-7", "007", "7", "A-7", 1)]
+        stats = self.import_rows(rows, chunk_rows=3)
+        # 10 y 11 se repiten en bloques posteriores; "A-7" no es entero; "007" y "7" son tickets distintos
+        self.assertEqual(stats['duplicados'], 4)
+        self.assertEqual([trade['ticket'] for trade in self.saved], ["10", "11", "12", "13", "14", "A-7", "007", "7"])
+
+    def test_ticket_set(self):
+        tickets = importer.TicketSet(str(i) for i in range(0, 300_000, 3))
+        tickets.add(["1", "x", "0012", str(2**62)])
+        self.assertEqual(len(tickets), 100_004)
+        query = ["0", "1", "2", "299997", "299998", "x", "y", "12", "0012", str(2**62), "9" * 30]
+        self.assertEqual(tickets.contains(query).tolist(),
+                         [True, True, False, True, False, True, False, True, True, True, False])
+        self.assertFalse(importer.TicketSet().contains(["1", "a"]).any())
+
+# --- Refresco Incremental de la UI ---
+
+class RefreshStagesTest(EquivalenceTestCase):
+    """Agregar trades sin recargar debe dar el mismo resultado que una recarga completa."""
+
+    def make_app(self, trades: List[Dict[str, Any]]) -> SimpleNamespace:
+        """Lo que _run_refresh_stages usa de TradingAnalysisApp, sin crear la ventana."""
+        def load_all_data():
+            return {'trades': list(trades), 'confirmations': [], 'improvements': []}
+        return SimpleNamespace(
+            stats=PipelineStats(), refresh_generation=0, loader={'load_all_data': load_all_data},
+            catalog=CatalogService(load_all_data, lambda record: None, lambda record: None),
+            preprocess=pp.preprocess_data, extend_preprocessed=pp.extend_preprocessed,
+            analyze={'calculate_key_metrics': an.calculate_key_metrics,
+                     'analyze_confirmations': an.analyze_confirmations,
+                     'metrics_accumulator': an.MetricsAccumulator,
+                     'analyze_combinations': an.analyze_confirmation_combinations,
+                     'equity_curve': timeseries.EquityCurve,
+                     'trade_index': query.TradeIndex})
+
+    def refresh(self, app, reload: bool, state: Dict[str, Any] = None, filters: Dict[str, Any] = None,
+                new_trades: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        state = state or {}
+        return quiet(TradingAnalysisApp._run_refresh_stages, app, 0, reload, state.get('df_trades'),
+                     state.get('metrics_accumulator'), state.get('equity_curve'), state.get('trade_index'),
+                     filters or {}, list(new_trades))
+
+    def assert_refresh_equal(self, got: Dict[str, Any], expected: Dict[str, Any]):
+        pd.testing.assert_frame_equal(got['df_trades'], expected['df_trades'])
+        self.assert_metrics_equal(got['key_metrics'], expected['key_metrics'])
+        self.assert_confirmations_equal(got['conf_analysis']['analisis_completo'],
+                                        expected['conf_analysis']['analisis_completo'])
+        self.assertEqual(got['conf_analysis']['top_3_confirmaciones_rentables'],
+                         expected['conf_analysis']['top_3_confirmaciones_rentables'])
+        self.assert_combinations_equal(got['combinations'], expected['combinations'])
+        for got_array, array in zip(got['histogram'], expected['histogram']):
+            np.testing.assert_allclose(got_array, array)
+        self.assertEqual(got.get('filtered'), expected.get('filtered'))
+        np.testing.assert_allclose(got['equity_curve'].equity, expected['equity_curve'].equity)
+        self.assertEqual(got['equity_curve'].summary(), expected['equity_curve'].summary())
+        np.testing.assert_allclose(got['view_equity_curve'].equity, expected['view_equity_curve'].equity)
+        self.assertEqual(got['trade_index'].options(), expected['trade_index'].options())
+
+    def check(self, filters: Dict[str, Any] = None):
+        trades = make_trades(150, seed=20)
+        history, batches = trades[:100], [trades[100:101], trades[101:130], trades[130:]]
+        app = self.make_app(history)
+        state = self.refresh(app, True, filters=filters)
+        for batch in batches:
+            state = self.refresh(app, False, state, filters, batch)
+            self.assertEqual(state['applied_trades'], len(batch))
+        self.assert_refresh_equal(state, self.refresh(self.make_app(trades), True, filters=filters))
+
+    def test_new_trades_without_filters(self):
+        self.check()
+
+    def test_new_trades_with_filters(self):
+        self.check({'activo': ["ORO", "DJ30"], 'con': ["conf1"]})
+
+    def test_discarded_refresh_leaves_state_untouched(self):
+        trades = make_trades(40, seed=21)
+        app = self.make_app(trades[:30])
+        state = self.refresh(app, True)
+        count = state['metrics_accumulator'].total_trades
+        curve = state['equity_curve'].equity
+        self.refresh(app, False, state, new_trades=trades[30:])
+        self.assertEqual(state['metrics_accumulator'].total_trades, count)
+        self.assertIs(state['equity_curve'].equity, curve)
+        self.assertEqual(len(state['df_trades']), 30)
+
+# --- Decodificación Validada ---
+
+# Líneas inválidas de los journals de prueba: posición entre los trades -> (texto, campo rechazado)
+INVALID_LINES = {
+    3: ('{"activo": "ORO", "ganancia/perdida": "abc", "confirmaciones": {}}', 'ganancia/perdida'),
+    7: ('{"activo": "ORO", "accion": "BUY", "confirmaciones": {}}', 'ganancia/perdida'),
+    8: ('{"activo": "DJ30", "ganancia/perdida": 5, "cierre": "ayer"}', 'cierre'),
+    12: ('{"activo": "DJ30", "ganancia/perdida": 5, "confirmaciones": ["hch"]}', 'confirmaciones'),
+    15: ('[1, 2]', None),
+}
+
+class TradeDecoderTest(EquivalenceTestCase):
+    """TradeDecoder valida como Trade.from_raw y da el mismo DataFrame que preprocess_data."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def write_journal(self, path: str, trades: List[Dict[str, Any]]) -> List[int]:
+        """Escribe los trades intercalando las líneas inválidas; retorna sus números de línea."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines, numbers = [], []
+        for i, trade in enumerate(trades):
+            if i in INVALID_LINES:
+                lines.append(INVALID_LINES[i][0])
+                numbers.append(len(lines))
+            lines.append(json.dumps(trade, ensure_ascii=False))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return numbers
+
+    def assert_rejected(self, rejected: List[Dict[str, Any]], path: str, numbers: List[int]):
+        self.assertEqual([(item['archivo'], item['linea']) for item in rejected], [(path, n) for n in numbers])
+        self.assertEqual([item['campo'] for item in rejected], [field for _, field in INVALID_LINES.values()])
+
+    def test_frame_matches_preprocess(self):
+        trades = make_trades(120, seed=50)
+        trades[5]['ticket'] = "77"
+        trades[9]['confirmaciones'] = {'conf1': None, 'nueva': True}
+        decoder = TradeDecoder()
+        decoder.decode_lines([json.dumps(trade) for trade in trades])
+        self.assertEqual(decoder.rejected, [])
+        pd.testing.assert_frame_equal(decoder.to_frame(), preprocess(trades))
+
+    def test_rejects_carry_line_numbers(self):
+        path = os.path.join(self.tmp.name, "movimientos.jsonl")
+        trades = make_trades(20, seed=51)
+        numbers = self.write_journal(path, trades)
+        decoder = quiet(dl.decode_journals, [path], keep_records=True)
+        self.assert_rejected(decoder.rejected, path, numbers)
+        self.assertEqual(decoder.records, trades)
+        pd.testing.assert_frame_equal(decoder.to_frame(), preprocess(trades))
+
+        records_only = quiet(dl.decode_journals, [path], keep_records=True, fill_columns=False)
+        self.assert_rejected(records_only.rejected, path, numbers)
+        self.assertEqual(records_only.records, trades)
+        self.assertEqual(records_only.columns, {})
+        with self.assertRaises(ValueError):
+            records_only.to_frame()
+
+    def test_compaction_keeps_torn_tail(self):
+        path = os.path.join(self.tmp.name, "movimientos.jsonl")
+        trades = make_trades(3, seed=56)
+        torn = json.dumps(trades[2])[:-5]
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(trades[0]) + "\n{roto\n" + json.dumps(trades[1]) + "\n" + torn)
+        self.assertEqual(quiet(dl.compact_trades_journal, path), trades[:2])
+        with open(path + ".rechazados", encoding='utf-8') as f:
+            self.assertEqual(f.read(), "{roto\n" + torn + "\n")
+
+    def test_report_does_not_rewrite_journal(self):
+        path = os.path.join(self.tmp.name, "movimientos.jsonl")
+        trades = make_trades(10, seed=57)
+        lines = [json.dumps(trade) for trade in trades]
+        lines.insert(4, "{roto")
+        content = "\n".join(lines) + "\n"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        result = quiet(report.analyze_journal, self.tmp.name)
+        self.assertEqual(result['trades'], len(trades))
+        self.assertEqual([(item['linea'], item['campo']) for item in result['rechazados']], [(5, None)])
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(path + ".rechazados"))
+
+    def test_rollback(self):
+        trades = make_trades(30, seed=52)
+        decoder = TradeDecoder(keep_records=True)
+        decoder.decode_lines([json.dumps(trade) for trade in trades[:20]])
+        checkpoint = decoder.checkpoint()
+        extra = make_trades(5, seed=53, confirmations=["solo_aqui"], first=20)
+        extra[0]['ticket'] = "1"
+        decoder.decode_lines([json.dumps(trade) for trade in extra] + ["{roto"])
+        decoder.rollback(checkpoint)
+        self.assertEqual(decoder.rejected, [])
+        self.assertEqual(decoder.records, trades[:20])
+        decoder.decode_lines([json.dumps(trade) for trade in trades[20:]], first_line=21)
+        pd.testing.assert_frame_equal(decoder.to_frame(), preprocess(trades))
+
+    def test_trade_round_trip(self):
+        for trade in make_trades(20, seed=54):
+            self.assertEqual(Trade.from_raw(trade).to_raw(), trade)
+        for line, field in INVALID_LINES.values():
+            with self.assertRaises(InvalidTrade) as raised:
+                Trade.from_raw(json.loads(line))
+            self.assertEqual(raised.exception.field, field or "trade")
+
+    def test_backends_agree(self):
+        """JSON, movimientos.json antiguo, SQLite, reporte y particiones excluyen los mismos trades."""
+        os.chdir(self.tmp.name)
+        trades = make_trades(40, seed=55)
+        numbers = self.write_journal(dl.TRADES_FILE, trades)
+        for name in (dl.CONFIRMATIONS_FILE, dl.IMPROVEMENTS_FILE):
+            with open(name, 'w', encoding='utf-8') as f:
+                f.write("[]")
+        expected = an.calculate_key_metrics(preprocess(trades))
+
+        self.assertEqual(quiet(dl.load_all_data)['trades'], trades)
+        pd.testing.assert_frame_equal(quiet(dl.load_trades_frame), preprocess(trades))
+        journal_report = quiet(report.analyze_journal, dl.DATA_DIR)
+        self.assert_metrics_equal(journal_report['metricas'], expected)
+        self.assert_rejected(journal_report['rechazados'], dl.TRADES_FILE, numbers)
+
+        db_path = os.path.join(self.tmp.name, "bitacora.db")
+        self.assertTrue(quiet(sl.migrate_from_json, db_path))
+        self.assertEqual(len(quiet(sl.load_all_data, db_path)['trades']), len(trades))
+        pd.testing.assert_frame_equal(quiet(sl.load_trades_frame, db_path), preprocess(trades))
+        self.assert_metrics_equal(sl.calculate_key_metrics_sql(db_path), expected)
+        self.assert_confirmations_equal(sl.analyze_confirmations_sql(db_path)['analisis_completo'],
+                                        quiet(an.analyze_confirmations, preprocess(trades))['analisis_completo'])
+        # Una fila inválida de una base anterior a la validación no cuenta como 0
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("INSERT INTO trades (activo, ganancia_perdida) VALUES ('ORO', 'abc')")
+        conn.close()
+        self.assert_metrics_equal(sl.calculate_key_metrics_sql(db_path), expected)
+        self.assertEqual(len(quiet(sl.load_all_data, db_path)['trades']), len(trades))
+        database_report = report.run_database_report(db_path)
+        self.assertEqual(database_report['resumen']['trades'], len(trades))
+        self.assert_metrics_equal(database_report['resumen']['metricas'], expected)
+
+        legacy_dir = os.path.join(self.tmp.name, "antigua")
+        os.makedirs(legacy_dir)
+        legacy = [json.loads(line) for line, _ in INVALID_LINES.values()] + trades
+        with open(os.path.join(legacy_dir, os.path.basename(dl.LEGACY_TRADES_FILE)), 'w', encoding='utf-8') as f:
+            json.dump(legacy, f)
+        self.assertEqual(quiet(dl.load_all_data, legacy_dir)['trades'], trades)
+        legacy_report = quiet(report.analyze_journal, legacy_dir)
+        self.assert_metrics_equal(legacy_report['metricas'], expected)
+        self.assertEqual([item['linea'] for item in legacy_report['rechazados']], [1, 2, 3, 4, 5])
+
+        partitions_dir = os.path.join(self.tmp.name, "particiones")
+        partition = pt.partition_path((pt.DEFAULT_ACCOUNT, "2024-01"), partitions_dir)
+        numbers = self.write_journal(partition, trades)
+        partition_report = quiet(report.analyze_partitions, pt.DEFAULT_ACCOUNT, partitions_dir)
+        self.assert_metrics_equal(partition_report['metricas'], expected)
+        self.assert_rejected(partition_report['rechazados'], partition, numbers)
+        # Los rechazos también salen de los agregados ya guardados
+        cached_report = quiet(report.analyze_partitions, pt.DEFAULT_ACCOUNT, partitions_dir)
+        self.assert_rejected(cached_report['rechazados'], partition, numbers)
+
+# --- Instrumentación ---
+
+class PipelineStatsTest(unittest.TestCase):
+    """El pico de memoria de una etapa incluye lo que pasó antes de sus etapas internas."""
+
+    def test_nested_stage_keeps_outer_peak(self):
+        already_tracing = tracemalloc.is_tracing()
+        stats = PipelineStats(trace_memory=True)
+        try:
+            with stats.stage('externa'):
+                buffer = bytearray(8 * 2**20)
+                del buffer
+                with stats.stage('interna'):
+                    small = bytearray(2**20)
+                    del small
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+        self.assertGreaterEqual(stats.stages['externa']['memoria_pico_mb'], 8)
+        self.assertLess(stats.stages['interna']['memoria_pico_mb'], 4)
+
+# --- Caché de Análisis ---
+
+class AnalysisCacheDigestTest(unittest.TestCase):
+    """El hash de un archivo que solo creció debe cambiar sin releer el archivo entero."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp.name, "movimientos.jsonl")
+        self.cache = ac.AnalysisCache(os.path.join(self.tmp.name, "cache"), [self.journal])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data: bytes, mode: str = 'ab'):
+        with open(self.journal, mode) as f:
+            f.write(data)
+
+    def test_append_hashes_only_the_tail(self):
+        self.write(b"a" * 300000)
+        first = self.cache._file_digest(self.journal)
+        self.write(b"b" * 10)
+        reads = []
+        original_open = open
+        def counting_open(path, *args, **kwargs):
+            f = original_open(path, *args, **kwargs)
+            original_read = f.read
+            def read(*read_args):
+                data = original_read(*read_args)
+                reads.append(len(data))
+                return data
+            f.read = read
+            return f
+        with unittest.mock.patch('builtins.open', counting_open):
+            second = self.cache._file_digest(self.journal)
+        self.assertNotEqual(first, second)
+        self.assertLess(sum(reads), 3 * ac.APPEND_PROBE_BYTES)
+        self.assertEqual(self.cache._file_digest(self.journal), second)
+
+    def test_rewritten_prefix_is_rehashed(self):
+        self.write(b"a" * 1000)
+        self.cache._file_digest(self.journal)
+        self.write(b"c" * 1000 + b"tail", mode='wb')
+        rewritten = self.cache._file_digest(self.journal)
+        fresh = ac.AnalysisCache(os.path.join(self.tmp.name, "otra"), [self.journal])
+        self.assertEqual(rewritten, fresh._file_digest(self.journal))
+
+    def test_none_result_is_a_hit(self):
+        self.write(b"{}\n")
+        calls = []
+        stage = self.cache.cached('sin_resultado', lambda: calls.append(1))
+        self.assertIsNone(stage())
+        self.assertIsNone(stage())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_code_signature_covers_the_project_modules(self):
+        signature = ac.AnalysisCache._code_signature(an.calculate_key_metrics)
+        self.assertIn(ac.AnalysisCache._project_signature(), signature)
+        self.assertNotEqual(signature, ac.AnalysisCache._code_signature(pp.preprocess_data))
+
+if __name__ == '__main__':
+    unittest.main()
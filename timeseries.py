@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Series temporales del journal: curva de capital, drawdown y estadísticas móviles.
+
+Los trades se ordenan por su fecha de cierre ('cierre'); los que no la tienen
+(p. ej. los registrados antes de guardar fechas) heredan la del trade anterior
+del journal, así que el historial antiguo queda al principio en su orden original.
+Todo se calcula con sumas y máximos acumulados de NumPy en una sola pasada, y la
+curva se puede extender con trades nuevos sin recorrer el historial.
+"""
+from typing import Any, Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+import preprocessor as pp
+
+# Ventanas (en trades) de la tasa de éxito y la rentabilidad promedio móviles
+DEFAULT_WINDOWS = (20, 50)
+# Clave de orden de los trades sin fecha de cierre (antes de cualquier fecha)
+NO_TIME_KEY = np.iinfo(np.int64).min
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def close_time_keys(df_trades: pd.DataFrame, previous: int = NO_TIME_KEY) -> np.ndarray:
+    """
+    Clave de orden cronológico de cada trade: segundos de la fecha de cierre.
+    Los nulos toman la clave del trade anterior (previous para el primero).
+    """
+    n = len(df_trades)
+    if 'cierre' not in df_trades.columns:
+        return np.full(n, previous, dtype=np.int64)
+    times = pd.to_datetime(df_trades['cierre'], format='ISO8601', errors='coerce').to_numpy(dtype=pp.TIMESTAMP_DTYPE)
+    valid = ~np.isnat(times)
+    # Relleno hacia adelante vectorizado: índice del último cierre conocido en cada fila
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(n), -1))
+    return np.where(last_valid >= 0, times.view(np.int64)[np.maximum(last_valid, 0)], previous)
+
+class EquityCurve:
+    """
+    Curva de capital incremental en orden cronológico de cierre.
+
+    Guarda la ganancia/pérdida ordenada, sus sumas acumuladas (capital y trades
+    ganadores) y el estado del drawdown (pico vigente, drawdown y duración
+    máximos). Agregar trades que cierran después del último solo procesa los
+    nuevos; si llega uno anterior, la curva se reordena completa.
+    """
+    def __init__(self, df_trades: pd.DataFrame = None, windows: Iterable[int] = DEFAULT_WINDOWS):
+        self.windows = tuple(windows)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.pnl = np.empty(0, dtype=float)
+        self.equity = np.empty(0, dtype=float)
+        self.wins = np.empty(0, dtype=np.int64)
+        # Clave del último trade en orden del journal (para el relleno de cierres nulos)
+        self.last_journal_key = NO_TIME_KEY
+        self._reset_drawdown()
+        if df_trades is not None and not df_trades.empty:
+            self.extend(df_trades)
+
+    def _reset_drawdown(self):
+        self.peak = 0.0
+        # Posición del pico vigente (-1: el capital inicial, antes del primer trade)
+        self.peak_index = -1
+        self.max_drawdown = 0.0
+        self.max_drawdown_trades = 0
+        self.max_drawdown_seconds = 0
+
+    def __len__(self) -> int:
+        return len(self.pnl)
+
+    def extend(self, df_new: pd.DataFrame):
+        """Incorpora trades nuevos ya preprocesados (p. ej. la cola de df_trades)."""
+        if df_new.empty:
+            return
+        keys = close_time_keys(df_new, self.last_journal_key)
+        pnl = df_new['ganancia/perdida'].to_numpy(dtype=float)
+        self.last_journal_key = int(keys[-1])
+
+        if len(self) and keys.min() < self.keys[-1]:
+            # Un cierre anterior al último: se reordena y recalcula todo. El orden
+            # estable deja los empates como en el journal (históricos primero).
+            keys = np.concatenate([self.keys, keys])
+            pnl = np.concatenate([self.pnl, pnl])
+            self.keys, self.pnl = self.keys[:0], self.pnl[:0]
+            self.equity, self.wins = self.equity[:0], self.wins[:0]
+            self._reset_drawdown()
+        order = np.argsort(keys, kind='stable')
+        self._append(keys[order], pnl[order])
+
+    @classmethod
+    def combine(cls, curves: Iterable['EquityCurve'], windows: Iterable[int] = DEFAULT_WINDOWS) -> 'EquityCurve':
+        """
+        Curva de varios historiales (p. ej. las particiones de una cuenta) a partir
+        de sus curvas ya calculadas, sin volver a leer los trades: une los trades
+        de todas y los ordena por fecha de cierre (los empates quedan en el orden
+        de `curves`).
+        """
+        curves = [curve for curve in curves if len(curve)]
+        combined = cls(windows=windows)
+        if curves:
+            keys = np.concatenate([curve.keys for curve in curves])
+            pnl = np.concatenate([curve.pnl for curve in curves])
+            order = np.argsort(keys, kind='stable')
+            combined._append(keys[order], pnl[order])
+            combined.last_journal_key = curves[-1].last_journal_key
+        return combined
+
+    def _append(self, keys: np.ndarray, pnl: np.ndarray):
+        """Extiende las series acumuladas y el estado del drawdown en una pasada."""
+        start = len(self)
+        positions = np.arange(start, start + len(pnl))
+        # Se acumula desde el último valor para sumar en el mismo orden que una reconstrucción completa
+        last_equity = self.equity[-1] if start else 0.0
+        equity = np.cumsum(np.concatenate([[last_equity], pnl]))[1:]
+        wins = np.cumsum(pnl > 0) + (self.wins[-1] if start else 0)
+
+        self.keys = np.concatenate([self.keys, keys])
+        self.pnl = np.concatenate([self.pnl, pnl])
+        self.equity = np.concatenate([self.equity, equity])
+        self.wins = np.concatenate([self.wins, wins])
+
+        peak = np.maximum.accumulate(np.concatenate([[self.peak], equity]))[1:]
+        peak_index = np.maximum.accumulate(np.where(equity >= peak, positions, self.peak_index))
+        drawdown = equity - peak
+        # Duración del drawdown vigente en cada trade: en trades y en segundos desde el pico
+        duration_trades = positions - peak_index
+        peak_keys = self.keys[np.maximum(peak_index, 0)]
+        timed = (peak_keys != NO_TIME_KEY) & (keys != NO_TIME_KEY)
+        duration_seconds = np.where(timed, keys - peak_keys, 0)
+
+        self.peak, self.peak_index = float(peak[-1]), int(peak_index[-1])
+        self.max_drawdown = min(self.max_drawdown, float(drawdown.min()))
+        self.max_drawdown_trades = max(self.max_drawdown_trades, int(duration_trades.max()))
+        self.max_drawdown_seconds = max(self.max_drawdown_seconds, int(duration_seconds.max()))
+
+    def drawdown(self) -> np.ndarray:
+        """Distancia (<= 0) del capital a su máximo previo, por trade."""
+        peak = np.maximum.accumulate(np.concatenate([[0.0], self.equity]))[1:]
+        return self.equity - peak
+
+    def rolling(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tasa de éxito y rentabilidad promedio de los últimos `window` trades, por
+        trade (NaN hasta completar la primera ventana). Diferencias de sumas acumuladas.
+        """
+        n = len(self)
+        win_rate = np.full(n, np.nan)
+        mean_pnl = np.full(n, np.nan)
+        if window > 0 and n >= window:
+            wins = np.concatenate([[0], self.wins])
+            equity = np.concatenate([[0.0], self.equity])
+            win_rate[window - 1:] = (wins[window:] - wins[:-window]) / window
+            mean_pnl[window - 1:] = (equity[window:] - equity[:-window]) / window
+        return win_rate, mean_pnl
+
+    def close_times(self) -> np.ndarray:
+        """Fecha de cierre efectiva de cada trade de la curva (NaT si no se conoce)."""
+        # NO_TIME_KEY coincide con la representación entera de NaT
+        return self.keys.view(pp.TIMESTAMP_DTYPE)
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen de la curva: capital final, drawdown actual y máximo, y últimas ventanas móviles."""
+        n = len(self)
+        moving = {}
+        for window in self.windows:
+            if n >= window:
+                previous = window < n
+                wins = self.wins[-1] - (self.wins[-window - 1] if previous else 0)
+                pnl = self.equity[-1] - (self.equity[-window - 1] if previous else 0.0)
+                moving[window] = {'tasa_de_exito': float(wins) / window, 'rentabilidad_promedio': float(pnl) / window}
+            else:
+                moving[window] = {'tasa_de_exito': None, 'rentabilidad_promedio': None}
+        return {
+            'trades': n,
+            'rentabilidad_acumulada': float(self.equity[-1]) if n else 0.0,
+            'drawdown_actual': float(self.equity[-1]) - self.peak if n else 0.0,
+            'drawdown_maximo': self.max_drawdown,
+            'duracion_drawdown_trades': self.max_drawdown_trades,
+            'duracion_drawdown_dias': round(self.max_drawdown_seconds / SECONDS_PER_DAY, 2),
+            'ventanas': moving,
+        }
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Registro tipado de un trade y decodificación validada del journal a columnas.
+
+Trade es la forma tipada (con __slots__) de una línea del journal: los campos
+conocidos ya convertidos y validados, y el resto en `extra`. TradeDecoder valida
+y convierte cada línea en una sola pasada directamente a columnas (un arreglo
+por campo: array('d') para los números, array('q') con los segundos de las
+fechas, listas con textos compartidos para el resto, y las posiciones de las
+confirmaciones), sin la lista de diccionarios ni pd.DataFrame(registros).
+
+Un trade inválido (ganancia/perdida faltante o no numérica, fecha ilegible,
+confirmaciones que no son un objeto...) no se convierte en 0 ni en NaN: se
+descarta y se reporta con su archivo y número de línea. to_frame() produce el
+mismo DataFrame que preprocessor.preprocess_data con los trades válidos, salvo
+que 'ganancia/perdida' y 'resultado' son siempre float64 y las fechas con zona
+horaria se pasan a UTC.
+
+Este módulo no importa pandas (lo usa data_loader al arrancar); to_frame lo
+importa al construir el DataFrame.
+"""
+import json
+import math
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+PNL_FIELD = 'ganancia/perdida'
+RESULT_FIELD = 'resultado'
+TEXT_FIELDS = ('activo', 'accion', 'tipo entrada', 'mejorar')
+TIMESTAMP_FIELDS = ('apertura', 'cierre')
+CONFIRMATIONS_FIELD = 'confirmaciones'
+# Tipo de columna de cada campo conocido (los demás se guardan tal cual)
+NUMERIC, TIMESTAMP, TEXT, CONFIRMATIONS = 'numerico', 'fecha', 'texto', 'confirmaciones'
+FIELD_KINDS = {PNL_FIELD: NUMERIC, RESULT_FIELD: NUMERIC, CONFIRMATIONS_FIELD: CONFIRMATIONS,
+               **{name: TEXT for name in TEXT_FIELDS}, **{name: TIMESTAMP for name in TIMESTAMP_FIELDS}}
+# Representación entera de NaT en datetime64 (segundos desde 1970)
+NAT_SECONDS = -2**63
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+# Trades inválidos que se detallan en la advertencia (el resto solo se cuenta)
+MAX_REPORTED_REJECTED = 20
+
+class InvalidTrade(ValueError):
+    """Un campo de un trade no tiene un valor válido."""
+    def __init__(self, field_name: str, value: Any, message: str):
+        super().__init__(f"'{field_name}' = {value!r}: {message}")
+        self.field = field_name
+        self.value = value
+
+# --- Validación por Campo ---
+
+def parse_number(field_name: str, value: Any, required: bool = False) -> float:
+    """Número (o texto numérico) como float; NaN si falta y no es obligatorio."""
+    if isinstance(value, bool):
+        raise InvalidTrade(field_name, value, "no es un número")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str) and value.strip():
+        try:
+            number = float(value)
+        except ValueError:
+            raise InvalidTrade(field_name, value, "no es un número") from None
+    elif value is None or value == "":
+        number = math.nan
+    else:
+        raise InvalidTrade(field_name, value, "no es un número")
+    if required and number != number:
+        raise InvalidTrade(field_name, value, "falta el valor")
+    return number
+
+def parse_timestamp(field_name: str, value: Any) -> Optional[datetime]:
+    """Fecha ISO 8601 (sin zona horaria, o pasada a UTC); None si falta."""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise InvalidTrade(field_name, value, "no es una fecha ISO 8601")
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidTrade(field_name, value, "no es una fecha ISO 8601") from None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def parse_text(field_name: str, value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    raise InvalidTrade(field_name, value, "no es texto")
+
+def parse_confirmations(value: Any) -> Dict[str, bool]:
+    """Confirmaciones del trade como booleanos (los nulos cuentan como False)."""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise InvalidTrade(CONFIRMATIONS_FIELD, value, "no es un objeto {confirmación: true/false}")
+    return {key: bool(active and active == active) for key, active in value.items()}
+
+# --- Registro Tipado ---
+
+@dataclass(slots=True)
+class Trade:
+    """Un trade del journal con sus campos ya validados y convertidos."""
+    activo: Optional[str]
+    accion: Optional[str]
+    ganancia_perdida: float
+    tipo_entrada: Optional[str]
+    mejorar: Optional[str]
+    resultado: float = math.nan
+    apertura: Optional[datetime] = None
+    cierre: Optional[datetime] = None
+    confirmaciones: Dict[str, bool] = field(default_factory=dict)
+    # Campos sin tipo fijo (ticket, cuenta, ...), tal cual
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> 'Trade':
+        """Valida y convierte un trade del journal. Lanza InvalidTrade si un campo es inválido."""
+        if not isinstance(raw, dict):
+            raise InvalidTrade("trade", raw, "no es un objeto JSON")
+        return cls(
+            activo=parse_text('activo', raw.get('activo')),
+            accion=parse_text('accion', raw.get('accion')),
+            ganancia_perdida=parse_number(PNL_FIELD, raw.get(PNL_FIELD), required=True),
+            tipo_entrada=parse_text('tipo entrada', raw.get('tipo entrada')),
+            mejorar=parse_text('mejorar', raw.get('mejorar')),
+            resultado=parse_number(RESULT_FIELD, raw.get(RESULT_FIELD)),
+            apertura=parse_timestamp('apertura', raw.get('apertura')),
+            cierre=parse_timestamp('cierre', raw.get('cierre')),
+            confirmaciones=parse_confirmations(raw.get(CONFIRMATIONS_FIELD)),
+            extra={key: value for key, value in raw.items() if key not in FIELD_KINDS},
+        )
+
+    def to_raw(self) -> Dict[str, Any]:
+        """El trade en el formato del journal (sin los campos opcionales vacíos)."""
+        raw = {'activo': self.activo, 'accion': self.accion, PNL_FIELD: self.ganancia_perdida,
+               'tipo entrada': self.tipo_entrada, 'mejorar': self.mejorar}
+        if self.resultado == self.resultado:
+            raw[RESULT_FIELD] = self.resultado
+        raw[CONFIRMATIONS_FIELD] = dict(self.confirmaciones)
+        for name in TIMESTAMP_FIELDS:
+            moment = getattr(self, name)
+            if moment is not None:
+                raw[name] = moment.isoformat(timespec='seconds')
+        raw.update(self.extra)
+        return raw
+
+# --- Decodificación a Columnas ---
+
+def timestamp_seconds(field_name: str, value: Any) -> int:
+    """Segundos desde 1970 de una fecha ISO 8601 (NAT_SECONDS si falta)."""
+    moment = parse_timestamp(field_name, value)
+    return NAT_SECONDS if moment is None else (moment - EPOCH) // ONE_SECOND
+
+def _missing_value(name: str) -> Any:
+    """Valor de un campo que el trade no tiene (como en pd.DataFrame(registros))."""
+    return NAT_SECONDS if FIELD_KINDS.get(name) == TIMESTAMP else math.nan
+
+def _discard(value: Any):
+    """Append de las columnas cuando el decodificador no las llena."""
+
+class TradeDecoder:
+    """
+    Decodifica líneas del journal a columnas, validando cada trade.
+
+    Se puede alimentar con varios archivos en orden (p. ej. las particiones de
+    una cuenta) y al final construir un solo DataFrame con to_frame(). Los
+    trades inválidos quedan en `rejected` ({'archivo', 'linea', 'campo',
+    'valor', 'error'}) y no ocupan filas. Con keep_records=True también se
+    guardan los trades válidos tal como estaban en el journal (en `records`),
+    para quien necesita los diccionarios además de las columnas. Con
+    fill_columns=False solo se validan (y se guardan en `records`): para quien
+    necesita solo los diccionarios, sin pagar las columnas ni to_frame().
+    """
+    def __init__(self, keep_records: bool = False, fill_columns: bool = True):
+        self.fill_columns = fill_columns
+        self.rows = 0
+        # campo -> valores por fila, en orden de primera aparición
+        self.columns: Dict[str, Union[array, List[Any]]] = {}
+        self.conf_index: Dict[str, int] = {}
+        self.conf_rows = array('q')
+        self.conf_cols = array('q')
+        self.rejected: List[Dict[str, Any]] = []
+        self.records: Optional[List[Dict[str, Any]]] = [] if keep_records else None
+        # Textos repetidos (activo, acción...) comparten un solo objeto str
+        self._strings: Dict[str, str] = {}
+
+    def _reject(self, source: str, line_number: int, field_name: Optional[str], value: Any, message: str):
+        self.rejected.append({'archivo': source, 'linea': line_number, 'campo': field_name,
+                              'valor': value, 'error': message})
+
+    def _new_column(self, name: str) -> Union[array, List[Any]]:
+        """Columna nueva con el valor faltante en las filas anteriores."""
+        kind = FIELD_KINDS.get(name)
+        missing = [_missing_value(name)]
+        if kind == NUMERIC:
+            return array('d', missing) * self.rows
+        if kind == TIMESTAMP:
+            return array('q', missing) * self.rows
+        return missing * self.rows
+
+    def _plan(self, keys: tuple) -> tuple:
+        """
+        Cómo decodificar las filas con estas claves (en este orden): por cada
+        campo su nombre, su tipo y el append de su columna (creándola si hace
+        falta), más la cantidad de columnas que llenan y si traen ganancia/perdida.
+        """
+        steps = []
+        for name in keys:
+            kind = FIELD_KINDS.get(name)
+            if kind is CONFIRMATIONS:
+                steps.append((name, kind, None))
+                continue
+            if not self.fill_columns:
+                steps.append((name, kind, _discard))
+                continue
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = self._new_column(name)
+            steps.append((name, kind, column.append))
+        filled = len(keys) - (CONFIRMATIONS_FIELD in keys) if self.fill_columns else 0
+        return steps, filled, PNL_FIELD in keys
+
+    def decode_lines(self, lines: Iterable[str], source: str = None, first_line: int = 1) -> int:
+        """
+        Agrega los trades válidos de `lines` (numeradas desde first_line).
+        Retorna la cantidad de líneas con JSON inválido (también quedan en rejected).
+        """
+        columns = self.columns
+        strings = self._strings
+        records = self.records
+        # Las filas de un journal casi siempre tienen las mismas claves: el plan
+        # de cada combinación se arma una sola vez
+        plans = {}
+        decode = json.JSONDecoder().decode
+        fromisoformat = datetime.fromisoformat
+        json_errors = 0
+        for line_number, line in enumerate(lines, start=first_line):
+            try:
+                raw = decode(line)
+            except ValueError as e:
+                if line.strip():
+                    json_errors += 1
+                    self._reject(source, line_number, None, None, f"JSON inválido: {e}")
+                continue
+            if raw.__class__ is not dict:
+                self._reject(source, line_number, None, raw, "no es un objeto JSON")
+                continue
+
+            checkpoint = self.checkpoint()
+            keys = tuple(raw)
+            plan = plans.get(keys)
+            if plan is None:
+                plan = plans[keys] = self._plan(keys)
+            steps, filled, has_pnl = plan
+            confirmations = None
+            # Los valores se agregan directo a las columnas; si un campo resulta
+            # inválido se deshace la fila (y las columnas que creó)
+            try:
+                if not has_pnl:
+                    raise InvalidTrade(PNL_FIELD, None, "falta el valor")
+                for (name, kind, append), value in zip(steps, raw.values()):
+                    if kind is TEXT:
+                        value = strings.setdefault(value, value) if value.__class__ is str else parse_text(name, value)
+                    elif kind is NUMERIC:
+                        if value.__class__ is not float or value != value:
+                            value = parse_number(name, value, required=name == PNL_FIELD)
+                    elif kind is TIMESTAMP:
+                        try:
+                            value = (fromisoformat(value) - EPOCH) // ONE_SECOND
+                        except (TypeError, ValueError):
+                            # Nulos, vacíos, fechas con zona horaria o inválidas
+                            value = timestamp_seconds(name, value)
+                    elif kind is CONFIRMATIONS:
+                        # Se valida aquí; los valores se leen al confirmar la fila
+                        confirmations = value if value.__class__ is dict else parse_confirmations(value)
+                        continue
+                    append(value)
+            except InvalidTrade as e:
+                if len(columns) > checkpoint[2]:
+                    # Los planes guardan el append de las columnas que se van a borrar
+                    plans.clear()
+                self.rollback(checkpoint)
+                self._reject(source, line_number, e.field, e.value, str(e))
+                continue
+
+            if confirmations and self.fill_columns:
+                # Todas las claves tienen columna (como en preprocess_data); solo las activas tienen posición
+                for key, active in confirmations.items():
+                    column = self.conf_index.setdefault(key, len(self.conf_index))
+                    # Los valores nulos (None/NaN) cuentan como False
+                    if active and active == active:
+                        self.conf_rows.append(self.rows)
+                        self.conf_cols.append(column)
+            self.rows += 1
+            if records is not None:
+                records.append(raw)
+            # Completar las columnas que este trade no tiene
+            if filled != len(columns):
+                for name, column in columns.items():
+                    if len(column) < self.rows:
+                        column.append(_missing_value(name))
+        return json_errors
+
+    def decode_file(self, filepath: str) -> int:
+        """
+        Decodifica un journal completo. Una última línea sin salto de línea que no
+        es JSON válido se ignora (puede ser la escritura en curso de otro proceso).
+        Retorna la cantidad de líneas con JSON inválido.
+        """
+        with open(filepath, 'r', encoding='utf-8') as f:
+            lines = f.read().split("\n")
+        tail = lines.pop()
+        if tail.strip():
+            try:
+                json.loads(tail)
+                lines.append(tail)
+            except ValueError:
+                pass
+        return self.decode_lines(lines, filepath)
+
+    def decode_records(self, records: Iterable[Any], source: str = None):
+        """
+        Decodifica trades ya parseados (p. ej. la lista del movimientos.json
+        antiguo). La 'linea' de un rechazo es la posición del trade en la lista, desde 1.
+        """
+        self.decode_lines((json.dumps(record, ensure_ascii=False) for record in records), source)
+
+    def checkpoint(self) -> tuple:
+        """Estado actual del decodificador, para volver a él con rollback()."""
+        return self.rows, len(self.rejected), len(self.columns), len(self.conf_index)
+
+    def rollback(self, checkpoint: tuple):
+        """
+        Descarta lo decodificado después de checkpoint(): filas, rechazos, columnas
+        y confirmaciones nuevas (p. ej. para volver a decodificar un journal recién compactado).
+        """
+        rows, rejected, n_columns, n_confirmations = checkpoint
+        for name in list(self.columns)[n_columns:]:
+            del self.columns[name]
+        for column in self.columns.values():
+            del column[rows:]
+        for key in list(self.conf_index)[n_confirmations:]:
+            del self.conf_index[key]
+        keep = bisect_left(self.conf_rows, rows)
+        del self.conf_rows[keep:]
+        del self.conf_cols[keep:]
+        del self.rejected[rejected:]
+        if self.records is not None:
+            del self.records[rows:]
+        self.rows = rows
+
+    def warn(self):
+        """Imprime los trades inválidos (los primeros MAX_REPORTED_REJECTED con su línea)."""
+        if not self.rejected:
+            return
+        print(f"Advertencia: {len(self.rejected)} trade(s) inválido(s) no se incluyen en el análisis:")
+        for item in self.rejected[:MAX_REPORTED_REJECTED]:
+            print(f"  {item['archivo']}:{item['linea']}: {item['error']}")
+        if len(self.rejected) > MAX_REPORTED_REJECTED:
+            print(f"  ... y {len(self.rejected) - MAX_REPORTED_REJECTED} más.")
+
+    def to_frame(self):
+        """DataFrame preprocesado (mismo esquema que preprocessor.preprocess_data) con los trades válidos."""
+        import numpy as np
+        import pandas as pd
+        import preprocessor as pp
+
+        if not self.fill_columns:
+            raise ValueError("TradeDecoder creado con fill_columns=False: no tiene columnas")
+        if not self.rows:
+            return pd.DataFrame(columns=pp.BASE_COLUMNS)
+        data = {}
+        for name, values in self.columns.items():
+            kind = FIELD_KINDS.get(name)
+            if kind == NUMERIC:
+                data[name] = np.frombuffer(values, dtype=np.float64).copy()
+            elif kind == TIMESTAMP:
+                data[name] = np.frombuffer(values, dtype=np.int64).view(pp.TIMESTAMP_DTYPE).copy()
+            else:
+                data[name] = values
+        matrix = np.zeros((self.rows, len(self.conf_index)), dtype=bool)
+        matrix[np.frombuffer(self.conf_rows, dtype=np.int64), np.frombuffer(self.conf_cols, dtype=np.int64)] = True
+        df = pd.DataFrame(data)
+        conf_df = pd.DataFrame(matrix, columns=['conf_' + key for key in self.conf_index])
+        return pd.concat([df, conf_df], axis=1) if len(conf_df.columns) else df
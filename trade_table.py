@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Columna consolidada con las confirmaciones activas de cada trade
+CONFIRMATIONS_COLUMN = 'Confirmaciones'
+# Texto cuando un trade no tiene confirmaciones activas
+NO_CONFIRMATIONS = "Ninguna"
+# Filas por página de cadenas ya formateadas
+PAGE_ROWS = 1024
+# Páginas formateadas que se mantienen en memoria (LRU)
+MAX_CACHED_PAGES = 32
+
+def _confirmation_keys(conf_matrix: np.ndarray) -> np.ndarray:
+    """Empaqueta cada fila de la matriz booleana en una clave de bytes (una por trade)."""
+    packed = np.ascontiguousarray(np.packbits(conf_matrix, axis=1))
+    return packed.view(np.dtype((np.void, packed.shape[1]))).ravel()
+
+class TradeTableModel:
+    """
+    Datos de la tabla de "Consultar Trades" listos para mostrarse por ventanas.
+
+    La columna consolidada de confirmaciones se calcula de forma vectorizada:
+    cada combinación distinta de confirmaciones se formatea una sola vez y cada
+    trade guarda solo el código de su combinación. El resto de las columnas se
+    formatea por páginas bajo demanda y se guarda en una caché LRU, de modo que
+    solo se materializan las filas que realmente se muestran.
+    """
+    def __init__(self, df_trades: pd.DataFrame):
+        all_cols = list(df_trades.columns)
+        self.conf_cols = [col for col in all_cols if col.startswith('conf_')]
+        # Excluir la columna 'resultado' y las de confirmación individuales
+        self.value_cols = [col for col in all_cols if col not in self.conf_cols and col != 'resultado']
+        self.display_columns = self.value_cols + [CONFIRMATIONS_COLUMN]
+        # Nombres mostrados (ej: 'conf_hch' -> 'HCH')
+        self.conf_names = np.array([col.split('_', 1)[1].upper() for col in self.conf_cols], dtype=object)
+
+        self.columns = [df_trades[col].to_numpy() for col in self.value_cols]
+        # Combinaciones distintas de confirmaciones (empaquetadas) y su texto ya formateado
+        self.conf_keys = np.empty(0, dtype=np.dtype((np.void, max((len(self.conf_cols) + 7) // 8, 1))))
+        self.conf_labels = {}
+        self.conf_codes = self._encode_confirmations(df_trades)
+        self.pages = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.conf_codes)
+
+    def _conf_label(self, code: int) -> str:
+        """Cadena de confirmaciones activas de una combinación (se formatea una sola vez)."""
+        label = self.conf_labels.get(code)
+        if label is None:
+            packed = np.frombuffer(self.conf_keys[code].tobytes(), dtype=np.uint8)
+            active = self.conf_names[np.unpackbits(packed)[:len(self.conf_cols)].astype(bool)]
+            label = ", ".join(active) if len(active) else NO_CONFIRMATIONS
+            self.conf_labels[code] = label
+        return label
+
+    def _encode_confirmations(self, df_trades: pd.DataFrame) -> np.ndarray:
+        """
+        Código de combinación de confirmaciones por fila (índice en conf_keys).
+        Las combinaciones nuevas se agregan al final, así los códigos existentes no cambian.
+        """
+        n = len(df_trades)
+        if self.conf_cols:
+            conf_matrix = df_trades[self.conf_cols].fillna(False).to_numpy(dtype=bool)
+        else:
+            conf_matrix = np.zeros((n, 1), dtype=bool)
+        unique_keys, inverse = np.unique(_confirmation_keys(conf_matrix), return_inverse=True)
+
+        codes = inverse.ravel() + len(self.conf_keys)
+        self.conf_keys = np.concatenate([self.conf_keys, unique_keys])
+        return codes
+
+    def can_extend(self, df_trades: pd.DataFrame) -> bool:
+        """Indica si df_trades es este mismo historial con filas nuevas al final y las mismas columnas."""
+        return (len(df_trades) >= len(self)
+                and [col for col in df_trades.columns if col.startswith('conf_')] == self.conf_cols
+                and [col for col in df_trades.columns if not col.startswith('conf_') and col != 'resultado'] == self.value_cols)
+
+    def extend(self, df_trades: pd.DataFrame):
+        """Incorpora las filas agregadas al final de df_trades (ver can_extend)."""
+        previous_len = len(self)
+        if len(df_trades) == previous_len:
+            return
+        tail = df_trades.iloc[previous_len:]
+        self.columns = [np.concatenate([column, tail[col].to_numpy()])
+                        for column, col in zip(self.columns, self.value_cols)]
+        self.conf_codes = np.concatenate([self.conf_codes, self._encode_confirmations(tail)])
+        # La última página pudo haber quedado incompleta
+        for page_no in [p for p in self.pages if p >= previous_len // PAGE_ROWS]:
+            del self.pages[page_no]
+
+    @staticmethod
+    def _format(values: np.ndarray) -> np.ndarray:
+        """Convierte una porción de columna a cadenas de texto (nulos como cadena vacía)."""
+        strings = values.astype(str).astype(object)
+        if values.dtype == object or values.dtype.kind == 'M':
+            strings[pd.isna(values)] = ""
+        return strings
+
+    def _page(self, page_no: int) -> List[Tuple[str, ...]]:
+        """Filas formateadas de una página, desde la caché si ya se formateó."""
+        page = self.pages.get(page_no)
+        if page is not None:
+            self.pages.move_to_end(page_no)
+            return page
+
+        start, stop = page_no * PAGE_ROWS, min((page_no + 1) * PAGE_ROWS, len(self))
+        columns = [self._format(column[start:stop]) for column in self.columns]
+        columns.append([self._conf_label(code) for code in self.conf_codes[start:stop]])
+        page = list(zip(*columns))
+
+        self.pages[page_no] = page
+        if len(self.pages) > MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+        return page
+
+    def rows(self, start: int, stop: int) -> List[Tuple[str, ...]]:
+        """Valores a mostrar para las filas [start, stop)."""
+        stop = min(stop, len(self))
+        result = []
+        for page_no in range(start // PAGE_ROWS, (stop - 1) // PAGE_ROWS + 1 if stop > start else 0):
+            page_start = page_no * PAGE_ROWS
+            page = self._page(page_no)
+            result.extend(page[max(start - page_start, 0):stop - page_start])
+        return result
@@ -1,16 +1,57 @@
 # -*- coding: utf-8 -*-
+import copy
+import cProfile
+import importlib
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from tkinter import ttk, messagebox, filedialog
+from typing import Dict, Any, TYPE_CHECKING
+
+from catalog import CatalogService, CONFIRMATIONS, IMPROVEMENTS, NO_IMPROVEMENT
+from instrumentation import PipelineStats
+
+# numpy, pandas, matplotlib y trade_table se importan de forma diferida (dentro
+# de los métodos que los usan) para que la ventana aparezca sin esperarlos.
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Módulos que usa _create_plot_canvas. Importarlos cuesta varios cientos de ms:
+# preload_plotting los carga en el hilo de análisis para que el primer gráfico
+# (en el hilo de Tk) los encuentre ya en sys.modules y no congele la ventana.
+PLOTTING_MODULES = ('matplotlib.figure', 'matplotlib.backends.backend_tkagg')
 
 # Importar las funciones de los módulos (se importarán en main.py y se pasarán aquí)
 
+# Intervalo (ms) con el que el hilo de Tk revisa si terminó el trabajo en segundo plano
+REFRESH_POLL_MS = 50
+# Tabla virtual de trades: filas extra materializadas debajo de las visibles
+TABLE_BUFFER_ROWS = 5
+# Alto por defecto de fila y encabezado del Treeview (px), si el estilo no lo define
+TABLE_ROW_HEIGHT = 20
+TABLE_HEADER_HEIGHT = 25
+# Filas que avanza cada paso de la rueda del mouse
+TABLE_WHEEL_ROWS = 3
+# Número de barras del histograma de ganancia/pérdida
+HISTOGRAM_BINS = 20
+# Combinaciones de confirmaciones mostradas (las mejores y las peores por rentabilidad)
+COMBINATION_DISPLAY_ROWS = 10
+# Controles de filtro del dashboard: clave del filtro (ver query.py) -> texto del botón
+FILTER_LABELS = {'activo': "Activo", 'accion': "Tipo de Orden", 'tipo entrada': "Tipo Entrada",
+                 'mejorar': "Mejora", 'con': "Con Confirmación", 'sin': "Sin Confirmación"}
+# Puntos máximos de la curva de capital que se dibujan (se toma uno de cada N trades)
+EQUITY_PLOT_POINTS = 2000
+
+class RefreshCancelled(Exception):
+    """Un refresco en segundo plano fue reemplazado por uno más reciente."""
+
 class TradingAnalysisApp(tk.Tk):
     """Clase principal de la aplicación Tkinter."""
-    def __init__(self, data_loader_funcs, preprocessor_func, analyzer_funcs):
+    def __init__(self, data_loader_funcs, preprocessor_func, analyzer_funcs, incremental_preprocessor_func=None,
+                 lazy_tabs=True, startup_t0=None, on_interactive=None, pipeline_stats=None,
+                 profile_path=None, show_diagnostics=False, catalog_service=None):
         super().__init__()
         self.title("Análisis y Minería de Datos de Trades")
         self.geometry("1000x800")
@@ -18,14 +59,59 @@ class TradingAnalysisApp(tk.Tk):
         # Almacenar referencias a las funciones externas (DIP - Inversión de Dependencias)
         self.loader = data_loader_funcs
         self.preprocess = preprocessor_func
+        # Opcional: extiende df_trades con trades nuevos sin reprocesar el historial
+        self.extend_preprocessed = incremental_preprocessor_func
         self.analyze = analyzer_funcs
+        # Catálogos de confirmaciones y mejoras en memoria; sus altas se notifican a la UI
+        if catalog_service is None:
+            catalog_service = CatalogService(self.loader.get('load_catalogs') or self.loader['load_all_data'],
+                                             self.loader['add_confirmation'], self.loader['add_improvement'])
+        self.catalog = catalog_service
+        self.catalog.subscribe(self._on_catalog_change)
         
-        # Variables de estado
-        self.raw_data = self.loader['load_all_data']()
-        self.df_trades = self.preprocess(self.raw_data['trades'])
+        # Medición del arranque: tiempo hasta la primera ventana y hasta que es interactiva
+        self.startup_t0 = startup_t0 if startup_t0 is not None else time.perf_counter()
+        self.startup_times = {}
+        self.on_interactive = on_interactive
+        self.bind('<Map>', self._on_first_map, add='+')
+
+        # Instrumentación: tiempo (y opcionalmente memoria) de cada etapa del pipeline
+        self.stats = pipeline_stats if pipeline_stats is not None else PipelineStats()
+        # Si no es None, el próximo refresco se captura con cProfile y se guarda en esta ruta
+        self.profile_path = profile_path
+        self.show_diagnostics = show_diagnostics
+
+        # Variables de estado (se llenan en segundo plano al terminar la carga inicial;
+        # df_trades es None hasta entonces)
+        self.raw_data = {'trades': [], 'confirmations': [], 'improvements': []}
+        self.df_trades = None
+        # Opcional: métricas globales incrementales, sembradas una vez con el historial
+        self.metrics_accumulator = None
+        # Opcional: curva de capital incremental (drawdown y estadísticas móviles)
+        self.equity_curve = None
+        # Opcional: índices de consulta para filtrar el dashboard, y los filtros aplicados
+        self.trade_index = None
+        self.trade_filters = {}
+        # Trades ya guardados que todavía no están en df_trades
+        self.pending_trades = []
+        # Modelo de la tabla virtual de "Consultar Trades" (se construye con los datos)
+        self.trades_table = None
+
+        # Carga, preprocesamiento y análisis corren en un único hilo de trabajo;
+        # los resultados vuelven al hilo de Tk mediante after().
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analisis")
+        self.refresh_generation = 0
+        self.refresh_future = None
+        self.reload_pending = False
+        # Últimos contadores de una importación masiva en curso (ver handle_import_trades)
+        self.import_progress = None
+
+        # Con lazy_tabs, las pestañas 2 y 3 se construyen la primera vez que se seleccionan
+        self.lazy_tabs = lazy_tabs
+        self.built_tabs = set()
         
         self.create_widgets()
-        self.run_analysis() # Ejecutar el análisis inicial
+        self.refresh(reload=True) # Carga y análisis inicial sin bloquear la ventana
 
     def create_widgets(self):
         """Configura la estructura de pestañas de la interfaz."""
@@ -40,12 +126,65 @@ class TradingAnalysisApp(tk.Tk):
         # Pestaña 2: Agregar Datos (Formularios)
         self.add_data_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.add_data_frame, text="Agregar Registros")
-        self.setup_add_data_tab()
 
         # Pestaña 3: Todos lo trades
         self.read_trades_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.read_trades_frame, text="Consultar Trades")
-        self.read_trades_tab()
+
+        # Pestaña 4: Diagnóstico (oculta; se muestra con F12)
+        self.diagnostics_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.diagnostics_frame, text="Diagnóstico")
+        if not self.show_diagnostics:
+            self.notebook.hide(self.diagnostics_frame)
+        self.bind('<F12>', self.toggle_diagnostics_tab)
+
+        self.tab_builders = {
+            str(self.add_data_frame): self.setup_add_data_tab,
+            str(self.read_trades_frame): self.read_trades_tab,
+            str(self.diagnostics_frame): self.setup_diagnostics_tab,
+        }
+        if self.lazy_tabs:
+            self.notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
+        else:
+            for tab in list(self.tab_builders):
+                self.build_tab(tab)
+
+        # Barra de estado con indicador de trabajo en segundo plano
+        status_bar = ttk.Frame(self, padding=(10, 0, 10, 5))
+        status_bar.pack(fill='x', side='bottom')
+        self.status_var = tk.StringVar(value="Listo")
+        ttk.Label(status_bar, textvariable=self.status_var).pack(side='left')
+        self.progress = ttk.Progressbar(status_bar, mode='indeterminate', length=150)
+        self.progress.pack(side='right')
+        # Tiempos por etapa del último refresco
+        self.stats_var = tk.StringVar(value="")
+        ttk.Label(status_bar, textvariable=self.stats_var, foreground='gray').pack(side='right', padx=10)
+
+    def build_tab(self, tab: str):
+        """Construye una pestaña diferida (una sola vez)."""
+        if tab in self.built_tabs or tab not in self.tab_builders:
+            return
+        self.built_tabs.add(tab)
+        self.tab_builders[tab]()
+
+    def tab_is_built(self, frame) -> bool:
+        return str(frame) in self.built_tabs
+
+    def _on_tab_changed(self, event):
+        self.build_tab(self.notebook.select())
+
+    def _on_first_map(self, event):
+        """Registra el tiempo hasta que la ventana principal aparece por primera vez."""
+        if event.widget is self and 'primera_ventana' not in self.startup_times:
+            self.startup_times['primera_ventana'] = time.perf_counter() - self.startup_t0
+
+    def _mark_interactive(self):
+        """Registra el tiempo hasta que los datos y el análisis inicial están en pantalla."""
+        if 'interactiva' in self.startup_times:
+            return
+        self.startup_times['interactiva'] = time.perf_counter() - self.startup_t0
+        if self.on_interactive is not None:
+            self.on_interactive(self)
 
     # --- PESTAÑA DE CONSULTAR TRADES ---
 
@@ -58,35 +197,42 @@ class TradingAnalysisApp(tk.Tk):
         container.columnconfigure(0, weight=1)
         container.rowconfigure(0, weight=1)
 
+        if self.df_trades is None:
+            ttk.Label(container, text="Cargando trades...").pack(pady=20)
+            return
         if self.df_trades.empty:
             ttk.Label(container, text="No hay trades registrados para mostrar.").pack(pady=20)
             return
 
-        # 1. Identificar las columnas de confirmación
-        all_cols = list(self.df_trades.columns)
-        self.conf_cols_names = [col for col in all_cols if col.startswith('conf_')]
-        
-        # 2. Definir las columnas a mostrar en el Treeview
-        # Excluir las columnas de confirmación individuales y la columna 'resultado'.
-        display_columns = [
-            col for col in all_cols 
-            if col not in self.conf_cols_names and col != 'resultado'
-        ]
-        display_columns.append('Confirmaciones') 
+        # 1. Modelo de la tabla: columnas a mostrar (sin 'resultado' ni las de
+        # confirmación individuales, más la columna consolidada 'Confirmaciones')
+        if self.trades_table is None or not self.trades_table.can_extend(self.df_trades):
+            from trade_table import TradeTableModel
+            self.trades_table = TradeTableModel(self.df_trades)
+        display_columns = self.trades_table.display_columns
 
-        # Crear el Treeview
-        self.trades_tree = ttk.Treeview(container, columns=display_columns, show='headings')
+        # 2. Crear el Treeview. Solo contiene las filas visibles (más un pequeño
+        # margen); al desplazarse se reutilizan los mismos ítems con otros valores.
+        self.trades_tree = ttk.Treeview(container, columns=display_columns, show='headings', selectmode='browse')
+        self.trades_first_row = 0
+        self.trades_visible_rows = 20
         
-        # Configurar Scrollbars
-        vsb = ttk.Scrollbar(container, orient="vertical", command=self.trades_tree.yview)
+        # Configurar Scrollbars: la vertical representa todo el historial, no los ítems del Treeview
+        self.trades_vsb = ttk.Scrollbar(container, orient="vertical", command=self.scroll_trades_tree)
         hsb = ttk.Scrollbar(container, orient="horizontal", command=self.trades_tree.xview)
-        self.trades_tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        self.trades_tree.configure(xscrollcommand=hsb.set)
         
         # Colocar Treeview y Scrollbars usando Grid
         self.trades_tree.grid(row=0, column=0, sticky='nsew')
-        vsb.grid(row=0, column=1, sticky='ns')
+        self.trades_vsb.grid(row=0, column=1, sticky='ns')
         hsb.grid(row=1, column=0, sticky='ew')
 
+        self.trades_tree.bind('<Configure>', self._on_trades_tree_resize)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.trades_tree.bind(sequence, self._on_trades_tree_wheel)
+        for sequence, step in (('<Prior>', 'page_up'), ('<Next>', 'page_down'), ('<Home>', 'home'), ('<End>', 'end')):
+            self.trades_tree.bind(sequence, lambda event, step=step: self._on_trades_tree_key(step))
+
         # Configurar encabezados y ancho de columna
         for col in display_columns:
                 
@@ -104,49 +250,94 @@ class TradingAnalysisApp(tk.Tk):
 
         self.populate_trades_tree()
 
+    def rebuild_trades_tab(self):
+        """Reconstruye la pestaña de trades (p. ej. tras la carga inicial o si cambian las columnas)."""
+        if not self.tab_is_built(self.read_trades_frame):
+            return
+        for widget in self.read_trades_frame.winfo_children():
+            widget.destroy()
+        if hasattr(self, 'trades_tree'):
+            del self.trades_tree
+        self.read_trades_tab()
+
     def populate_trades_tree(self):
         """
-        Llena el Treeview con los datos del DataFrame de trades,
-        utilizando la lista de columnas de confirmación almacenada.
+        Actualiza la tabla virtual con el df_trades actual: incorpora las filas
+        nuevas al modelo y vuelve a dibujar la ventana visible.
         """
         if not hasattr(self, 'trades_tree'):
             return 
             
-        # Determinar las columnas de confirmación por si la lista ha cambiado (e.g., después de agregar una nueva conf.)
-        all_cols = list(self.df_trades.columns)
-        conf_cols = [col for col in all_cols if col.startswith('conf_')]
-        
-        # Excluir la columna 'resultado' y las de confirmación del Treeview
-        non_conf_cols = [col for col in all_cols if col not in conf_cols and col != 'resultado']
+        # Si cambiaron las columnas (e.g., después de agregar una nueva conf.) se reconstruye la pestaña
+        if not self.trades_table.can_extend(self.df_trades):
+            self.trades_table = None
+            self.rebuild_trades_tab()
+            return
+        self.trades_table.extend(self.df_trades)
+        self.render_trades_window()
 
-        # Limpiar datos existentes
-        self.trades_tree.delete(*self.trades_tree.get_children())
-        
-        # Insertar nuevas filas
-        for index, row in self.df_trades.iterrows():
-            row_values = []
-            
-            # 1. Agregar valores de columnas no-confirmación (excluyendo 'resultado')
-            for col in non_conf_cols:
-                row_values.append(row[col])
-            
-            # 2. Consolidar confirmaciones
-            active_confs = []
-            for conf_col in conf_cols:
-                # Si la confirmación es True
-                if row[conf_col]: 
-                    # Extraer el nombre de la confirmación (ej: 'conf_hch' -> 'HCH')
-                    conf_name = conf_col.split('_', 1)[1].upper()
-                    active_confs.append(conf_name)
-            
-            # 3. Formatear la cadena de confirmaciones
-            confs_str = ", ".join(active_confs) if active_confs else "Ninguna"
-            
-            # 4. Agregar la cadena consolidada al final
-            row_values.append(confs_str)
-            
-            # Insertar la fila
-            self.trades_tree.insert("", "end", values=row_values)
+    def render_trades_window(self):
+        """Muestra en el Treeview las filas de la ventana visible, reutilizando los ítems existentes."""
+        total = len(self.trades_table)
+        visible = self.trades_visible_rows
+        self.trades_first_row = max(0, min(self.trades_first_row, total - visible))
+        first = self.trades_first_row
+
+        rows = self.trades_table.rows(first, first + visible + TABLE_BUFFER_ROWS)
+        items = self.trades_tree.get_children()
+        for item, values in zip(items, rows):
+            self.trades_tree.item(item, values=values)
+        for values in rows[len(items):]:
+            self.trades_tree.insert("", "end", values=values)
+        if len(items) > len(rows):
+            self.trades_tree.delete(*items[len(rows):])
+
+        # La selección pertenece a un ítem reutilizado, no a un trade: se descarta
+        self.trades_tree.selection_set(())
+        self.trades_tree.yview_moveto(0)
+        if total:
+            self.trades_vsb.set(first / total, min((first + visible) / total, 1.0))
+        else:
+            self.trades_vsb.set(0.0, 1.0)
+
+    def scroll_trades_tree(self, *args):
+        """Comando de la barra vertical: ('moveto', fracción) o ('scroll', n, 'units'|'pages')."""
+        if args[0] == 'moveto':
+            self.trades_first_row = int(float(args[1]) * len(self.trades_table))
+        elif args[0] == 'scroll':
+            step = self.trades_visible_rows if args[2] == 'pages' else 1
+            self.trades_first_row += int(args[1]) * step
+        self.render_trades_window()
+
+    def _on_trades_tree_wheel(self, event):
+        """Desplaza la tabla virtual con la rueda del mouse (Windows/macOS y X11)."""
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.trades_first_row -= TABLE_WHEEL_ROWS
+        else:
+            self.trades_first_row += TABLE_WHEEL_ROWS
+        self.render_trades_window()
+        return "break"
+
+    def _on_trades_tree_key(self, step: str):
+        """Teclas de navegación por páginas y extremos de la tabla virtual."""
+        if step == 'page_up':
+            self.trades_first_row -= self.trades_visible_rows
+        elif step == 'page_down':
+            self.trades_first_row += self.trades_visible_rows
+        elif step == 'home':
+            self.trades_first_row = 0
+        else:
+            self.trades_first_row = len(self.trades_table)
+        self.render_trades_window()
+        return "break"
+
+    def _on_trades_tree_resize(self, event):
+        """Recalcula cuántas filas caben en el Treeview al cambiar su tamaño."""
+        row_height = ttk.Style().lookup('Treeview', 'rowheight') or TABLE_ROW_HEIGHT
+        visible = max(1, (event.height - TABLE_HEADER_HEIGHT) // int(row_height))
+        if visible != self.trades_visible_rows:
+            self.trades_visible_rows = visible
+            self.render_trades_window()
 
 
     # --- PESTAÑA DE AGREGAR REGISTROS ---
@@ -164,7 +355,9 @@ class TradingAnalysisApp(tk.Tk):
             "activo": tk.StringVar(), "accion": tk.StringVar(), 
             # "resultado" omitido permanentemente
             "ganancia/perdida": tk.DoubleVar(),
-            "tipo entrada": tk.StringVar(), "mejorar": tk.StringVar(value="N/A")
+            "tipo entrada": tk.StringVar(), "mejorar": tk.StringVar(value=NO_IMPROVEMENT),
+            # Fechas opcionales; vacías se registran con la hora de carga del trade
+            "apertura": tk.StringVar(), "cierre": tk.StringVar()
         }
         self.conf_vars = {}
 
@@ -213,20 +406,33 @@ class TradingAnalysisApp(tk.Tk):
         ttk.Entry(trade_frame, textvariable=self.trade_vars["tipo entrada"]).grid(row=rowvar, column=1, padx=5, pady=2, sticky='ew')
         rowvar = rowvar +1
         
-        # Campo 5: ¿Que puedo mejorar? (Entry)
+        # Campo 5: ¿Que puedo mejorar? (Combobox con el catálogo de mejoras)
         ttk.Label(trade_frame, text="¿Que puedo mejorar?:").grid(row=rowvar, column=0, padx=5, pady=2, sticky='w')
-        ttk.Entry(trade_frame, textvariable=self.trade_vars["mejorar"]).grid(row=rowvar, column=1, padx=5, pady=2, sticky='ew')
+        self.improvement_combo = ttk.Combobox(trade_frame, textvariable=self.trade_vars["mejorar"])
+        self.improvement_combo.grid(row=rowvar, column=1, padx=5, pady=2, sticky='ew')
+        self.update_improvement_options()
+        rowvar = rowvar +1
+
+        # Campos 6 y 7: Fechas de apertura y cierre (Entry, opcionales)
+        ttk.Label(trade_frame, text="Apertura (AAAA-MM-DD HH:MM):").grid(row=rowvar, column=0, padx=5, pady=2, sticky='w')
+        ttk.Entry(trade_frame, textvariable=self.trade_vars["apertura"]).grid(row=rowvar, column=1, padx=5, pady=2, sticky='ew')
+        rowvar = rowvar +1
+        ttk.Label(trade_frame, text="Cierre (AAAA-MM-DD HH:MM):").grid(row=rowvar, column=0, padx=5, pady=2, sticky='w')
+        ttk.Entry(trade_frame, textvariable=self.trade_vars["cierre"]).grid(row=rowvar, column=1, padx=5, pady=2, sticky='ew')
         rowvar = rowvar +1
 
         # Generar Checkbuttons para Confirmaciones dinámicamente
         self.conf_check_frame = ttk.LabelFrame(trade_frame, text="Confirmaciones")
-        # CORREGIDO: rowspan se ajusta a 5 para cubrir las filas 0 a 4
-        self.conf_check_frame.grid(row=0, column=2, rowspan=5, padx=10, sticky='ns')
+        # rowspan cubre las filas de los campos (0 a rowvar-1)
+        self.conf_check_frame.grid(row=0, column=2, rowspan=rowvar, padx=10, sticky='ns')
         self.update_confirmation_checks()
         
         # Botón
         ttk.Button(trade_frame, text="Agregar Trade", command=self.handle_add_trade).grid(row=rowvar, column=0, columnspan=2, pady=10)
         rowvar = rowvar+1
+        if 'import_trades' in self.loader:
+            ttk.Button(trade_frame, text="Importar CSV del Broker...", command=self.handle_import_trades).grid(row=rowvar, column=0, columnspan=2, pady=(0, 10))
+            rowvar = rowvar+1
 
         # 2. Formulario para agregar CONFIRMACIÓN
         conf_frame = ttk.LabelFrame(main_container, text="Nueva Confirmación (Catálogo)", padding="10")
@@ -239,22 +445,54 @@ class TradingAnalysisApp(tk.Tk):
         ttk.Entry(conf_frame, textvariable=self.new_conf_desc).grid(row=1, column=1, padx=5, pady=2, sticky='ew')
         ttk.Button(conf_frame, text="Agregar Confirmación", command=self.handle_add_confirmation).grid(row=2, column=0, columnspan=2, pady=10)
 
-    def update_confirmation_checks(self):
-        """Actualiza la lista de Checkbuttons de confirmaciones en el formulario de Trade."""
+        # 3. Formulario para agregar MEJORA
+        improv_frame = ttk.LabelFrame(main_container, text="Nueva Mejora (Catálogo)", padding="10")
+        improv_frame.pack(fill='x', pady=10, padx=10)
+        self.new_improv_name = tk.StringVar()
+        self.new_improv_desc = tk.StringVar()
+        ttk.Label(improv_frame, text="Nombre:").grid(row=0, column=0, padx=5, pady=2, sticky='w')
+        ttk.Entry(improv_frame, textvariable=self.new_improv_name).grid(row=0, column=1, padx=5, pady=2, sticky='ew')
+        ttk.Label(improv_frame, text="Descripción:").grid(row=1, column=0, padx=5, pady=2, sticky='w')
+        ttk.Entry(improv_frame, textvariable=self.new_improv_desc).grid(row=1, column=1, padx=5, pady=2, sticky='ew')
+        ttk.Button(improv_frame, text="Agregar Mejora", command=self.handle_add_improvement).grid(row=2, column=0, columnspan=2, pady=10)
+
+    def update_confirmation_checks(self, confirmations=None):
+        """
+        Actualiza la lista de Checkbuttons de confirmaciones en el formulario de Trade.
+        Si no se recibe el catálogo, se toma del servicio de catálogos (sin leer el disco).
+        """
         # Limpiar widgets existentes
         for widget in self.conf_check_frame.winfo_children():
             widget.destroy()
         self.conf_vars = {} # Resetear variables
             
-        # Recargar catálogo para obtener las últimas
-        self.raw_data = self.loader['load_all_data']()
-        confirmations = self.raw_data['confirmations']
+        if confirmations is None:
+            confirmations = self.catalog.confirmations()
         
-        for i, conf in enumerate(confirmations):
-            name = conf['nombre']
-            var = tk.BooleanVar(value=False)
-            self.conf_vars[name] = var
-            ttk.Checkbutton(self.conf_check_frame, text=name, variable=var).grid(row=i, column=0, sticky='w')
+        for conf in confirmations:
+            self._add_confirmation_check(conf['nombre'])
+
+    def _add_confirmation_check(self, name: str):
+        """Agrega un Checkbutton de confirmación al final de la lista."""
+        var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.conf_check_frame, text=name, variable=var).grid(row=len(self.conf_vars), column=0, sticky='w')
+        self.conf_vars[name] = var
+
+    def update_improvement_options(self, improvements=None):
+        """Opciones del campo 'mejorar': sin mejora y las mejoras del catálogo."""
+        if improvements is None:
+            improvements = self.catalog.improvements()
+        self.improvement_combo['values'] = [NO_IMPROVEMENT] + [improv['nombre'] for improv in improvements]
+
+    def _on_catalog_change(self, kind: str, record: Dict[str, Any]):
+        """Refleja en el formulario un alta en un catálogo (sin recargar los trades)."""
+        self.raw_data[kind] = self.raw_data[kind] + [record]
+        if not self.tab_is_built(self.add_data_frame):
+            return
+        if kind == CONFIRMATIONS:
+            self._add_confirmation_check(record['nombre'])
+        elif kind == IMPROVEMENTS:
+            self.improvement_combo['values'] = (*self.improvement_combo['values'], record['nombre'])
 
 
     def handle_add_trade(self):
@@ -274,22 +512,76 @@ class TradingAnalysisApp(tk.Tk):
             if not new_trade['activo'] or not new_trade['tipo entrada']:
                 messagebox.showerror("Error de entrada", "Los campos Activo y Tipo Entrada son obligatorios.")
                 return
+            try:
+                self.catalog.validate_improvement(new_trade['mejorar'])
+            except ValueError as e:
+                messagebox.showerror("Error de entrada", f"{e} Agréguela primero en 'Nueva Mejora'.")
+                return
+
+            # Fechas en ISO 8601; por defecto, la hora en que se carga el trade
+            now = datetime.now().isoformat(timespec='seconds')
+            for field in ("apertura", "cierre"):
+                text = self.trade_vars[field].get().strip()
+                try:
+                    new_trade[field] = datetime.fromisoformat(text).isoformat(timespec='seconds') if text else now
+                except ValueError:
+                    messagebox.showerror("Error de entrada", f"Fecha de {field} inválida: use AAAA-MM-DD HH:MM.")
+                    return
 
             self.loader['add_trade'](new_trade)
             messagebox.showinfo("Éxito", "Trade agregado y datos guardados.")
             
-            # Recargar datos y análisis
-            self.raw_data = self.loader['load_all_data']()
-            self.df_trades = self.preprocess(self.raw_data['trades'])
-            self.run_analysis()
-            
-            # Actualizar la tabla de trades en la pestaña 3 si ya fue inicializada
-            if hasattr(self, 'trades_tree'):
-                self.populate_trades_tree()
+            # Actualizar datos y análisis en segundo plano. Con el preprocesamiento
+            # incremental solo se procesa el trade nuevo; si no, se recarga todo.
+            self.raw_data['trades'].append(new_trade)
+            self.pending_trades.append(new_trade)
+            self.refresh(reload=self.extend_preprocessed is None)
             
         except Exception as e:
             messagebox.showerror("Error", f"Fallo al agregar trade: {e}")
 
+    def handle_import_trades(self):
+        """Importa en segundo plano un CSV exportado por el broker y recarga el análisis una sola vez al final."""
+        filepath = filedialog.askopenfilename(
+            title="Historial del broker", filetypes=[("CSV", "*.csv *.txt"), ("Todos los archivos", "*.*")]
+        )
+        if not filepath:
+            return
+
+        self.import_progress = None
+        self.set_busy("Importando...")
+        # Mismo hilo de fondo que los refrescos: el refresco posterior ve el journal completo
+        future = self.executor.submit(self.loader['import_trades'], filepath, progress=self._set_import_progress)
+        self.after(REFRESH_POLL_MS, self._poll_import, future)
+
+    def _set_import_progress(self, stats: Dict[str, int]):
+        # Se llama desde el hilo de fondo: solo guarda los contadores, el hilo de Tk los muestra
+        self.import_progress = stats
+
+    def _poll_import(self, future):
+        """Muestra el avance de la importación y, al terminar, lanza la recarga."""
+        if not future.done():
+            if self.import_progress is not None:
+                from importer import format_progress
+                self.status_var.set(format_progress(self.import_progress))
+            self.after(REFRESH_POLL_MS, self._poll_import, future)
+            return
+
+        try:
+            stats = future.result()
+        except Exception as e:
+            self.set_idle("Error al importar")
+            messagebox.showerror("Error", f"Fallo al importar el historial: {e}")
+            return
+        messagebox.showinfo("Importación terminada",
+                            f"{stats['importados']} trades nuevos, {stats['duplicados']} duplicados, "
+                            f"{stats['omitidos']} filas omitidas, {stats['rechazados']} rechazadas "
+                            f"(ganancia/pérdida no numérica, ver la consola).")
+        if stats['importados']:
+            self.refresh(reload=True)
+        else:
+            self.set_idle()
+
     def handle_add_confirmation(self):
         """Procesa y agrega una nueva confirmación al catálogo."""
         name = self.new_conf_name.get().strip().lower()
@@ -300,18 +592,41 @@ class TradingAnalysisApp(tk.Tk):
             return
 
         try:
-            self.loader['add_confirmation']({"nombre": name, "descripcion": desc})
+            # Los checkbuttons se actualizan con la notificación del catálogo (_on_catalog_change)
+            if not self.catalog.add_confirmation({"nombre": name, "descripcion": desc}):
+                messagebox.showwarning("Duplicado", f"La confirmación '{name}' ya existe.")
+                return
             messagebox.showinfo("Éxito", f"Confirmación '{name}' agregada.")
             self.new_conf_name.set("")
             self.new_conf_desc.set("")
-            self.update_confirmation_checks() # Actualizar los checkbuttons
         except Exception as e:
             messagebox.showerror("Error", f"Fallo al agregar confirmación: {e}")
 
+    def handle_add_improvement(self):
+        """Procesa y agrega una nueva mejora al catálogo."""
+        name = self.new_improv_name.get().strip()
+        desc = self.new_improv_desc.get().strip()
+
+        if not name or not desc:
+            messagebox.showerror("Error de entrada", "Nombre y Descripción son obligatorios.")
+            return
+
+        try:
+            if not self.catalog.add_improvement({"nombre": name, "descripcion": desc}):
+                messagebox.showwarning("Duplicado", f"La mejora '{name}' ya existe.")
+                return
+            messagebox.showinfo("Éxito", f"Mejora '{name}' agregada.")
+            self.new_improv_name.set("")
+            self.new_improv_desc.set("")
+        except Exception as e:
+            messagebox.showerror("Error", f"Fallo al agregar mejora: {e}")
+
     # --- PESTAÑA DE ANÁLISIS ---
 
     def setup_analysis_tab(self):
         """Configura el layout del dashboard de análisis con scrollbar."""
+        # Barra de filtros fija sobre el área con scroll
+        self.setup_filter_bar()
         
         # Configurar Scrollbar Vertical
         vscrollbar = ttk.Scrollbar(self.analysis_frame, orient=tk.VERTICAL)
@@ -354,6 +669,27 @@ class TradingAnalysisApp(tk.Tk):
         # NOTA: Los 3 gráficos se incrustarán aquí, ocupando más espacio horizontalmente.
         self.plot_frame = ttk.LabelFrame(self.dashboard_frame, text="Visualizaciones", padding="10")
         self.plot_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+        # La figura y su canvas se crean una sola vez; los refrescos actualizan los artistas
+        self.plot_canvas = None
+        self.plot_artists = {}
+        self.plot_signature = None
+        self.plot_empty_label = ttk.Label(self.plot_frame, text="No hay datos suficientes para generar gráficos.")
+
+        # Marco para las combinaciones de confirmaciones (fila 2, ocupa ambas columnas)
+        self.combination_frame = ttk.LabelFrame(self.dashboard_frame, text="Combinaciones de Confirmaciones", padding="10")
+        self.combination_frame.grid(row=2, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+        self.combination_summary = tk.StringVar(value="Sin datos de combinaciones.")
+        ttk.Label(self.combination_frame, textvariable=self.combination_summary).pack(anchor='w', pady=(0, 5))
+        columns = ("Combinación", "Trades", "Soporte", "Asertividad", "Ineficiencia", "Rent. Promedio")
+        self.combination_tree = ttk.Treeview(self.combination_frame, columns=columns, show='headings',
+                                             height=2 * COMBINATION_DISPLAY_ROWS)
+        for col in columns:
+            self.combination_tree.heading(col, text=col)
+            self.combination_tree.column(col, width=320 if col == "Combinación" else 100,
+                                         anchor='w' if col == "Combinación" else 'e')
+        self.combination_tree.tag_configure('mejor', foreground='green')
+        self.combination_tree.tag_configure('peor', foreground='red')
+        self.combination_tree.pack(fill='x')
 
         # Configuración de pesos para el frame interior (dashboard_frame)
         self.dashboard_frame.grid_columnconfigure(0, weight=1)
@@ -361,24 +697,436 @@ class TradingAnalysisApp(tk.Tk):
         # La fila 1 (gráficas) necesita peso para expandirse
         self.dashboard_frame.grid_rowconfigure(1, weight=1) 
 
+    def setup_filter_bar(self):
+        """Controles para filtrar el dashboard (activo, orden, entrada, mejora, fechas y confirmaciones)."""
+        self.filter_status = tk.StringVar(value="Sin filtros: todos los trades")
+        if 'trade_index' not in self.analyze:
+            return
+        bar = ttk.LabelFrame(self.analysis_frame, text="Filtros", padding="5")
+        bar.pack(fill='x', side=tk.TOP, padx=10, pady=(5, 0))
+
+        # Un menú de casillas por filtro de valores; se llenan con los datos (update_filter_options)
+        self.filter_menus = {}
+        for column, (key, label) in enumerate(FILTER_LABELS.items()):
+            button = ttk.Menubutton(bar, text=label)
+            menu = tk.Menu(button, tearoff=0)
+            button['menu'] = menu
+            button.grid(row=0, column=column, padx=3, pady=2, sticky='ew')
+            # vars: texto del menú -> BooleanVar; values: texto del menú -> valor en los datos
+            self.filter_menus[key] = {'button': button, 'menu': menu, 'vars': {}, 'values': {}}
+
+        dates = ttk.Frame(bar)
+        dates.grid(row=1, column=0, columnspan=4, sticky='w', pady=2)
+        self.filter_dates = {'desde': tk.StringVar(), 'hasta': tk.StringVar()}
+        ttk.Label(dates, text="Cierre desde (AAAA-MM-DD):").pack(side='left', padx=3)
+        ttk.Entry(dates, textvariable=self.filter_dates['desde'], width=17).pack(side='left')
+        ttk.Label(dates, text="hasta:").pack(side='left', padx=3)
+        ttk.Entry(dates, textvariable=self.filter_dates['hasta'], width=17).pack(side='left')
+
+        ttk.Button(bar, text="Aplicar Filtros", command=self.handle_apply_filters).grid(row=1, column=4, padx=3, sticky='ew')
+        ttk.Button(bar, text="Limpiar", command=self.handle_clear_filters).grid(row=1, column=5, padx=3, sticky='ew')
+        ttk.Label(bar, textvariable=self.filter_status).grid(row=2, column=0, columnspan=6, sticky='w', padx=3)
+
+    def update_filter_options(self, options: Dict[str, Any]):
+        """Rehace los menús de filtros con los valores actuales, conservando lo que estaba marcado."""
+        if not hasattr(self, 'filter_menus'):
+            return
+        options = dict(options, con=options['confirmaciones'], sin=options['confirmaciones'])
+        for key, control in self.filter_menus.items():
+            values = {str(value): value for value in options[key]}
+            if list(control['vars']) == list(values):
+                continue
+            checked = {label for label, var in control['vars'].items() if var.get()}
+            control['menu'].delete(0, 'end')
+            control['vars'], control['values'] = {}, values
+            for label in values:
+                var = tk.BooleanVar(value=label in checked)
+                control['vars'][label] = var
+                control['menu'].add_checkbutton(label=label, variable=var,
+                                                command=lambda k=key: self._update_filter_label(k))
+            self._update_filter_label(key)
+
+    def _update_filter_label(self, key: str):
+        """Muestra en el botón cuántos valores están marcados (p. ej. 'Activo (2)')."""
+        control = self.filter_menus[key]
+        count = sum(var.get() for var in control['vars'].values())
+        control['button'].config(text=f"{FILTER_LABELS[key]} ({count})" if count else FILTER_LABELS[key])
+
+    def handle_apply_filters(self):
+        """Lee los controles de filtro y vuelve a calcular el dashboard sobre el subconjunto."""
+        filters = {key: [control['values'][label] for label, var in control['vars'].items() if var.get()]
+                   for key, control in self.filter_menus.items()}
+        for key, var in self.filter_dates.items():
+            text = var.get().strip()
+            if not text:
+                continue
+            try:
+                value = datetime.fromisoformat(text)
+            except ValueError:
+                messagebox.showerror("Error de entrada", f"Fecha '{key}' inválida: use AAAA-MM-DD o AAAA-MM-DD HH:MM.")
+                return
+            # 'hasta' con solo la fecha incluye todo ese día
+            if key == 'hasta' and len(text) <= 10:
+                value = value.replace(hour=23, minute=59, second=59)
+            filters[key] = value
+        self.trade_filters = filters
+        self.refresh()
+
+    def handle_clear_filters(self):
+        """Quita todos los filtros y vuelve al dashboard del historial completo."""
+        for key, control in self.filter_menus.items():
+            for var in control['vars'].values():
+                var.set(False)
+            self._update_filter_label(key)
+        for var in self.filter_dates.values():
+            var.set("")
+        self.trade_filters = {}
+        self.refresh()
+
+    # --- PESTAÑA DE DIAGNÓSTICO ---
+
+    def toggle_diagnostics_tab(self, event=None):
+        """Muestra u oculta la pestaña de diagnóstico (F12)."""
+        if self.notebook.tab(self.diagnostics_frame, 'state') == 'hidden':
+            self.notebook.add(self.diagnostics_frame)
+            self.notebook.select(self.diagnostics_frame)
+            self.build_tab(str(self.diagnostics_frame))
+            self.update_stats_display()
+        else:
+            self.notebook.hide(self.diagnostics_frame)
+
+    def setup_diagnostics_tab(self):
+        """Tabla con las estadísticas de cada etapa del pipeline y acciones de exportación y perfil."""
+        actions = ttk.Frame(self.diagnostics_frame, padding=10)
+        actions.pack(fill='x')
+        ttk.Button(actions, text="Exportar JSON...", command=self.handle_export_stats).pack(side='left')
+        ttk.Button(actions, text="Perfilar Próximo Refresco...", command=self.handle_profile_refresh).pack(side='left', padx=5)
+        ttk.Button(actions, text="Reiniciar", command=self.handle_reset_stats).pack(side='left')
+        memory = "con memoria (tracemalloc)" if self.stats.trace_memory else "sin memoria (usar --memoria)"
+        ttk.Label(actions, text=f"Medición {memory}", foreground='gray').pack(side='right')
+
+        columns = ('etapa', 'llamadas', 'ultimo', 'promedio', 'maximo', 'total', 'memoria')
+        headings = ("Etapa", "Llamadas", "Último (ms)", "Promedio (ms)", "Máximo (ms)", "Total (s)", "Memoria Pico (MB)")
+        self.diagnostics_tree = ttk.Treeview(self.diagnostics_frame, columns=columns, show='headings')
+        for col, heading in zip(columns, headings):
+            self.diagnostics_tree.heading(col, text=heading)
+            self.diagnostics_tree.column(col, width=120, anchor='w' if col == 'etapa' else 'e')
+        self.diagnostics_tree.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+
+    def update_stats_display(self):
+        """Actualiza los tiempos de la barra de estado y, si está construida, la pestaña de diagnóstico."""
+        self.stats_var.set(self.stats.summary_line())
+        if not self.tab_is_built(self.diagnostics_frame):
+            return
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for name, stats in self.stats.to_dict()['etapas'].items():
+            memory = stats['memoria_pico_mb']
+            self.diagnostics_tree.insert('', 'end', values=(
+                name,
+                stats['llamadas'],
+                f"{stats['ultimo_s'] * 1000:.1f}",
+                f"{stats['promedio_s'] * 1000:.1f}",
+                f"{stats['max_s'] * 1000:.1f}",
+                f"{stats['total_s']:.3f}",
+                "N/A" if memory is None else f"{memory:.1f}",
+            ))
+
+    def handle_export_stats(self):
+        """Guarda las estadísticas del pipeline en un archivo JSON elegido por el usuario."""
+        path = filedialog.asksaveasfilename(title="Exportar diagnóstico", defaultextension=".json",
+                                            initialfile="diagnostico.json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            self.stats.export_json(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo exportar el diagnóstico: {e}")
+            return
+        self.status_var.set(f"Diagnóstico exportado a {path}")
+
+    def handle_profile_refresh(self):
+        """Pide la ruta del perfil y lanza un refresco capturado con cProfile."""
+        path = filedialog.asksaveasfilename(title="Guardar perfil", defaultextension=".prof",
+                                            initialfile="refresco.prof", filetypes=[("cProfile", "*.prof")])
+        if path:
+            self.profile_next_refresh(path)
+            self.refresh()
+
+    def profile_next_refresh(self, path: str):
+        """
+        Captura con cProfile el próximo refresco que termine (la parte en segundo
+        plano y la del hilo de Tk) y lo guarda en `path` (ver con `python -m pstats`).
+        """
+        self.profile_path = path
+
+    def _save_profile(self, profiler: 'cProfile.Profile'):
+        """Guarda el perfil de un refresco; los siguientes ya no se perfilan."""
+        path, self.profile_path = self.profile_path, None
+        if path is None:
+            return
+        try:
+            profiler.dump_stats(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo guardar el perfil: {e}")
+            return
+        self.status_var.set(f"Perfil del refresco guardado en {path}")
+
+    def handle_reset_stats(self):
+        """Descarta las estadísticas acumuladas."""
+        self.stats.reset()
+        self.update_stats_display()
+
+    # --- ACTUALIZACIÓN EN SEGUNDO PLANO ---
+
+    def refresh(self, reload: bool = False):
+        """
+        Lanza en segundo plano la actualización de datos y análisis.
+
+        Cada llamada reemplaza al refresco anterior: si todavía no empezó se
+        cancela, y si ya está corriendo se detiene en la siguiente etapa y su
+        resultado se descarta. Los trades pendientes se incluyen en el nuevo.
+        """
+        self.refresh_generation += 1
+        generation = self.refresh_generation
+        if self.refresh_future is not None:
+            self.refresh_future.cancel()
+        # Una recarga completa reemplazada sigue pendiente hasta que alguna termine
+        self.reload_pending = self.reload_pending or reload
+
+        self.set_busy("Cargando datos..." if self.reload_pending else "Actualizando análisis...")
+        self.stats.begin_refresh()
+        # Perfil opcional: el mismo cProfile se habilita en el hilo de análisis y luego en el de Tk
+        profiler = cProfile.Profile() if self.profile_path is not None else None
+        self.refresh_future = self.executor.submit(
+            self._refresh_job, generation, self.reload_pending,
+            self.df_trades, self.metrics_accumulator, self.equity_curve, self.trade_index,
+            dict(self.trade_filters), list(self.pending_trades), profiler
+        )
+        self.after(REFRESH_POLL_MS, self._poll_refresh, self.refresh_future, generation)
+
+    def _refresh_job(self, generation, reload, df_trades, metrics_accumulator, equity_curve, trade_index,
+                     filters, new_trades, profiler=None):
+        """
+        Trabajo del hilo de fondo: no toca widgets ni modifica el estado de la app,
+        solo retorna el nuevo estado y los resultados del análisis.
+        """
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = self._run_refresh_stages(generation, reload, df_trades, metrics_accumulator, equity_curve,
+                                              trade_index, filters, new_trades)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        result['profiler'] = profiler
+        return result
+
+    def _run_refresh_stages(self, generation, reload, df_trades, metrics_accumulator, equity_curve, trade_index,
+                            filters, new_trades):
+        """Etapas del refresco en segundo plano, cada una medida en self.stats."""
+        stage = self.stats.stage
+
+        def checkpoint():
+            if generation != self.refresh_generation:
+                raise RefreshCancelled()
+
+        result = {'reload': reload, 'applied_trades': len(new_trades)}
+        if reload:
+            if 'load_trades_frame' in self.loader:
+                # El backend arma el DataFrame preprocesado directamente (snapshot
+                # columnar, particiones o SQLite); los trades crudos no se cargan
+                # (solo se agregan los nuevos de esta sesión). Carga y
+                # preprocesamiento quedan en una sola etapa.
+                with stage('carga'):
+                    result['raw_data'] = {'trades': [], **self.catalog.reload()}
+                    checkpoint()
+                    df_trades = self.loader['load_trades_frame']()
+            else:
+                with stage('carga'):
+                    result['raw_data'] = self.catalog.replace(self.loader['load_all_data']())
+                checkpoint()
+                with stage('preprocesamiento'):
+                    df_trades = self.preprocess(result['raw_data']['trades'])
+            checkpoint()
+            accumulator_cls = self.analyze.get('metrics_accumulator')
+            with stage('metricas'):
+                metrics_accumulator = accumulator_cls(df_trades) if accumulator_cls is not None else None
+            checkpoint()
+            curve_cls = self.analyze.get('equity_curve')
+            with stage('curva_de_capital'):
+                equity_curve = curve_cls(df_trades) if curve_cls is not None else None
+            checkpoint()
+            index_cls = self.analyze.get('trade_index')
+            with stage('indice'):
+                trade_index = index_cls(df_trades) if index_cls is not None else None
+            checkpoint()
+            # La columna consolidada de confirmaciones se precalcula aquí, fuera del hilo de Tk
+            from trade_table import TradeTableModel
+            with stage('tabla'):
+                result['trade_table'] = TradeTableModel(df_trades)
+        elif new_trades:
+            previous_len = len(df_trades)
+            with stage('preprocesamiento'):
+                df_trades = self.extend_preprocessed(df_trades, new_trades)
+            checkpoint()
+            if metrics_accumulator is not None:
+                # Copia: un refresco descartado no debe alterar el acumulador vigente
+                with stage('metricas'):
+                    metrics_accumulator = copy.deepcopy(metrics_accumulator)
+                    metrics_accumulator.update(df_trades.iloc[previous_len:])
+            if equity_curve is not None:
+                # Copia superficial alcanza: extend reemplaza los arreglos, no los modifica
+                with stage('curva_de_capital'):
+                    equity_curve = copy.copy(equity_curve)
+                    equity_curve.extend(df_trades.iloc[previous_len:])
+            if trade_index is not None:
+                with stage('indice'):
+                    trade_index = copy.copy(trade_index)
+                    trade_index.extend(df_trades.iloc[previous_len:])
+        checkpoint()
+
+        # Con filtros activos el dashboard se calcula sobre el subconjunto; el
+        # acumulador y la curva incrementales siguen siendo los del historial completo.
+        from query import filters_active
+        df_view, view_curve = df_trades, equity_curve
+        if trade_index is not None and filters_active(filters):
+            with stage('filtros'):
+                df_view = trade_index.take(df_trades, filters)
+                curve_cls = self.analyze.get('equity_curve')
+                view_curve = curve_cls(df_view) if curve_cls is not None else None
+            result['filtered'] = (len(df_view), len(df_trades))
+        checkpoint()
+
+        with stage('metricas'):
+            if metrics_accumulator is not None and df_view is df_trades:
+                result['key_metrics'] = metrics_accumulator.metrics()
+            else:
+                result['key_metrics'] = self.analyze['calculate_key_metrics'](df_view)
+        checkpoint()
+        with stage('confirmaciones'):
+            result['conf_analysis'] = self.analyze['analyze_confirmations'](df_view)
+        if 'analyze_combinations' in self.analyze:
+            checkpoint()
+            with stage('combinaciones'):
+                result['combinations'] = self.analyze['analyze_combinations'](df_view)
+        with stage('histograma'):
+            result['histogram'] = pnl_histogram(df_view)
+        result['view_equity_curve'] = view_curve
+
+        preload_plotting()
+
+        result['df_trades'] = df_trades
+        result['metrics_accumulator'] = metrics_accumulator
+        result['equity_curve'] = equity_curve
+        result['trade_index'] = trade_index
+        return result
+
+    def _poll_refresh(self, future, generation):
+        """Revisa desde el hilo de Tk si terminó el refresco y aplica su resultado."""
+        if generation != self.refresh_generation:
+            return # Reemplazado: el refresco nuevo tiene su propio sondeo
+        if not future.done():
+            self.after(REFRESH_POLL_MS, self._poll_refresh, future, generation)
+            return
+
+        try:
+            result = future.result()
+        except RefreshCancelled:
+            return
+        except Exception as e:
+            self.set_idle("Error al actualizar los datos")
+            messagebox.showerror("Error", f"Fallo al actualizar el análisis: {e}")
+            return
+        self._apply_refresh(result)
+
+    def _apply_refresh(self, result: Dict[str, Any]):
+        """Aplica en el hilo de Tk el estado calculado en segundo plano y refresca la UI."""
+        profiler = result.get('profiler')
+        if profiler is None:
+            self._apply_refresh_state(result)
+            return
+        # El perfil del refresco sigue en el hilo de Tk (tablas, widgets y gráficos)
+        profiler.enable()
+        try:
+            self._apply_refresh_state(result)
+        finally:
+            profiler.disable()
+        self._save_profile(profiler)
+
+    def _apply_refresh_state(self, result: Dict[str, Any]):
+        """Parte de _apply_refresh que actualiza el estado y los widgets."""
+        self.df_trades = result['df_trades']
+        self.metrics_accumulator = result['metrics_accumulator']
+        self.equity_curve = result['equity_curve']
+        self.trade_index = result['trade_index']
+        # Los trades pendientes ya quedaron incluidos (en una recarga vienen del disco)
+        del self.pending_trades[:result['applied_trades']]
+
+        with self.stats.stage('presentacion'):
+            if result['reload']:
+                self.reload_pending = False
+                self.raw_data = result['raw_data']
+                self.trades_table = result['trade_table']
+                if self.tab_is_built(self.add_data_frame):
+                    self.update_confirmation_checks(self.raw_data['confirmations'])
+                    self.update_improvement_options(self.raw_data['improvements'])
+                self.rebuild_trades_tab()
+            elif hasattr(self, 'trades_tree'):
+                # Actualizar la tabla de trades en la pestaña 3 si ya fue inicializada
+                self.populate_trades_tree()
+            else:
+                self.rebuild_trades_tab()
+
+            if self.trade_index is not None:
+                self.update_filter_options(self.trade_index.options())
+        filtered = result.get('filtered')
+        self.filter_status.set(f"Mostrando {filtered[0]} de {filtered[1]} trades" if filtered else "Sin filtros: todos los trades")
+
+        self.set_busy("Dibujando gráficos...")
+        self.show_analysis(result['key_metrics'], result['conf_analysis'], result['histogram'], result.get('combinations'),
+                           result['view_equity_curve'])
+        self.set_idle(f"Listo ({filtered[0]} de {filtered[1]} trades)" if filtered else f"Listo ({len(self.df_trades)} trades)")
+        self.update_stats_display()
+        self._mark_interactive()
+
+    def set_busy(self, message: str):
+        """Muestra el estado de trabajo en curso en la barra de estado."""
+        self.status_var.set(message)
+        self.progress.start(10)
+
+    def set_idle(self, message: str = "Listo"):
+        """Detiene el indicador de trabajo y muestra un mensaje final."""
+        self.progress.stop()
+        self.status_var.set(message)
+
+    def destroy(self):
+        """Cancela el trabajo pendiente antes de cerrar la ventana."""
+        self.refresh_generation += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+
     def run_analysis(self):
-        """Ejecuta el análisis y actualiza la UI."""
-        
-        # 1. Obtener los resultados del análisis
-        key_metrics = self.analyze['calculate_key_metrics'](self.df_trades)
-        conf_analysis = self.analyze['analyze_confirmations'](self.df_trades)
-        
-        # 2. Mostrar Métricas Globales
-        self.display_metrics(key_metrics)
-        
-        # 3. Mostrar Análisis de Confirmaciones
-        self.display_confirmation_analysis(conf_analysis)
-        
-        # 4. Generar y mostrar las visualizaciones
-        self.plot_analysis(key_metrics, conf_analysis)
+        """Ejecuta el análisis sobre df_trades en segundo plano y actualiza la UI al terminar."""
+        self.refresh()
+
+    def show_analysis(self, key_metrics: Dict[str, Any], conf_analysis: Dict[str, Any], histogram=None,
+                      combinations: Dict[str, Any] = None, equity_curve=None):
+        """Muestra en el dashboard los resultados de un análisis ya calculado."""
+        with self.stats.stage('presentacion'):
+            # 1. Mostrar Métricas Globales
+            self.display_metrics(key_metrics, equity_curve.summary() if equity_curve is not None else None)
+
+            # 2. Mostrar Análisis de Confirmaciones
+            self.display_confirmation_analysis(conf_analysis)
+            if combinations is not None:
+                self.display_combination_analysis(combinations)
 
-    def display_metrics(self, metrics: Dict[str, Any]):
-        """Actualiza la sección de métricas globales."""
+        # 3. Generar y mostrar las visualizaciones
+        with self.stats.stage('graficos'):
+            self.plot_analysis(key_metrics, conf_analysis, histogram, equity_curve)
+
+    def display_metrics(self, metrics: Dict[str, Any], equity: Dict[str, Any] = None):
+        """Actualiza la sección de métricas globales (y las de la curva de capital, si se reciben)."""
         # Limpiar frame
         for widget in self.metrics_frame.winfo_children():
             widget.destroy()
@@ -400,6 +1148,26 @@ class TradingAnalysisApp(tk.Tk):
         
         ttk.Label(self.metrics_frame, text="Mejora Más Repetitiva:").grid(row=4, column=0, sticky='w')
         ttk.Label(self.metrics_frame, text=metrics.get('mejora_mas_repetitiva', 'N/A')).grid(row=4, column=1, sticky='e')
+
+        if equity is None:
+            return
+        # Curva de capital: acumulado, drawdown máximo y últimas ventanas móviles
+        ttk.Label(self.metrics_frame, text="Rentabilidad Acumulada:").grid(row=5, column=0, sticky='w')
+        ttk.Label(self.metrics_frame, text=f"{equity['rentabilidad_acumulada']:.2f}").grid(row=5, column=1, sticky='e')
+
+        ttk.Label(self.metrics_frame, text="Drawdown Máximo:").grid(row=6, column=0, sticky='w')
+        ttk.Label(self.metrics_frame, foreground='red', text=(
+            f"{equity['drawdown_maximo']:.2f} ({equity['duracion_drawdown_trades']} trades, "
+            f"{equity['duracion_drawdown_dias']} días)"
+        )).grid(row=6, column=1, sticky='e')
+
+        row = 7
+        for window, stats in equity['ventanas'].items():
+            ttk.Label(self.metrics_frame, text=f"Últimos {window} Trades:").grid(row=row, column=0, sticky='w')
+            text = ("N/A" if stats['tasa_de_exito'] is None else
+                    f"Éxito {stats['tasa_de_exito'] * 100:.2f}% / Promedio {stats['rentabilidad_promedio']:.2f}")
+            ttk.Label(self.metrics_frame, text=text).grid(row=row, column=1, sticky='e')
+            row += 1
         
     def display_confirmation_analysis(self, conf_analysis: Dict[str, Any]):
         """Actualiza la sección de análisis de confirmaciones."""
@@ -411,7 +1179,7 @@ class TradingAnalysisApp(tk.Tk):
         row = 1
         for name, data in conf_analysis['top_3_confirmaciones_rentables']:
             ttk.Label(self.conf_analysis_frame, text=f"{name}:").grid(row=row, column=0, sticky='w', padx=5)
-            ttk.Label(self.conf_analysis_frame, text=f"Promedio: {data['rentabilidad_promedio']:.2f} (Éxito: {data['asertividad']}%)", foreground='green').grid(row=row, column=1, sticky='e', padx=5)
+            ttk.Label(self.conf_analysis_frame, text=f"Promedio: {data['rentabilidad_promedio']:.2f}{format_interval(data, 'rentabilidad_ic')} (Éxito: {data['asertividad']}%{format_interval(data, 'asertividad_ic', '%')}{format_p_value(data)})", foreground='green').grid(row=row, column=1, sticky='e', padx=5)
             row += 1
 
         ttk.Label(self.conf_analysis_frame, text="Bottom 3 Confirmaciones Más Ineficientes:", font=('Arial', 10, 'bold')).grid(row=row, column=0, columnspan=2, sticky='w', pady=(10, 5))
@@ -419,55 +1187,238 @@ class TradingAnalysisApp(tk.Tk):
         
         for name, data in conf_analysis['bottom_3_confirmaciones_ineficientes']:
             ttk.Label(self.conf_analysis_frame, text=f"{name}:").grid(row=row, column=0, sticky='w', padx=5)
-            ttk.Label(self.conf_analysis_frame, text=f"Promedio: {data['rentabilidad_promedio']:.2f} (Fallo: {data['ineficiencia']}%)", foreground='red').grid(row=row, column=1, sticky='e', padx=5)
+            ttk.Label(self.conf_analysis_frame, text=f"Promedio: {data['rentabilidad_promedio']:.2f}{format_interval(data, 'rentabilidad_ic')} (Fallo: {data['ineficiencia']}%{format_p_value(data)})", foreground='red').grid(row=row, column=1, sticky='e', padx=5)
             row += 1
 
-    def plot_analysis(self, key_metrics, conf_analysis):
-        """Genera y muestra las visualizaciones."""
-        # Limpiar frame de plots
-        for widget in self.plot_frame.winfo_children():
-            widget.destroy()
+    def display_combination_analysis(self, combinations: Dict[str, Any]):
+        """Actualiza la sección de combinaciones de confirmaciones (las mejores y las peores)."""
+        records = combinations['combinaciones']
+        self.combination_summary.set(
+            f"{len(records)} combinaciones frecuentes de hasta {combinations['tamano_maximo']} confirmaciones "
+            f"(soporte mínimo: {combinations['soporte_minimo']} trades)"
+        )
+        self.combination_tree.delete(*self.combination_tree.get_children())
+
+        best = records[:COMBINATION_DISPLAY_ROWS]
+        worst = records[max(len(best), len(records) - COMBINATION_DISPLAY_ROWS):]
+        for tag, group in (('mejor', best), ('peor', worst)):
+            for record in group:
+                self.combination_tree.insert('', 'end', tags=(tag,), values=(
+                    " + ".join(record['confirmaciones']),
+                    record['total'],
+                    f"{record['soporte'] * 100:.1f}%",
+                    f"{record['asertividad']}%",
+                    f"{record['ineficiencia']}%",
+                    f"{record['rentabilidad_promedio']:.2f}",
+                ))
 
+    def plot_analysis(self, key_metrics, conf_analysis, histogram=None, equity_curve=None):
+        """
+        Actualiza las visualizaciones sobre una figura persistente.
+
+        La figura, los ejes y el canvas se crean una sola vez; en cada refresco se
+        actualizan las barras y líneas existentes y solo se redibuja (draw_idle) si
+        los datos cambiaron. Los ejes de barras se rehacen solo si cambian sus categorías.
+        """
         if self.df_trades.empty:
-             ttk.Label(self.plot_frame, text="No hay datos suficientes para generar gráficos.").pack(pady=20)
-             return
+            if self.plot_canvas is not None:
+                self.plot_canvas.get_tk_widget().pack_forget()
+            self.plot_empty_label.pack(pady=20)
+            self.plot_signature = None
+            return
+        self.plot_empty_label.pack_forget()
+
+        if histogram is None:
+            histogram = pnl_histogram(self.df_trades)
+        entry_records = key_metrics.get('rendimiento_por_tipo_entrada', [])
+        asset_records = key_metrics.get('rendimiento_por_activo', [])
+        entry_data = ([r['tipo entrada'] for r in entry_records], [r['mean'] for r in entry_records])
+        asset_data = ([r['activo'] for r in asset_records], [r['mean'] for r in asset_records])
+
+        # Solo los datos que cambiaron justifican un redibujado
+        equity_data = (len(equity_curve), equity_curve.max_drawdown,
+                       float(equity_curve.equity[-1]) if len(equity_curve) else 0.0) if equity_curve is not None else None
+        signature = (histogram[0].tolist(), histogram[1].tolist(), entry_data, asset_data, equity_data)
+        if signature == self.plot_signature and self.plot_canvas is not None:
+            return
+        self.plot_signature = signature
+
+        if self.plot_canvas is None:
+            self._create_plot_canvas()
+        self.plot_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        layout_changed = self._update_histogram(*histogram)
+        layout_changed |= self._update_bar_axes(
+            'tipo entrada', *entry_data,
+            title='Rentabilidad Promedio por Tipo de Entrada', empty_text='No hay datos por Tipo de Entrada'
+        )
+        layout_changed |= self._update_bar_axes(
+            'activo', *asset_data,
+            title='Rentabilidad Promedio por Activo', empty_text='No hay datos por Activo'
+        )
+        if equity_curve is not None:
+            layout_changed |= self._update_equity_axes(equity_curve)
+
+        if layout_changed:
+            self.plot_figure.tight_layout() # Ajuste automático para evitar solapamiento
+        self.plot_canvas.draw_idle()
+
+    def _create_plot_canvas(self):
+        """Crea la figura con los 4 subplots y la incrusta en Tkinter (una sola vez)."""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        # Figura principal: 3 subplots en la primera fila y la curva de capital debajo, a lo ancho
+        self.plot_figure = Figure(figsize=(15, 10), dpi=100) # Se aumenta el ancho para los 3 gráficos
+        grid = self.plot_figure.add_gridspec(2, 3)
 
-        # Figura principal con 3 subplots en una fila
-        fig = plt.Figure(figsize=(15, 6), dpi=100) # Se aumenta el ancho para los 3 gráficos
-        
         # --- Gráfico 1: Distribución de Ganancia/Pérdida (Histograma) ---
-        ax1 = fig.add_subplot(131)
-        self.df_trades['ganancia/perdida'].plot(kind='hist', bins=20, ax=ax1, color='skyblue', edgecolor='black')
+        ax1 = self.plot_figure.add_subplot(grid[0, 0])
         ax1.set_title('Distribución de Ganancia/Pérdida')
         ax1.set_xlabel('Valor (€/$)')
+        ax1.set_ylabel('Frequency')
         ax1.axvline(0, color='gray', linestyle='--') # Línea en cero
 
-        # --- Gráfico 2: Rendimiento por Tipo de Entrada (Barras) ---
-        ax2 = fig.add_subplot(132)
-        rend_data_entrada = pd.DataFrame(key_metrics['rendimiento_por_tipo_entrada'])
-        if not rend_data_entrada.empty:
-            rend_data_entrada.set_index('tipo entrada')['mean'].plot(kind='bar', ax=ax2, color=['green' if x > 0 else 'red' for x in rend_data_entrada['mean']])
-            ax2.set_title('Rentabilidad Promedio por Tipo de Entrada')
-            ax2.set_ylabel('Rendimiento Promedio')
-            ax2.tick_params(axis='x', rotation=45)
+        # --- Gráficos 2 y 3: Rendimiento por Tipo de Entrada y por Activo (Barras) ---
+        self.plot_artists = {
+            'histograma': {'ax': ax1, 'bars': None},
+            'tipo entrada': {'ax': self.plot_figure.add_subplot(grid[0, 1]), 'bars': None, 'labels': None},
+            'activo': {'ax': self.plot_figure.add_subplot(grid[0, 2]), 'bars': None, 'labels': None},
+            # --- Gráfico 4: Curva de Capital con Drawdown y Tasa de Éxito Móvil ---
+            'capital': {'ax': self.plot_figure.add_subplot(grid[1, :]), 'line': None, 'fill': None, 'rate': None},
+        }
+
+        # Incrustar el gráfico en Tkinter
+        self.plot_canvas = FigureCanvasTkAgg(self.plot_figure, master=self.plot_frame)
+        # El renderizado real ocurre después, cuando Tk ejecuta el draw_idle: se mide como 'dibujo'
+        draw = self.plot_canvas.draw
+        def timed_draw(*args, **kwargs):
+            with self.stats.stage('dibujo'):
+                drawn = draw(*args, **kwargs)
+            self.update_stats_display()
+            return drawn
+        self.plot_canvas.draw = timed_draw
+
+    def _update_histogram(self, counts: 'np.ndarray', edges: 'np.ndarray') -> bool:
+        """Actualiza las barras del histograma en su lugar. Retorna True si se crearon."""
+        import numpy as np
+        artists = self.plot_artists['histograma']
+        ax = artists['ax']
+        created = artists['bars'] is None
+        if created:
+            artists['bars'] = ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+                                     color='skyblue', edgecolor='black')
         else:
-            ax2.text(0.5, 0.5, 'No hay datos por Tipo de Entrada', transform=ax2.transAxes, ha='center')
-
-        # --- Gráfico 3: Rendimiento por Activo (Barras) ---
-        ax3 = fig.add_subplot(133)
-        rend_data_activo = pd.DataFrame(key_metrics['rendimiento_por_activo'])
-        if not rend_data_activo.empty:
-            rend_data_activo.set_index('activo')['mean'].plot(kind='bar', ax=ax3, color=['green' if x > 0 else 'red' for x in rend_data_activo['mean']])
-            ax3.set_title('Rentabilidad Promedio por Activo')
-            ax3.set_ylabel('Rendimiento Promedio')
-            ax3.tick_params(axis='x', rotation=45)
+            for rect, left, width, count in zip(artists['bars'], edges[:-1], np.diff(edges), counts):
+                rect.set_x(left)
+                rect.set_width(width)
+                rect.set_height(count)
+        ax.relim()
+        ax.autoscale_view()
+        return created
+
+    def _update_equity_axes(self, equity_curve) -> bool:
+        """
+        Actualiza la curva de capital (línea), su drawdown (área) y la tasa de éxito
+        móvil de la ventana más larga (eje derecho). Retorna True si se crearon las líneas.
+        """
+        import numpy as np
+        artists = self.plot_artists['capital']
+        ax = artists['ax']
+        n = len(equity_curve)
+        # Submuestreo: con historiales grandes se dibuja uno de cada `step` trades (y siempre el último)
+        step = max(1, -(-n // EQUITY_PLOT_POINTS))
+        index = np.unique(np.append(np.arange(0, n, step), n - 1)) if n else np.empty(0, dtype=np.int64)
+        positions = index + 1
+        equity = equity_curve.equity[index]
+        drawdown = equity_curve.drawdown()[index]
+        window = max(equity_curve.windows) if equity_curve.windows else None
+        win_rate = equity_curve.rolling(window)[0][index] * 100 if window else None
+
+        created = artists['line'] is None
+        if created:
+            artists['line'], = ax.plot(positions, equity, color='steelblue', label='Capital acumulado')
+            ax.axhline(0, color='gray', linestyle='--')
+            ax.set_title('Curva de Capital y Drawdown')
+            ax.set_xlabel('Trade (orden de cierre)')
+            ax.set_ylabel('Capital acumulado')
+            if window:
+                rate_ax = ax.twinx()
+                artists['rate'], = rate_ax.plot(positions, win_rate, color='gray', linewidth=0.8,
+                                                label=f'Éxito móvil ({window} trades)')
+                rate_ax.set_ylim(0, 100)
+                rate_ax.set_ylabel('Tasa de éxito (%)')
         else:
-            ax3.text(0.5, 0.5, 'No hay datos por Activo', transform=ax3.transAxes, ha='center')
+            artists['line'].set_data(positions, equity)
+            if artists['rate'] is not None:
+                artists['rate'].set_data(positions, win_rate)
 
-        fig.tight_layout() # Ajuste automático para evitar solapamiento
+        # El área del drawdown se rehace (fill_between no admite actualizar sus datos)
+        if artists['fill'] is not None:
+            artists['fill'].remove()
+        artists['fill'] = ax.fill_between(positions, equity - drawdown, equity, color='red', alpha=0.3, label='Drawdown')
+        if created:
+            ax.legend(loc='upper left')
+        ax.relim()
+        ax.autoscale_view()
+        return created
 
-        # Incrustar el gráfico en Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.plot_frame)
-        canvas_widget = canvas.get_tk_widget()
-        canvas_widget.pack(fill=tk.BOTH, expand=True)
-        canvas.draw()
\ No newline at end of file
+    def _update_bar_axes(self, key: str, labels, values, title: str, empty_text: str) -> bool:
+        """
+        Actualiza un gráfico de barras de rendimiento promedio. Si las categorías no
+        cambiaron solo se ajustan alturas y colores; si no, se rehacen sus barras.
+        Retorna True si cambió la estructura del gráfico.
+        """
+        artists = self.plot_artists[key]
+        ax = artists['ax']
+        colors = ['green' if x > 0 else 'red' for x in values]
+
+        if artists['bars'] is not None and artists['labels'] == labels:
+            for rect, value, color in zip(artists['bars'], values, colors):
+                rect.set_height(value)
+                rect.set_color(color)
+            ax.relim()
+            ax.autoscale_view()
+            return False
+
+        ax.clear()
+        artists['labels'] = labels
+        if labels:
+            positions = range(len(labels))
+            artists['bars'] = ax.bar(positions, values, width=0.5, color=colors)
+            ax.set_xticks(positions)
+            ax.set_xticklabels([str(label) for label in labels], rotation=45)
+            ax.set_xlabel(key)
+            ax.set_title(title)
+            ax.set_ylabel('Rendimiento Promedio')
+        else:
+            artists['bars'] = None
+            ax.text(0.5, 0.5, empty_text, transform=ax.transAxes, ha='center')
+        return True
+
+
+def format_interval(stats: Dict[str, Any], key: str, unit: str = "") -> str:
+    """Intervalo de confianza ' [min, max]' de una confirmación, o vacío si no se calculó."""
+    interval = stats.get(key)
+    if interval is None:
+        return ""
+    return f" [{interval[0]:.2f}{unit}, {interval[1]:.2f}{unit}]"
+
+def format_p_value(stats: Dict[str, Any]) -> str:
+    """P-valor ', p=...' de la prueba de permutaciones, o vacío si no se calculó."""
+    p_value = stats.get('p_valor')
+    return "" if p_value is None else f", p={p_value:.3f}"
+
+def preload_plotting():
+    """Importa los módulos de gráficos fuera del hilo de Tk (no crea figuras ni widgets)."""
+    for module_name in PLOTTING_MODULES:
+        importlib.import_module(module_name)
+
+def pnl_histogram(df_trades: 'pd.DataFrame', bins: int = HISTOGRAM_BINS):
+    """Conteos y bordes del histograma de ganancia/pérdida, calculados con NumPy."""
+    import numpy as np
+    pnl = df_trades['ganancia/perdida'].to_numpy(dtype=float) if 'ganancia/perdida' in df_trades else np.empty(0)
+    pnl = pnl[np.isfinite(pnl)]
+    if len(pnl) == 0:
+        return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+    return np.histogram(pnl, bins=bins)